@@ -1,26 +1,120 @@
 # admin_console.py
+import argparse
+import errno
 import os
 import json
-import shutil
-from server_admin import DriverDeploymentServer
+import sys
+from server_admin import create_server
+from client_feed import ADDED, REMOVED
+from job_queue import FINAL_STATES
+import queue
 import threading
 import time
+from functools import partial
 
-#for tkinter
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
-from CTkListbox import * # for List
+# Модули GUI загружаются только при запуске графической консоли (load_gui):
+# пакетный режим и текстовое меню работают на серверах без дисплея
+ctk = filedialog = messagebox = CTkListbox = pywinstyles = None
+
+
+def load_gui():
+    """Импортирует customtkinter, CTkListbox и pywinstyles"""
+    global ctk, filedialog, messagebox, CTkListbox, pywinstyles
+    if ctk is not None:
+        return
+    import customtkinter
+    import pywinstyles as dnd_styles
+    from tkinter import filedialog as tk_filedialog, messagebox as tk_messagebox
+    from CTkListbox import CTkListbox as listbox
+    ctk, filedialog, messagebox, CTkListbox, pywinstyles = (customtkinter, tk_filedialog, tk_messagebox,
+                                                            listbox, dnd_styles)
+
+# Как часто цикл Tk забирает события развертывания и сколько применяет за кадр
+UI_REFRESH_MS = 50
+UI_MAX_EVENTS_PER_FRAME = 2000
+
+
+class ResultsLog:
+    """Журнал результатов с виртуальной прокруткой.
+
+    Строки хранятся в списке, а в текстовом поле лежат только видимые,
+    поэтому десятки тысяч строк не замедляют виджет. Пока журнал
+    прокручен до конца, он следует за новыми строками.
+    """
+
+    def __init__(self, master, visible_lines=8, **kwargs):
+        self.frame = ctk.CTkFrame(master, fg_color="transparent")
+        self.textbox = ctk.CTkTextbox(self.frame, wrap="none", activate_scrollbars=False, **kwargs)
+        self.scrollbar = ctk.CTkScrollbar(self.frame, command=self._on_scroll)
+        self.textbox.pack(side="left", fill="both", expand=True)
+        self.scrollbar.pack(side="right", fill="y")
+        self.textbox.bind("<MouseWheel>", self._on_wheel)
+        self.textbox.bind("<Button-4>", self._on_wheel)
+        self.textbox.bind("<Button-5>", self._on_wheel)
+        self.visible_lines = visible_lines
+        self.lines = []
+        self.offset = 0
+        self.follow = True
+        self._dirty = False
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def append(self, line):
+        self.lines.append(line)
+        self._dirty = True
+
+    def _on_scroll(self, action, amount, unit=None):
+        if action == 'moveto':
+            self.offset = int(float(amount) * len(self.lines))
+        else:
+            self.offset += int(amount) * (self.visible_lines if unit == 'pages' else 1)
+        last = max(0, len(self.lines) - self.visible_lines)
+        self.offset = min(max(self.offset, 0), last)
+        self.follow = self.offset >= last
+        self._dirty = True
+        self.render()
+
+    def _on_wheel(self, event):
+        step = -3 if event.num == 4 or event.delta > 0 else 3
+        self._on_scroll('scroll', step, 'units')
+        return "break"
+
+    def render(self):
+        """Перерисовывает видимое окно строк, если что-то изменилось"""
+        if not self._dirty:
+            return
+        self._dirty = False
+        if self.follow:
+            self.offset = max(0, len(self.lines) - self.visible_lines)
+        window = self.lines[self.offset:self.offset + self.visible_lines]
+        self.textbox.configure(state="normal")
+        self.textbox.delete("1.0", "end")
+        self.textbox.insert("1.0", "\n".join(window))
+        self.textbox.configure(state="disabled")
+        if self.lines:
+            self.scrollbar.set(self.offset / len(self.lines),
+                               min(1.0, (self.offset + self.visible_lines) / len(self.lines)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
 
-import pywinstyles
-from functools import partial
 
 class AdminConsole:
     def __init__(self):
-        self.server = DriverDeploymentServer()
+        self.server = create_server()
         self.server_thread = None
         self.selected_clients = None
         self.selected_drivers = None
         self.selected_id = []
+        self.app = None
+        # Копия реестра клиентов, которую консоль ведет по ленте изменений сервера
+        self.clients = {}
+        self.client_ids_by_label = {}
+        self.client_ids_by_ip = {}
+        self.client_version = 0
+        self.client_events = queue.SimpleQueue()
+        # Итоги фоновой загрузки драйверов, которые забирает цикл Tk
+        self.ingest_results = queue.SimpleQueue()
 
     def init_tkinter(self):
         ctk.set_appearance_mode("System")
@@ -31,7 +125,7 @@ class AdminConsole:
         app.resizable(False, False)
         return app
 
-    def start_server_background(self):
+    def start_server_background(self, settle=1.0):
         """Запускает сервер в фоновом режиме"""
         def run_server():
             self.server.start_server()
@@ -39,7 +133,7 @@ class AdminConsole:
         self.server_thread = threading.Thread(target=run_server)
         self.server_thread.daemon = True
         self.server_thread.start()
-        time.sleep(1)  # Даем серверу время на запуск
+        time.sleep(settle)  # Даем серверу время на запуск
     
     def show_menu(self):
         print("\n" + "="*50)
@@ -63,17 +157,27 @@ class AdminConsole:
             print(f"   - {client_id}: {os_name} ({client_info['address']})")
     
     def upload_driver(self, pPath, pList):
-        """Только администратор загружает драйверы"""
-        driver_paths = pPath
-        for pPath in driver_paths:
-            if os.path.exists(pPath):
-                # Копируем в центральное хранилище
-                target_path = os.path.join(self.server.drivers_dir, os.path.basename(pPath))
-                shutil.copy2(pPath, target_path)
-                print(f"✅ Драйвер загружен: {os.path.basename(pPath)}")
-                self.update_drivers_list(pList)
-            else:
-                print("❌ Файл не найден")
+        """Только администратор загружает драйверы.
+
+        Файлы уходят в фоновый конвейер загрузки сервера; список драйверов
+        обновляется один раз, когда весь пакет будет в хранилище.
+        """
+        on_done = self.ingest_results.put if pList is not None else None
+        self.server.ingest.submit(pPath, on_done)
+        print(f"📥 Загрузка драйверов в хранилище: {len(pPath)}")
+
+    def drain_ingest_results(self, pList):
+        """Обновляет список драйверов после загрузки пакета (в потоке Tk)"""
+        loaded = False
+        while True:
+            try:
+                self.ingest_results.get_nowait()
+            except queue.Empty:
+                break
+            loaded = True
+        if loaded:
+            self.update_drivers_list(pList)
+        self.app.after(UI_REFRESH_MS, self.drain_ingest_results, pList)
     
     def create_test_drivers(self):
         """Создает тестовые драйверы"""
@@ -88,6 +192,7 @@ class AdminConsole:
             path = os.path.join(self.server.drivers_dir, driver["name"])
             with open(path, 'w') as f:
                 f.write(driver["content"])
+        self.server.catalog.refresh()
         
         print("✅ Тестовые драйверы созданы:")
         for driver in test_drivers:
@@ -117,14 +222,18 @@ class AdminConsole:
             if 0 <= choice < len(drivers):
                 driver_name = drivers[choice]['name']
                 print(f"🔄 Развертывание {driver_name} на всех клиентах...")
-                results = self.server.mass_deploy(driver_name)
-                
                 print("\n📊 Результаты развертывания:")
-                for client, result in results.items():
+                
+                def print_result(client, result):
                     status_icon = "✅" if result['status'] == 'success' else "❌"
                     if result['status'] == 'skipped':
                         status_icon = "⚠️"
                     print(f"   {status_icon} {client}: {result['status']} - {result.get('message', '')}")
+                
+                # Результаты печатаются по мере завершения на каждом клиенте
+                results = self.server.mass_deploy(driver_name, on_result=print_result)
+                succeeded = sum(1 for result in results.values() if result['status'] == 'success')
+                print(f"📊 Успешно: {succeeded}/{len(results)}")
             else:
                 print("❌ Неверный выбор")
         except ValueError:
@@ -174,13 +283,82 @@ class AdminConsole:
         except ValueError:
             print("❌ Введите число")
     
+    def show_deployment_history(self, limit=20):
+        """Показывает последние развертывания и итоги за неделю"""
+        entries = self.server.get_history(limit=limit)
+        print(f"\n📜 Последние развертывания: {len(entries)}")
+        for entry in entries:
+            status_icon = {"success": "✅", "skipped": "⚠️"}.get(entry.status, "❌")
+            when = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry.ts))
+            print(f"   {status_icon} {when} {entry.client_name}: {entry.driver_name} - {entry.status}"
+                  f"{' - ' + entry.message if entry.message else ''}")
+        counts = self.server.history.counts(since=time.time() - 7 * 24 * 3600)
+        print(f"📊 За неделю: " + ", ".join(f"{status} {count}" for status, count in sorted(counts.items())))
+    
+    @staticmethod
+    def client_label(client_id, client_info):
+        """Подпись клиента в списке консоли (уникальна по client_id)"""
+        return f"{client_id}: {client_info['address'][0]}"
+
     def update_client_list(self, pList):
-        pList.delete("all")
-        clients = self.server.get_connected_clients_info()
+        """Догоняет реестр сервера по ленте изменений с известной версии"""
+        self.apply_client_changes(pList, self.server.get_client_changes(self.client_version))
 
-        for client_id, client_info in clients.items():
-            system_ip = client_info.get('address')
-            pList.insert(client_id, system_ip)
+    def apply_client_changes(self, pList, changes):
+        """Применяет к списку клиентов дельты или, если отстали, снимок реестра"""
+        if 'snapshot' in changes:
+            pList.delete("all")
+            self.clients.clear()
+            self.client_ids_by_label.clear()
+            self.client_ids_by_ip.clear()
+            for client_id, client_info in changes['snapshot'].items():
+                self._apply_client_event(pList, ADDED, client_id, client_info)
+            self.client_version = changes['version']
+        else:
+            for event in changes['events']:
+                if event.version > self.client_version:
+                    self._apply_client_event(pList, event.kind, event.client_id, event.info)
+                    self.client_version = event.version
+        pList.update_idletasks()
+
+    def _apply_client_event(self, pList, kind, client_id, client_info):
+        old_info = self.clients.pop(client_id, None)
+        new_ip = client_info['address'][0] if kind != REMOVED else None
+        if old_info is not None:
+            self.client_ids_by_label.pop(self.client_label(client_id, old_info), None)
+            old_ip = old_info['address'][0]
+            ids = self.client_ids_by_ip.get(old_ip)
+            if ids is not None and old_ip != new_ip:
+                ids.pop(client_id, None)
+                if not ids:
+                    del self.client_ids_by_ip[old_ip]
+        if kind == REMOVED:
+            if old_info is not None:
+                pList.delete(client_id)
+            return
+        self.clients[client_id] = client_info
+        label = self.client_label(client_id, client_info)
+        self.client_ids_by_label[label] = client_id
+        # Клиенты адреса в порядке регистрации: обновление сведений место в нем не меняет
+        self.client_ids_by_ip.setdefault(new_ip, {})[client_id] = None
+        if old_info is None or self.client_label(client_id, old_info) != label:
+            pList.insert(client_id, label, update=False)
+
+    def drain_client_events(self, pList):
+        """Применяет события ленты, пришедшие от сервера, и планирует следующий проход"""
+        events = []
+        while True:
+            try:
+                events.append(self.client_events.get_nowait())
+            except queue.Empty:
+                break
+        if events:
+            if events[0].version > self.client_version + 1:
+                # Часть событий пропущена (подписка позже изменений) — догоняем по ленте
+                self.update_client_list(pList)
+            else:
+                self.apply_client_changes(pList, {'events': events})
+        self.app.after(UI_REFRESH_MS, self.drain_client_events, pList)
 
     def update_drivers_list(self, pList):
         drivers = self.server.get_driver_list()
@@ -189,17 +367,18 @@ class AdminConsole:
         # for i, driver in enumerate(drivers, 1):
         #     print(f"   {i}. {driver['name']} ({driver['size']} байт)")
 
+        pList.delete("all")
         for i, driver in enumerate(drivers, 1):
-            pList.insert(i, f"{driver['name']} {driver['size']} байт")
+            pList.insert(i, driver['label'])
 
     def get_client_id_by_ip(self, ip_address: str) -> str | None:
-        """Возвращает client_id по IP-адресу клиента"""
-        with self.server.clients_lock:
-            for client_id, client_info in self.server.connected_clients.items():
-                client_ip = client_info['address'][0]  # адрес вида (ip, port)
-                if client_ip == ip_address:
-                    return client_id
-        return None
+        """Возвращает client_id по IP-адресу клиента (по индексу консоли).
+
+        С одного адреса может быть несколько подключений (переподключение
+        до выселения старого) — берется последнее зарегистрированное.
+        """
+        ids = self.client_ids_by_ip.get(ip_address)
+        return next(reversed(ids)) if ids else None
 
     def show_value(self, selected_option):
         print(selected_option)
@@ -215,15 +394,9 @@ class AdminConsole:
             messagebox.showwarning("Предупреждение", "Выберите клиентов и драйверы для установки")
             return
             
-        self.selected_id = []
-        clients = self.server.get_connected_clients_info()
-
-        # Собираем ID выбранных клиентов
-        for client_id, client_info in clients.items():
-            system_ip = client_info.get('address')
-            for client_ip in self.selected_clients:
-                if client_ip == system_ip:
-                    self.selected_id.append(client_id)
+        # Собираем ID выбранных клиентов по индексу подписей
+        self.selected_id = [self.client_ids_by_label[label] for label in self.selected_clients
+                            if label in self.client_ids_by_label]
         
         if not self.selected_id:
             messagebox.showwarning("Предупреждение", "Выбранные клиенты не найдены или отключились")
@@ -232,10 +405,10 @@ class AdminConsole:
         print(f"🎯 Установка драйверов на клиентов: {self.selected_id}")
         
         # Создаем диалог прогресса
-        progress_window = ctk.CTkToplevel()
+        progress_window = ctk.CTkToplevel(self.app)
         progress_window.title("Установка драйверов")
-        progress_window.geometry("400x200")
-        progress_window.transient(self.init_tkinter())
+        progress_window.geometry("420x320")
+        progress_window.transient(self.app)
         progress_window.grab_set()
         
         progress_label = ctk.CTkLabel(progress_window, text="Начинаю установку драйверов...", font=("Arial", 14))
@@ -245,62 +418,167 @@ class AdminConsole:
         progress_bar.pack(pady=10)
         progress_bar.set(0)
         
-        results_text = ctk.CTkTextbox(progress_window, width=350, height=100)
-        results_text.pack(pady=10, padx=20, fill="both", expand=True)
+        results_log = ResultsLog(progress_window, width=350, height=140)
+        results_log.pack(pady=10, padx=20, fill="both", expand=True)
+        
+        # Рабочие потоки только кладут события в очередь; виджеты меняет цикл Tk
+        events = queue.SimpleQueue()
+        
+        def on_job(job, state, result):
+            events.put(('job', job, state, result))
         
-        # Запускаем установку в отдельном потоке
+        # Задания ставятся в постоянную очередь сервера, их выполняют рабочие диспетчера
         def run_deployment():
-            total_operations = len(self.selected_id) * len(self.selected_drivers)
-            completed_operations = 0
-            
-            for client_id in self.selected_id:
-                client_socket = self.server.get_client_socket(client_id)
-                if not client_socket:
-                    results_text.insert("end", f"❌ Клиент {client_id} отключился\n")
-                    results_text.see("end")
-                    completed_operations += len(self.selected_drivers)
-                    continue
-                    
-                for driver_name in self.selected_drivers:
-                    try:
-                        results_text.insert("end", f"🔄 Установка {driver_name} на {client_id}...\n")
-                        results_text.see("end")
-                        progress_window.update()
-                        
-                        result = self.server.deploy_to_client(client_socket, driver_name)
-                        
-                        status_icon = "✅" if result['status'] == 'success' else "❌"
-                        if result['status'] == 'skipped':
-                            status_icon = "⚠️"
-                            
-                        results_text.insert("end", f"{status_icon} {client_id}: {result['status']} - {result.get('message', '')}\n")
-                        results_text.see("end")
-                        
-                    except Exception as e:
-                        results_text.insert("end", f"❌ Ошибка: {str(e)}\n")
-                        results_text.see("end")
-                    
-                    completed_operations += 1
-                    progress = completed_operations / total_operations
-                    progress_bar.set(progress)
-                    progress_label.configure(text=f"Прогресс: {completed_operations}/{total_operations}")
-                    progress_window.update()
-            
+            jobs = {}
+            for driver_name in self.selected_drivers:
+                try:
+                    for client_id, job_id in self.server.enqueue_deployment(driver_name, self.selected_id).items():
+                        jobs[job_id] = client_id
+                        events.put(('line', f"🔄 {driver_name} на {client_id}: в очереди"))
+                except Exception as e:
+                    events.put(('line', f"❌ {driver_name}: {str(e)}"))
+            events.put(('enqueued', jobs))
+        
+        jobs = None
+        completed = set()
+        # События заданий, пришедшие раньше, чем постановка вернула их id
+        early = []
+        finished = False
+        
+        def handle_job(job, state, result):
+            if job.id not in jobs:
+                return
+            client_id = jobs[job.id]
+            status = result.get('status', state)
+            message = result.get('message', '')
+            if state in FINAL_STATES:
+                status_icon = {"succeeded": "✅", "skipped": "⚠️"}.get(state, "❌")
+                completed.add(job.id)
+            elif status == 'offline':
+                status_icon = "⏸️"
+                message = "ждет подключения клиента"
+                completed.add(job.id)
+            else:
+                status_icon = "🔁"
+                message = f"{message}, повтор через {result.get('retry_in')} с"
+            results_log.append(f"{status_icon} {client_id} ({job.driver_name}): {status} - {message}")
+        
+        def finish():
+            nonlocal finished
+            finished = True
+            self.server.dispatcher.remove_listener(on_job)
             progress_label.configure(text="Установка завершена!")
             close_button = ctk.CTkButton(progress_window, text="Закрыть", command=progress_window.destroy)
             close_button.pack(pady=10)
         
-        # Запускаем поток установки
+        def drain():
+            nonlocal jobs
+            if not progress_window.winfo_exists():
+                self.server.dispatcher.remove_listener(on_job)
+                return
+            # За один кадр применяем пачку событий и перерисовываем один раз
+            for _ in range(UI_MAX_EVENTS_PER_FRAME):
+                try:
+                    event = events.get_nowait()
+                except queue.Empty:
+                    break
+                if event[0] == 'line':
+                    results_log.append(event[1])
+                elif event[0] == 'enqueued':
+                    jobs = event[1]
+                    for pending in early:
+                        handle_job(*pending)
+                    early.clear()
+                elif jobs is None:
+                    early.append(event[1:])
+                else:
+                    handle_job(*event[1:])
+            results_log.render()
+            if jobs is not None:
+                if jobs:
+                    progress_bar.set(len(completed) / len(jobs))
+                    progress_label.configure(text=f"Прогресс: {len(completed)}/{len(jobs)}")
+                if not finished and len(completed) == len(jobs):
+                    finish()
+            if not finished or not events.empty():
+                progress_window.after(UI_REFRESH_MS, drain)
+        
+        self.server.dispatcher.add_listener(on_job)
+        # Запускаем поток постановки заданий
         deployment_thread = threading.Thread(target=run_deployment)
         deployment_thread.daemon = True
         deployment_thread.start()
+        progress_window.after(UI_REFRESH_MS, drain)
+
+    def run_menu(self):
+        """Текстовое меню консоли (без GUI)"""
+        print("🚀 Запуск системы управления драйверами (текстовый режим)...")
+        self.start_server_background()
+        actions = {
+            '1': self.show_connected_clients,
+            '2': lambda: self.upload_driver([input("Путь к драйверу: ").strip()], None),
+            '3': self.mass_deploy,
+            '4': self.deploy_to_specific_client,
+            '5': self.show_deployment_history,
+            '6': self.create_test_drivers,
+        }
+        while True:
+            self.show_menu()
+            try:
+                choice = input("Выберите действие: ").strip()
+            except EOFError:
+                break
+            if choice == '7':
+                break
+            action = actions.get(choice)
+            if action is None:
+                print("❌ Неверный выбор")
+                continue
+            action()
+
+    def run_batch(self, plan_path, out):
+        """Выполняет план развертывания без участия пользователя, пишет строки JSON в out.
+
+        Возвращает код завершения процесса.
+        """
+        from batch_deploy import PlanError, EXIT_INVALID, load_plan, port_answers, run_plan
+
+        def emit(line):
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+
+        try:
+            plan = load_plan(plan_path)
+        except PlanError as e:
+            emit({'event': 'error', 'message': str(e)})
+            return EXIT_INVALID
+        # Агенты подключены к уже работающей консоли, и к этому серверу никто не придет
+        busy = (f"Порт {self.server.port} уже занят — вероятно, запущена консоль или другой сервер. "
+                f"Остановите его или выполните план на свободном порту (server_port в config.json)")
+        # Проверка до запуска: старый сервер с SO_REUSEADDR на Windows не помешал бы открыть порт еще раз
+        if port_answers(self.server.host, self.server.port):
+            emit({'event': 'error', 'message': busy})
+            return EXIT_INVALID
+        # Ждать подключения агентов будет сам план
+        self.start_server_background(settle=0)
+        error = self.server.wait_listening(timeout=10.0)
+        if error is not None:
+            message = f"Сервер не запустился на {self.server.host}:{self.server.port}: {error}"
+            # EACCES — Windows: порт монопольно держит другой процесс
+            if isinstance(error, OSError) and error.errno in (errno.EADDRINUSE, errno.EACCES):
+                message = busy
+            emit({'event': 'error', 'message': message})
+            return EXIT_INVALID
+        return run_plan(self.server, plan, emit)
 
     def run(self):
         """Запускает административную консоль"""
+        load_gui()
         print("🚀 Запуск системы управления драйверами...")
         self.start_server_background()
         self.create_test_drivers()  # Создаем тестовые драйверы
         pApp = self.init_tkinter()
+        self.app = pApp
 
         # Работа с ткинтером
         clientList = CTkListbox(pApp, command=self.save_value_users, width=200, height=100, multiple_selection=True)
@@ -308,6 +586,10 @@ class AdminConsole:
 
         update_button = ctk.CTkButton(pApp, text="Обновить", command=lambda: self.update_client_list(clientList))
         update_button.place(x=20, y=200)
+        # Сервер сам присылает изменения реестра; кнопка «Обновить» догоняет пропущенное
+        self.server.client_feed.add_listener(self.client_events.put)
+        self.update_client_list(clientList)
+        pApp.after(UI_REFRESH_MS, self.drain_client_events, clientList)
 
         list_label = ctk.CTkLabel(pApp, text="Список Устройств", font=("Arial", 16))
         list_label.place(x=20, y=30)
@@ -320,6 +602,7 @@ class AdminConsole:
         pywinstyles.apply_dnd(driverList, wrapper_func)
         
         self.update_drivers_list(driverList)
+        pApp.after(UI_REFRESH_MS, self.drain_ingest_results, driverList)
 
         driver_list_label = ctk.CTkLabel(pApp, text="Доступные драйверы", font=("Arial", 16))
         driver_list_label.place(x=350, y=30)
@@ -343,6 +626,31 @@ class AdminConsole:
         self.selected_drivers = None
         print("✅ Выбор очищен")
 
-if __name__ == "__main__":
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Консоль управления драйверами")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--plan', help="выполнить план развертывания (JSON) без GUI и выйти")
+    mode.add_argument('--menu', action='store_true', help="текстовое меню вместо GUI")
+    parser.add_argument('--output', help="куда писать строки JSON результата (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    if args.plan:
+        # Журнал сервера уходит в stderr, а в stdout — только строки JSON
+        out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+        sys.stdout = sys.stderr
+        try:
+            return AdminConsole().run_batch(args.plan, out)
+        finally:
+            if args.output:
+                out.close()
+
     admin = AdminConsole()
-    admin.run()
\ No newline at end of file
+    if args.menu:
+        admin.run_menu()
+    else:
+        admin.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
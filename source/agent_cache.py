@@ -0,0 +1,202 @@
+# agent_cache.py
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+
+class DriverCache:
+    """Локальный кеш пакетов агента, адресуемый по хешу содержимого.
+
+    Пакет лежит в <cache_dir>/<хеш>/<имя файла>, чтобы установщик сохранял
+    свое расширение. Общий размер ограничен: при переполнении вытесняются
+    давно не использованные пакеты (LRU). Индекс хранится в index.json.
+    Недокачанные файлы лежат в .partial/<хеш>.part и продолжаются с
+    последнего подтвержденного блока, в том числе после переподключения.
+    Пакет, который ставится или раздается соседям, закреплен (pin) и не
+    вытесняется, пока его не отпустят.
+    """
+
+    def __init__(self, cache_dir="driver_cache", max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        # Закрепленные пакеты: хеш -> число пользователей
+        self._pins = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Индекс кеша драйверов поврежден, кеш будет собран заново: {e}")
+            return
+        # Восстанавливаем порядок LRU по времени последнего использования
+        for digest, entry in sorted(data.items(), key=lambda item: item[1].get('last_used', 0)):
+            path = self._path(digest, entry['name'])
+            if os.path.isfile(path) and os.path.getsize(path) == entry['size']:
+                self._entries[digest] = entry
+                self._total_bytes += entry['size']
+
+    def _save(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(dict(self._entries), f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def _path(self, digest, name):
+        return os.path.join(self.cache_dir, digest, os.path.basename(name))
+
+    def contains(self, digest) -> bool:
+        """Проверяет наличие пакета, не трогая счетчики и порядок LRU"""
+        with self.lock:
+            return digest in self._entries
+
+    def digests(self):
+        """Хеши всех пакетов в кеше"""
+        with self.lock:
+            return list(self._entries)
+
+    def lookup(self, digest):
+        """Возвращает путь к пакету из кеша или None; учитывается в счетчиках"""
+        with self.lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                path = self._path(digest, entry['name'])
+                if os.path.isfile(path) and os.path.getsize(path) == entry['size']:
+                    entry['last_used'] = time.time()
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    self._save()
+                    return path
+                # Файл удалили или повредили снаружи
+                self._drop(digest)
+                self._save()
+            self.misses += 1
+            return None
+
+    def path_for(self, digest):
+        """Путь к пакету для раздачи соседям; счетчики и порядок LRU не меняются"""
+        with self.lock:
+            entry = self._entries.get(digest)
+            if entry is None:
+                return None
+            path = self._path(digest, entry['name'])
+        return path if os.path.isfile(path) else None
+
+    def pin(self, digest):
+        """Закрепляет пакет (в том числе еще не полученный), вызывается парно с unpin"""
+        with self.lock:
+            self._pins[digest] = self._pins.get(digest, 0) + 1
+
+    def unpin(self, digest):
+        """Отпускает пакет; отложенное из-за закрепленных пакетов вытеснение выполняется сейчас"""
+        with self.lock:
+            count = self._pins.pop(digest, 0) - 1
+            if count > 0:
+                self._pins[digest] = count
+            elif self._total_bytes > self.max_bytes:
+                self._evict()
+                self._save()
+
+    @contextmanager
+    def pinned(self, digest):
+        """Пакет закреплен на время блока with"""
+        self.pin(digest)
+        try:
+            yield
+        finally:
+            self.unpin(digest)
+
+    def put(self, digest, source_path, name):
+        """Переносит проверенный файл в кеш и возвращает его новый путь"""
+        size = os.path.getsize(source_path)
+        target_path = self._path(digest, name)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(source_path, target_path)
+        with self.lock:
+            if digest in self._entries:
+                self._total_bytes -= self._entries[digest]['size']
+            self._entries[digest] = {'name': os.path.basename(name), 'size': size, 'last_used': time.time()}
+            self._entries.move_to_end(digest)
+            self._total_bytes += size
+            self._evict(keep=digest)
+            self._save()
+        return target_path
+
+    def _evict(self, keep=None):
+        """Вытесняет самые давние незакрепленные пакеты, пока кеш не уложится в лимит"""
+        for digest in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if digest == keep or digest in self._pins:
+                continue
+            print(f"🧹 Вытеснен из кеша: {self._entries[digest]['name']}")
+            self._drop(digest)
+
+    def _drop(self, digest):
+        entry = self._entries.pop(digest)
+        self._total_bytes -= entry['size']
+        shutil.rmtree(os.path.join(self.cache_dir, digest), ignore_errors=True)
+
+    def partial_path(self, digest):
+        """Путь недокачанного файла"""
+        return os.path.join(self.cache_dir, '.partial', f"{digest}.part")
+
+    def resume_partial(self, digest, size, algorithm, chunk_size, chunk_hashes, file_hasher=None):
+        """Проверяет недокачанный файл по хешам блоков и возвращает смещение продолжения.
+
+        Подтвержденные блоки добавляются в file_hasher, все после первого
+        неподтвержденного блока отрезается.
+        """
+        path = self.partial_path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if not os.path.exists(path):
+            return 0
+
+        offset = 0
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        with open(path, 'r+b') as f:
+            for expected in chunk_hashes:
+                want = min(chunk_size, size - offset)
+                n = f.readinto(view[:want])
+                if n != want or hashlib.new(algorithm, view[:n]).hexdigest() != expected:
+                    break
+                if file_hasher is not None:
+                    file_hasher.update(view[:n])
+                offset += n
+            f.truncate(offset)
+        return offset
+
+    def discard_partial(self, digest):
+        try:
+            os.remove(self.partial_path(digest))
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        """Счетчики попаданий и заполненность кеша"""
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,275 @@
+# async_server.py
+import asyncio
+import concurrent.futures
+import socket
+import sys
+import threading
+import time
+
+from protocol import (FramedConnection, ConnectionClosed, ProtocolError, Frame,
+                      PROTOCOL_MAGIC, LEGACY_RECV_SIZE, MSG_JSON, classify_greeting,
+                      encode_json, legacy_frame, unpack_header)
+from heartbeat import enable_keepalive, set_listen_options
+from server_admin import DriverDeploymentServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Сколько ждать остаток кадра, начавшего приходить
+FRAME_READ_TIMEOUT = 10.0
+# Сколько байт файла отправляется за один вызов sock_sendfile: между кусками отмечается ход передачи
+SENDFILE_CHUNK = 8 * 1024 * 1024
+# Как часто поток, ждущий отправки, проверяет, жив ли цикл событий
+SEND_POLL_INTERVAL = 1.0
+
+
+class AsyncFramedConnection(FramedConnection):
+    """Соединение, которое читает и пишет цикл событий.
+
+    Сокет неблокирующий, поэтому рабочие потоки не пишут в него сами:
+    отправка передается в цикл событий, а общий замок отправки не дает
+    кадрам разных запросов перемешаться. Если отправка не продвигается
+    send_timeout секунд или цикл событий остановлен, ожидающий поток
+    получает ConnectionClosed, как при обрыве соединения.
+    """
+
+    def __init__(self, sock, loop, legacy=False, send_timeout=None):
+        super().__init__(sock, legacy)
+        self.loop = loop
+        self.send_timeout = send_timeout
+        self._progress = time.monotonic()
+        self.loop_thread = threading.get_ident()
+        self.send_gate = asyncio.Lock()
+        self.reader_active = True
+        self._posts = set()
+
+    async def write_async(self, data):
+        async with self.send_gate:
+            self._progress = time.monotonic()
+            await self.loop.sock_sendall(self.sock, data)
+
+    def post_json(self, obj, request_id=0):
+        """Отправляет JSON из цикла событий отдельной задачей: сопрограмма-читатель
+        не ждет замка отправки, пока рабочий поток передает файл"""
+        task = self.loop.create_task(self.write_async(self.encode_frame(MSG_JSON, encode_json(obj), request_id)))
+        self._posts.add(task)
+        task.add_done_callback(self._posted)
+
+    def _posted(self, task):
+        self._posts.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            # Обрыв соединения заметит читатель
+            print(f"⚠️ Не удалось отправить ответ клиенту {self.client_id}: {task.exception()}")
+
+    async def _write_file_async(self, header, f, offset, count, throttle=None):
+        async with self.send_gate:
+            self._progress = time.monotonic()
+            if header:
+                await self.loop.sock_sendall(self.sock, header)
+            if count <= 0:
+                return 0
+            # Кадр целиком под замком отправки, а разрешения планировщика ждем вне цикла событий
+            sent = 0
+            while sent < count:
+                self._progress = time.monotonic()
+                if throttle is None:
+                    allowed = min(SENDFILE_CHUNK, count - sent)
+                else:
+                    allowed = await self.loop.run_in_executor(None, throttle, count - sent)
+                    self._progress = time.monotonic()
+                n = await self.loop.sock_sendfile(self.sock, f, offset + sent, allowed)
+                sent += n
+                if n != allowed:
+                    break
+            return sent
+
+    def _run(self, coro):
+        if threading.get_ident() == self.loop_thread:
+            coro.close()
+            raise RuntimeError("Блокирующая отправка из цикла событий привела бы к взаимной блокировке")
+        if not self.loop.is_running():
+            coro.close()
+            raise ConnectionClosed("Цикл событий сервера остановлен")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        while True:
+            try:
+                return future.result(SEND_POLL_INTERVAL)
+            except concurrent.futures.TimeoutError:
+                if not self.loop.is_running():
+                    reason = "цикл событий сервера остановлен"
+                elif self.send_timeout and time.monotonic() - self._progress >= self.send_timeout:
+                    reason = f"отправка стоит {self.send_timeout:.0f} с"
+                else:
+                    continue
+            future.cancel()
+            # Кадр мог уйти не целиком: дальше по этому соединению писать нельзя
+            self.shutdown()
+            raise ConnectionClosed(f"Отправка клиенту {self.client_id} прервана: {reason}")
+
+    def _write(self, data):
+        self._run(self.write_async(data))
+
+    def _write_file(self, header, f, offset, count, method, throttle=None):
+        # sock_sendfile сам выбирает os.sendfile или обычную отправку
+        return self._run(self._write_file_async(header, f, offset, count, throttle))
+
+
+class AsyncDriverDeploymentServer(DriverDeploymentServer):
+    """Сервер на asyncio: один цикл событий держит все соединения агентов.
+
+    Реестр клиентов, совместимость и логика развертывания общие с
+    DriverDeploymentServer. Простаивающее соединение стоит одну сопрограмму,
+    а не поток. Сопрограмма соединения — его единственный читатель: ответы
+    раздаются каналам запросов рабочих потоков (пул массового развертывания,
+    поток консоли), а их отправка выполняется в цикле событий.
+    """
+
+    def __init__(self, host=None, port=8888, config=None):
+        super().__init__(host, port, config)
+        self.loop = None
+        self._tasks = set()
+        self._client_counter = 1
+
+    def start_server(self):
+        """Запускает сервер; блокирует вызывающий поток, как и потоковый режим"""
+        if sys.platform == 'win32':
+            asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            self._listen_failed(e)
+            print(f"❌ Ошибка сервера: {e}")
+
+    async def serve(self):
+        """Принимает подключения в цикле событий"""
+        self.loop = asyncio.get_running_loop()
+        self._raise_fd_limit()
+
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        set_listen_options(server_socket)
+        try:
+            server_socket.bind((self.host, self.port))
+            server_socket.listen(self.accept_backlog)
+            server_socket.setblocking(False)
+            self.start_background_services()
+            self._listen_done.set()
+            print(f"✅ Сервер (asyncio) запущен на {self.host}:{self.port}, очередь подключений {self.accept_backlog}")
+            print("⏳ Ожидание подключения клиентов...")
+
+            while True:
+                client_socket, address = await self.loop.sock_accept(server_socket)
+                client_socket.setblocking(False)
+                print(f"🔗 Новое подключение от {address}")
+
+                task = self.loop.create_task(
+                    self.handle_client_async(client_socket, address, f"client_{self._client_counter}")
+                )
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+                self._client_counter += 1
+        finally:
+            server_socket.close()
+
+    @staticmethod
+    def _raise_fd_limit():
+        """Поднимает мягкий лимит открытых файлов до жесткого"""
+        if resource is None:
+            return
+        try:
+            soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+            target = hard if hard != resource.RLIM_INFINITY else 1 << 20
+            if soft < target:
+                resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            print(f"⚠️ Не удалось поднять лимит открытых файлов: {e}")
+
+    # --- Чтение в цикле событий ---
+
+    async def _wait_readable(self, sock):
+        """Ждет входящих данных, не забирая их из сокета"""
+        waiter = self.loop.create_future()
+        fd = sock.fileno()
+        self.loop.add_reader(fd, lambda: waiter.done() or waiter.set_result(None))
+        try:
+            await waiter
+        finally:
+            self.loop.remove_reader(fd)
+
+    async def _detect_framed(self, sock):
+        for _ in range(50):
+            await asyncio.wait_for(self._wait_readable(sock), FRAME_READ_TIMEOUT)
+            framed = classify_greeting(sock.recv(len(PROTOCOL_MAGIC), socket.MSG_PEEK))
+            if framed is not None:
+                return framed
+            await asyncio.sleep(0.02)
+        return False
+
+    async def _recv_exact_into(self, sock, view):
+        received = 0
+        while received < len(view):
+            n = await self.loop.sock_recv_into(sock, view[received:])
+            if n == 0:
+                raise ConnectionClosed("Соединение закрыто удаленной стороной")
+            received += n
+
+    async def _recv_frame(self, connection):
+        """Читает кадр целиком, не блокируя цикл событий"""
+        sock = connection.sock
+        if connection.legacy:
+            data = await self.loop.sock_recv(sock, LEGACY_RECV_SIZE)
+            if not data:
+                raise ConnectionClosed("Соединение закрыто удаленной стороной")
+            return legacy_frame(data)
+        await self._recv_exact_into(sock, connection.header_view)
+        header = unpack_header(connection.header_buffer)
+        payload = bytearray(header.length)
+        if header.length:
+            await self._recv_exact_into(sock, memoryview(payload))
+        return Frame(header.version, header.msg_type, header.flags, header.request_id, payload)
+
+    async def handle_client_async(self, client_socket, address, client_id):
+        """Обслуживает подключение клиента в цикле событий"""
+        print(f"🔗 Клиент {client_id} подключен: {address}")
+
+        try:
+            framed = await self._detect_framed(client_socket)
+        except (OSError, ConnectionClosed, asyncio.TimeoutError) as e:
+            print(f"🔒 Клиент {client_id} отключился до регистрации: {e}")
+            client_socket.close()
+            return
+        connection = AsyncFramedConnection(client_socket, self.loop, legacy=not framed,
+                                           send_timeout=self.deploy_timeout)
+        enable_keepalive(client_socket)
+        self.add_client(client_id, client_socket, address, connection)
+
+        try:
+            while True:
+                await self._wait_readable(client_socket)
+                frame = await asyncio.wait_for(self._recv_frame(connection), FRAME_READ_TIMEOUT)
+                self.liveness.touch(client_id)
+                if connection.dispatch(frame):
+                    continue
+
+                message = frame.json()
+                if not message or 'action' not in message:
+                    continue
+
+                response = self.process_message(client_id, connection, message)
+                if response is not None:
+                    connection.post_json(response, frame.request_id)
+
+        except ConnectionClosed:
+            print(f"🔒 Клиент {client_id} отключился")
+        except asyncio.TimeoutError:
+            print(f"⏰ Клиент {client_id} не дослал кадр")
+        except ProtocolError as e:
+            print(f"❌ Нарушение протокола клиентом {client_id}: {e}")
+        except (ConnectionResetError, BrokenPipeError):
+            print(f"🔒 Соединение с клиентом {client_id} разорвано")
+        except Exception as e:
+            print(f"❌ Ошибка с клиентом {client_id}: {e}")
+        finally:
+            connection.fail_requests(ConnectionClosed(f"Клиент {client_id} отключился"))
+            self.remove_client(client_id, client_socket)
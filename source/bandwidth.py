@@ -0,0 +1,285 @@
+# bandwidth.py
+import heapq
+import ipaddress
+import itertools
+import threading
+import time
+
+# Веса классов приоритета: при нехватке полосы доли делятся в этой пропорции
+PRIORITY_WEIGHTS = {'urgent': 8, 'normal': 2, 'background': 1}
+DEFAULT_PRIORITY = 'normal'
+# Сколько байт за раз выдается одной передаче
+DEFAULT_QUANTUM = 256 * 1024
+METER_WINDOW = 5
+
+
+class TokenBucket:
+    """Ведро токенов: rate байт в секунду, не больше burst байт запаса"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(rate / 4, DEFAULT_QUANTUM))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def delay(self, n, now):
+        """Через сколько секунд в ведре наберется n байт (0 — уже есть)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= n:
+            return 0.0
+        return (n - self.tokens) / self.rate
+
+    def consume(self, n):
+        self.tokens -= n
+
+
+class RateMeter:
+    """Скорость за последние несколько секунд по посекундным корзинам"""
+
+    def __init__(self, window=METER_WINDOW):
+        self.window = window
+        self.total = 0
+        self._buckets = [0] * window
+        self._second = int(time.monotonic())
+        self._started = None
+
+    def _roll(self, now):
+        second = int(now)
+        if second - self._second >= self.window:
+            self._buckets = [0] * self.window
+        else:
+            for s in range(self._second + 1, second + 1):
+                self._buckets[s % self.window] = 0
+        self._second = max(self._second, second)
+
+    def add(self, n, now):
+        self._roll(now)
+        self._buckets[int(now) % self.window] += n
+        self.total += n
+        if self._started is None:
+            self._started = now
+
+    def rate(self, now):
+        self._roll(now)
+        if self._started is None:
+            return 0.0
+        # Пока окно не заполнилось, делим на фактическое время с первого байта
+        return sum(self._buckets) / min(self.window, max(1.0, now - self._started))
+
+
+class Flow:
+    """Одна передача файла в планировщике; вызов flow(n) ждет разрешения отправить до n байт"""
+
+    def __init__(self, scheduler, client_id, site, priority, buckets):
+        self.scheduler = scheduler
+        self.client_id = client_id
+        self.site = site
+        self.priority = priority
+        self.weight = PRIORITY_WEIGHTS[priority]
+        self.buckets = buckets
+        self.limit = min([scheduler.quantum] + [bucket.burst for bucket in buckets])
+        self.finish = 0.0
+        self.bytes = 0
+
+    def __call__(self, n):
+        return self.scheduler.acquire(self, n)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.scheduler.release(self)
+
+
+class _Ticket:
+    """Ожидающий кусок передачи: своя Condition, чтобы будить только его"""
+
+    __slots__ = ('flow', 'n', 'start', 'cond', 'granted', 'wait')
+
+    def __init__(self, flow, n, start, lock):
+        self.flow = flow
+        self.n = n
+        self.start = start
+        self.cond = threading.Condition(lock)
+        self.granted = False
+        # Таймаут ожидания: задается только тому, кто проверит ведра, когда они наполнятся
+        self.wait = None
+
+
+class BandwidthScheduler:
+    """Планировщик исходящей полосы для передач драйверов.
+
+    Каждая передача — поток в планировщике. Перед отправкой очередного
+    куска файла поток берет токены из ведер, которые к нему относятся:
+    общего, своей площадки (подсети) и своего клиента. Когда токенов
+    не хватает, куски выдаются в порядке взвешенной честной очереди:
+    передачи одного приоритета делят полосу поровну, а срочные получают
+    долю по весу класса. Нулевой лимит — без ограничения.
+
+    Ожидающие куски лежат в куче по (виртуальное время, приоритет).
+    Разрешения раздает тот, кто вызвал планировщик, и будит только
+    получивших их; ждать пополнения ведер по таймеру остается одному
+    ожидающему, остальные спят до своей очереди.
+    """
+
+    def __init__(self, global_rate=0, site_rate=0, client_rate=0, site_prefix=24,
+                 site_rates=None, client_rates=None, quantum=DEFAULT_QUANTUM):
+        self.quantum = quantum
+        self.site_rate = site_rate
+        self.client_rate = client_rate
+        self.site_prefix = site_prefix
+        # Явные лимиты площадок: сеть -> байт/с, длинный префикс важнее
+        self.site_rates = sorted(((ipaddress.ip_network(network, strict=False), rate)
+                                  for network, rate in (site_rates or {}).items()),
+                                 key=lambda item: item[0].prefixlen, reverse=True)
+        self.client_rates = dict(client_rates or {})
+        self.global_bucket = TokenBucket(global_rate) if global_rate else None
+        self._site_buckets = {}
+        self._client_buckets = {}
+        self._lock = threading.Lock()
+        self._flows = []
+        self._waiting = []
+        self._timer = None
+        self._virtual = 0.0
+        self._sequence = itertools.count()
+        self._global_meter = RateMeter()
+        self._site_meters = {}
+        self._client_meters = {}
+
+    def site_for(self, host):
+        """Площадка клиента: настроенная сеть, куда он входит, или его подсеть"""
+        try:
+            address = ipaddress.ip_address(host)
+        except (ValueError, TypeError):
+            return 'unknown'
+        for network, _ in self.site_rates:
+            if address.version == network.version and address in network:
+                return str(network)
+        prefix = min(self.site_prefix, address.max_prefixlen)
+        return str(ipaddress.ip_network(f"{host}/{prefix}", strict=False))
+
+    def _site_limit(self, site):
+        for network, rate in self.site_rates:
+            if str(network) == site:
+                return rate
+        return self.site_rate
+
+    def flow(self, client_id, host, priority=DEFAULT_PRIORITY) -> Flow:
+        """Регистрирует передачу клиенту; используется как контекстный менеджер"""
+        if priority not in PRIORITY_WEIGHTS:
+            priority = DEFAULT_PRIORITY
+        site = self.site_for(host)
+        with self._lock:
+            buckets = [self.global_bucket] if self.global_bucket else []
+            site_limit = self._site_limit(site)
+            if site_limit:
+                if site not in self._site_buckets:
+                    self._site_buckets[site] = TokenBucket(site_limit)
+                buckets.append(self._site_buckets[site])
+            client_limit = self.client_rates.get(client_id, self.client_rate)
+            if client_limit:
+                if client_id not in self._client_buckets:
+                    self._client_buckets[client_id] = TokenBucket(client_limit)
+                buckets.append(self._client_buckets[client_id])
+            flow = Flow(self, client_id, site, priority, buckets)
+            self._flows.append(flow)
+            self._site_meters.setdefault(site, RateMeter())
+            self._client_meters.setdefault(client_id, RateMeter())
+        return flow
+
+    def release(self, flow):
+        with self._lock:
+            if flow in self._flows:
+                self._flows.remove(flow)
+            if not any(other.client_id == flow.client_id for other in self._flows):
+                self._client_buckets.pop(flow.client_id, None)
+                self._client_meters.pop(flow.client_id, None)
+
+    def acquire(self, flow, n):
+        """Ждет своей очереди и токенов, возвращает разрешенное число байт (<= n)"""
+        n = min(n, flow.limit)
+        with self._lock:
+            if not flow.buckets:
+                self._account(flow, n, time.monotonic())
+                return n
+            start = max(self._virtual, flow.finish)
+            flow.finish = start + n / flow.weight
+            ticket = _Ticket(flow, n, start, self._lock)
+            # При равном виртуальном времени срочная передача идет первой
+            heapq.heappush(self._waiting, (flow.finish, -flow.weight, next(self._sequence), ticket))
+            try:
+                self._dispatch()
+                while not ticket.granted:
+                    ticket.cond.wait(ticket.wait)
+                    if not ticket.granted:
+                        self._dispatch()
+                return n
+            finally:
+                if not ticket.granted:
+                    # Ожидание прервано: убираем кусок из очереди и передаем таймер другому
+                    self._waiting = [entry for entry in self._waiting if entry[-1] is not ticket]
+                    heapq.heapify(self._waiting)
+                    if self._timer is ticket:
+                        self._timer = None
+                    self._dispatch()
+
+    def _dispatch(self):
+        """Выдает токены ожидающим в порядке очереди (вызывается под замком)"""
+        now = time.monotonic()
+        skipped = []
+        timer, timer_wait = None, None
+        while self._waiting:
+            ticket = self._waiting[0][-1]
+            delay = max(bucket.delay(ticket.n, now) for bucket in ticket.flow.buckets)
+            if not delay:
+                heapq.heappop(self._waiting)
+                self._grant(ticket, now)
+                continue
+            if timer is None or delay < timer_wait:
+                timer, timer_wait = ticket, delay
+            if self.global_bucket is not None and self.global_bucket.delay(ticket.n, now):
+                # Общее ведро пусто для всех: дальше по очереди никто не пройдет
+                break
+            # Ждет ведро своей площадки или клиента — пропускаем к следующим
+            skipped.append(heapq.heappop(self._waiting))
+        for entry in skipped:
+            heapq.heappush(self._waiting, entry)
+        if self._timer is not timer and self._timer is not None:
+            self._timer.wait = None
+        self._timer = timer
+        if timer is not None:
+            timer.wait = timer_wait
+            timer.cond.notify()
+
+    def _grant(self, ticket, now):
+        flow = ticket.flow
+        for bucket in flow.buckets:
+            bucket.consume(ticket.n)
+        self._virtual = max(self._virtual, ticket.start)
+        self._account(flow, ticket.n, now)
+        ticket.granted = True
+        ticket.cond.notify()
+
+    def _account(self, flow, n, now):
+        flow.bytes += n
+        self._global_meter.add(n, now)
+        self._site_meters[flow.site].add(n, now)
+        self._client_meters[flow.client_id].add(n, now)
+
+    def stats(self):
+        """Текущая загрузка: лимиты и скорость за последние секунды"""
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'global': {'limit': self.global_bucket.rate if self.global_bucket else 0,
+                           'rate': self._global_meter.rate(now), 'bytes': self._global_meter.total},
+                'sites': {site: {'limit': self._site_limit(site), 'rate': meter.rate(now)}
+                          for site, meter in self._site_meters.items()},
+                'clients': {client_id: {'limit': self.client_rates.get(client_id, self.client_rate),
+                                        'rate': meter.rate(now)}
+                            for client_id, meter in self._client_meters.items()},
+                'transfers': [{'client_id': flow.client_id, 'site': flow.site,
+                               'priority': flow.priority, 'bytes': flow.bytes} for flow in self._flows],
+                'waiting': len(self._waiting),
+            }
@@ -0,0 +1,171 @@
+# batch_deploy.py
+"""Пакетное развертывание по файлу плана без графического интерфейса.
+
+План — JSON: какие клиенты (по id, имени агента, ОС и подсети) и какие
+драйверы. Результаты выводятся строками JSON, по одной на пару
+клиент-драйвер, и итоговой строкой summary.
+
+    {
+        "targets": {"ids": ["client_1"], "names": ["ws-01"], "os": ["windows"], "subnets": ["10.0.0.0/24"]},
+        "drivers": ["nvidia_windows.exe"],
+        "wait_for_clients": 10,
+        "min_clients": 1,
+        "priority": "normal",
+        "timeout": 180,
+        "queue": false
+    }
+"""
+import ipaddress
+import json
+import socket
+import time
+
+from bandwidth import PRIORITY_WEIGHTS
+
+# Коды завершения: все успешно или пропущено, были ошибки, план невыполним
+EXIT_OK, EXIT_FAILED, EXIT_INVALID = 0, 1, 2
+DEFAULT_WAIT_FOR_CLIENTS = 5.0
+
+
+class PlanError(ValueError):
+    """План развертывания задан неверно"""
+
+
+def load_plan(path):
+    """Читает и проверяет план развертывания"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            plan = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise PlanError(f"Не удалось прочитать план {path}: {e}")
+    if not isinstance(plan, dict):
+        raise PlanError("План должен быть объектом JSON")
+    drivers = plan.get('drivers')
+    if isinstance(drivers, str):
+        drivers = [drivers]
+    if not drivers or not all(isinstance(name, str) for name in drivers):
+        raise PlanError("В плане нет списка drivers")
+    targets = plan.get('targets') or {}
+    if not isinstance(targets, dict):
+        raise PlanError("targets должен быть объектом")
+    selectors = {}
+    for key in ('ids', 'names', 'os', 'subnets'):
+        values = targets.get(key) or []
+        if isinstance(values, str):
+            values = [values]
+        selectors[key] = list(values)
+    try:
+        selectors['subnets'] = [ipaddress.ip_network(subnet, strict=False) for subnet in selectors['subnets']]
+    except ValueError as e:
+        raise PlanError(f"Неверная подсеть: {e}")
+    priority = plan.get('priority')
+    if priority is not None and priority not in PRIORITY_WEIGHTS:
+        raise PlanError(f"Неверный priority: {priority!r}, допустимы {', '.join(PRIORITY_WEIGHTS)}")
+    timeout = plan.get('timeout')
+    if timeout is not None and (not _is_number(timeout) or timeout <= 0):
+        raise PlanError(f"timeout должен быть положительным числом секунд, а не {timeout!r}")
+    wait_for_clients = plan.get('wait_for_clients', DEFAULT_WAIT_FOR_CLIENTS)
+    if not _is_number(wait_for_clients) or wait_for_clients < 0:
+        raise PlanError(f"wait_for_clients должен быть неотрицательным числом секунд, а не {wait_for_clients!r}")
+    min_clients = plan.get('min_clients', 0)
+    if isinstance(min_clients, bool) or not isinstance(min_clients, int) or min_clients < 0:
+        raise PlanError(f"min_clients должен быть неотрицательным целым, а не {min_clients!r}")
+    return {
+        'drivers': drivers,
+        'targets': selectors,
+        'wait_for_clients': float(wait_for_clients),
+        'min_clients': min_clients,
+        'priority': priority,
+        'timeout': float(timeout) if timeout is not None else None,
+        'queue': bool(plan.get('queue', False)),
+    }
+
+
+def port_answers(host, port, timeout=1.0):
+    """Принимает ли кто-то подключения на порту: запущенная консоль или другой сервер"""
+    if host in ('', '0.0.0.0'):
+        host = '127.0.0.1'
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def select_targets(clients_info, targets):
+    """client_id подключенных клиентов, подходящих под все заданные условия"""
+    ids, names = set(targets['ids']), set(targets['names'])
+    os_names = {name.lower() for name in targets['os']}
+    selected = []
+    for client_id, info in clients_info.items():
+        if (ids or names) and client_id not in ids and info.get('client_name') not in names:
+            continue
+        if os_names and str(info.get('system_info', {}).get('os', '')).lower() not in os_names:
+            continue
+        if targets['subnets']:
+            try:
+                address = ipaddress.ip_address(info['address'][0])
+            except ValueError:
+                continue
+            if not any(address in subnet for subnet in targets['subnets']):
+                continue
+        selected.append(client_id)
+    return sorted(selected)
+
+
+def wait_for_targets(server, plan):
+    """Ждет подключения агентов, пока не наберется нужное число или не выйдет время"""
+    deadline = time.monotonic() + plan['wait_for_clients']
+    explicit = len(set(plan['targets']['ids']) | set(plan['targets']['names']))
+    wanted = max(plan['min_clients'], explicit)
+    while True:
+        targets = select_targets(server.get_connected_clients_info(), plan['targets'])
+        if (wanted and len(targets) >= wanted) or time.monotonic() >= deadline:
+            return targets
+        time.sleep(0.2)
+
+
+def run_plan(server, plan, emit):
+    """Выполняет план; emit(dict) получает каждую строку результата. Возвращает код завершения"""
+    targets = wait_for_targets(server, plan)
+    if len(targets) < max(plan['min_clients'], 1):
+        emit({'event': 'error', 'message': f"Подходящих клиентов {len(targets)}, нужно не меньше "
+                                           f"{max(plan['min_clients'], 1)}"})
+        return EXIT_INVALID
+    clients_info = server.get_connected_clients_info()
+    names = {client_id: clients_info.get(client_id, {}).get('client_name') for client_id in targets}
+    emit({'event': 'plan', 'clients': targets, 'drivers': plan['drivers']})
+
+    counts = {}
+    started = time.monotonic()
+    for driver_name in plan['drivers']:
+        if plan['queue']:
+            # Задания уходят в постоянную очередь сервера и выполнятся и после выхода из команды
+            try:
+                job_ids = server.enqueue_deployment(driver_name, targets, plan['priority'])
+            except ValueError as e:
+                emit({'event': 'error', 'driver': driver_name, 'message': str(e)})
+                counts['error'] = counts.get('error', 0) + len(targets)
+                continue
+            for client_id, job_id in sorted(job_ids.items()):
+                emit({'event': 'queued', 'client_id': client_id, 'client_name': names.get(client_id),
+                      'driver': driver_name, 'job_id': job_id})
+                counts['queued'] = counts.get('queued', 0) + 1
+            continue
+        for client_id, result in server.iter_mass_deploy(driver_name, client_ids=targets, timeout=plan['timeout'],
+                                                         priority=plan['priority']):
+            status = result.get('status', 'error')
+            counts[status] = counts.get(status, 0) + 1
+            line = {'event': 'result', 'client_id': client_id, 'client_name': names.get(client_id),
+                    'driver': driver_name, 'status': status, 'message': result.get('message', '')}
+            if result.get('transfer'):
+                line['transfer'] = result['transfer']
+            emit(line)
+
+    failed = sum(count for status, count in counts.items() if status not in ('success', 'skipped', 'queued'))
+    emit({'event': 'summary', 'counts': counts, 'failed': failed, 'seconds': round(time.monotonic() - started, 3)})
+    return EXIT_FAILED if failed else EXIT_OK
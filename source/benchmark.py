@@ -0,0 +1,323 @@
+# benchmark.py
+"""Нагрузочный стенд: сервер и сотни-тысячи имитированных агентов на loopback.
+
+Сервер работает в отдельном процессе, чтобы его CPU и память мерились
+без агентов. Агенты — DriverClientAgent с заглушкой установки
+(задержка и доля отказов настраиваются). Результаты пишутся в JSON,
+и прогон можно сравнить с прошлым через --baseline.
+
+    python benchmark.py --agents 500 --driver-size 4M --rounds 3 --output bench.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from client import DriverClientAgent
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Сколько агентов запускается за раз, чтобы не переполнить очередь подключений
+CONNECT_BATCH = 100
+# Метрики, по которым сравнивается прогон с базовым: имя и лучшее направление
+COMPARED = (('connect.seconds', 'lower'), ('deploy.wall_seconds', 'lower'), ('deploy.throughput_mb_s', 'higher'),
+            ('deploy.latency.p50', 'lower'), ('deploy.latency.p99', 'lower'),
+            ('server.cpu_seconds', 'lower'), ('server.rss_mb', 'lower'))
+
+
+def parse_size(text):
+    """'512K', '4M', '1G' или число байт"""
+    units = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    text = str(text).strip().upper()
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def percentiles(values):
+    if not values:
+        return {'p50': 0.0, 'p90': 0.0, 'p99': 0.0, 'max': 0.0}
+    ordered = sorted(values)
+
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': ordered[-1]}
+
+
+def raise_fd_limit():
+    if resource is None:
+        return
+    try:
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        target = hard if hard != resource.RLIM_INFINITY else 1 << 20
+        if soft < target:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+    except (ValueError, OSError):
+        pass
+
+
+def process_usage():
+    """(CPU в секундах, RSS в МБ) текущего процесса"""
+    if resource is None:
+        return time.process_time(), 0.0
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    rss_mb = usage.ru_maxrss / 1024
+    try:
+        with open('/proc/self/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    rss_mb = int(line.split()[1]) / 1024
+                    break
+    except OSError:
+        pass
+    return usage.ru_utime + usage.ru_stime, rss_mb
+
+
+class SimulatedAgent(DriverClientAgent):
+    """Агент с заглушкой установки: ждет install_latency и отказывает с долей failure_rate"""
+
+    def __init__(self, name, host, port, work_dir, install_latency=0.0, failure_rate=0.0, cache_max_bytes=None,
+                 peer_sharing=False):
+        self.install_latency = install_latency
+        self.failure_rate = failure_rate
+        self._bench_config = {
+            'cache_dir': os.path.join(work_dir, 'cache'),
+            'peer_sharing': peer_sharing,
+            'peer_host': '127.0.0.1',
+        }
+        if cache_max_bytes:
+            self._bench_config['cache_max_bytes'] = cache_max_bytes
+        super().__init__(host, port, name)
+        self.drivers_dir = os.path.join(work_dir, 'drivers')
+
+    def load_config(self):
+        return dict(self._bench_config)
+
+    def collect_system_info(self):
+        return {"os": "Linux", "os_version": "bench", "os_release": "bench", "architecture": "x86_64",
+                "hostname": self.client_name, "processor": "",
+                "hardware_ids": []}
+
+    def install_driver(self, driver_path):
+        if self.install_latency:
+            time.sleep(self.install_latency * random.uniform(0.5, 1.5))
+        if random.random() < self.failure_rate:
+            return {"status": "error", "message": "Имитированный отказ установки"}
+        return {"status": "success", "message": "Драйвер установлен (имитация)"}
+
+
+def server_process(conn, work_dir, port, mode, max_parallel):
+    """Процесс сервера: выполняет команды стенда из conn"""
+    sys.stdout = open(os.devnull, 'w')
+    os.chdir(work_dir)
+    raise_fd_limit()
+    config = {
+        "server_host": "127.0.0.1", "server_port": port, "max_parallel_deploys": max_parallel,
+        "accept_backlog": 4096, "metrics_port": 0, "catalog_poll_interval": 0.5, "swarm_enabled": False,
+    }
+    if mode == 'asyncio':
+        from async_server import AsyncDriverDeploymentServer
+        server = AsyncDriverDeploymentServer("127.0.0.1", port, config)
+    else:
+        from server_admin import DriverDeploymentServer
+        server = DriverDeploymentServer("127.0.0.1", port, config)
+    threading.Thread(target=server.start_server, daemon=True).start()
+    conn.send(('ready', None))
+
+    while True:
+        command, argument = conn.recv()
+        if command == 'clients':
+            conn.send(('clients', server.get_connected_clients_count()))
+        elif command == 'deploy':
+            server.catalog.refresh()
+            cpu_before, _ = process_usage()
+            started = time.perf_counter()
+            completions = []
+            results = server.mass_deploy(argument, on_result=lambda client_id, result:
+                                         completions.append(time.perf_counter() - started))
+            wall = time.perf_counter() - started
+            cpu_after, rss_mb = process_usage()
+            durations = [entry.duration for entry in server.get_history(driver_name=argument, limit=len(results))
+                         if entry.duration is not None]
+            statuses = {}
+            for result in results.values():
+                statuses[result.get('status')] = statuses.get(result.get('status'), 0) + 1
+            transferred = sum((result.get('transfer') or {}).get('bytes', 0) for result in results.values())
+            conn.send(('deploy', {
+                'wall_seconds': wall, 'statuses': statuses, 'bytes': transferred,
+                'latency': percentiles(durations), 'completion': percentiles(completions),
+                'cpu_seconds': cpu_after - cpu_before, 'rss_mb': rss_mb,
+                'phases': {phase: {key: value for key, value in stats.items() if key != 'buckets'}
+                           for phase, stats in server.get_metrics()['histograms'].get('deploy_phase_seconds', {})
+                           .items()},
+            }))
+        elif command == 'usage':
+            conn.send(('usage', process_usage()))
+        elif command == 'stop':
+            return
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def repo_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def lookup(report, dotted):
+    value = report
+    for key in dotted.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(report, baseline, out):
+    """Печатает изменения ключевых метрик относительно базового прогона"""
+    print(f"\n📊 Сравнение с {baseline.get('version') or 'базовым прогоном'}:", file=out)
+    for name, better in COMPARED:
+        new, old = lookup(report['summary'], name), lookup(baseline.get('summary', {}), name)
+        if not isinstance(new, (int, float)) or not isinstance(old, (int, float)) or not old:
+            continue
+        change = (new - old) / old * 100
+        worse = change > 0 if better == 'lower' else change < 0
+        icon = "⚠️" if worse and abs(change) >= 5 else "✅"
+        print(f"   {icon} {name}: {old:.3f} → {new:.3f} ({change:+.1f}%)", file=out)
+
+
+def run(args, out):
+    raise_fd_limit()
+    work_dir = tempfile.mkdtemp(prefix='driver-bench-')
+    server_dir = os.path.join(work_dir, 'server')
+    os.makedirs(os.path.join(server_dir, 'drivers'))
+    port = free_port()
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe()
+    server = context.Process(target=server_process, args=(child_conn, server_dir, port, args.server_mode,
+                                                          args.max_parallel), daemon=True)
+    server.start()
+
+    def call(command, argument=None):
+        parent_conn.send((command, argument))
+        return parent_conn.recv()[1]
+
+    try:
+        parent_conn.recv()
+        time.sleep(0.5)
+        # Кеш агента вмещает один пакет: прошлые раунды вытесняются
+        cache_max = args.driver_size + 1024 * 1024
+        agents = [SimulatedAgent(f"bench_{i:05d}", '127.0.0.1', port, os.path.join(work_dir, 'agents', str(i)),
+                                 args.install_latency, args.failure_rate, cache_max)
+                  for i in range(args.agents)]
+
+        print(f"🔌 Подключаю {args.agents} агентов к {args.server_mode}-серверу...", file=out)
+        connect_started = time.perf_counter()
+        for start in range(0, len(agents), CONNECT_BATCH):
+            for agent in agents[start:start + CONNECT_BATCH]:
+                threading.Thread(target=agent.start, daemon=True).start()
+            time.sleep(0.05)
+        connected = 0
+        deadline = time.monotonic() + args.connect_timeout
+        while time.monotonic() < deadline:
+            connected = call('clients')
+            if connected >= args.agents:
+                break
+            time.sleep(0.1)
+        connect_seconds = time.perf_counter() - connect_started
+        print(f"   подключено {connected}/{args.agents} за {connect_seconds:.2f} с", file=out)
+
+        rounds = []
+        for round_index in range(args.rounds):
+            # Новый пакет в каждом раунде, иначе агенты возьмут его из кеша
+            driver_name = f"bench_r{round_index}_linux.run"
+            with open(os.path.join(server_dir, 'drivers', driver_name), 'wb') as f:
+                f.write(os.urandom(args.driver_size))
+            stats = call('deploy', driver_name)
+            stats['throughput_mb_s'] = stats['bytes'] / stats['wall_seconds'] / (1024 * 1024) \
+                if stats['wall_seconds'] else 0.0
+            rounds.append(stats)
+            print(f"🚀 Раунд {round_index + 1}: {stats['wall_seconds']:.2f} с, {stats['throughput_mb_s']:.1f} МБ/с, "
+                  f"p50 {stats['latency']['p50']:.3f} с, p99 {stats['latency']['p99']:.3f} с, "
+                  f"итоги {stats['statuses']}", file=out)
+        server_cpu, server_rss = call('usage')
+        parent_conn.send(('stop', None))
+    finally:
+        server.join(timeout=5)
+        if server.is_alive():
+            server.terminate()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    best = min(rounds, key=lambda r: r['wall_seconds']) if rounds else {}
+    return {
+        'version': repo_version(),
+        'timestamp': time.time(),
+        'platform': {'python': platform.python_version(), 'system': platform.platform(),
+                     'cpus': os.cpu_count()},
+        'params': {'agents': args.agents, 'driver_size': args.driver_size, 'rounds': args.rounds,
+                   'install_latency': args.install_latency, 'failure_rate': args.failure_rate,
+                   'server_mode': args.server_mode, 'max_parallel': args.max_parallel},
+        'connect': {'connected': connected, 'seconds': connect_seconds},
+        'rounds': rounds,
+        'summary': {
+            'connect': {'connected': connected, 'seconds': connect_seconds},
+            'deploy': {'wall_seconds': best.get('wall_seconds'), 'throughput_mb_s': best.get('throughput_mb_s'),
+                       'latency': best.get('latency')},
+            'server': {'cpu_seconds': server_cpu, 'rss_mb': server_rss},
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный стенд распределения драйверов")
+    parser.add_argument('--agents', type=int, default=200, help="число имитированных агентов")
+    parser.add_argument('--driver-size', type=parse_size, default=parse_size('1M'), help="размер пакета (1M, 64M)")
+    parser.add_argument('--rounds', type=int, default=3, help="сколько раз развернуть новый пакет на всех")
+    parser.add_argument('--install-latency', type=float, default=0.05, help="средняя длительность установки, с")
+    parser.add_argument('--failure-rate', type=float, default=0.0, help="доля отказов установки (0..1)")
+    parser.add_argument('--server-mode', choices=('threaded', 'asyncio'), default='threaded')
+    parser.add_argument('--max-parallel', type=int, default=64, help="max_parallel_deploys сервера")
+    parser.add_argument('--connect-timeout', type=float, default=120.0)
+    parser.add_argument('--output', default='bench_result.json', help="файл результатов (JSON)")
+    parser.add_argument('--baseline', help="прошлый файл результатов для сравнения")
+    parser.add_argument('--verbose', action='store_true', help="не глушить вывод агентов")
+    args = parser.parse_args(argv)
+
+    out = sys.stdout
+    if not args.verbose:
+        # Агенты печатают каждый шаг — при тысячах агентов это дороже самого стенда
+        sys.stdout = open(os.devnull, 'w')
+    try:
+        report = run(args, out)
+    finally:
+        sys.stdout = out
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"💾 Результаты записаны в {args.output}", file=out)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f), out)
+    return report
+
+
+if __name__ == "__main__":
+    main()
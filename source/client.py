@@ -1,10 +1,24 @@
 # client_agent.py
 import socket
+import hashlib
 import json
 import platform
 import subprocess
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from agent_cache import DriverCache, DEFAULT_CACHE_MAX_BYTES
+from heartbeat import DEFAULT_HEARTBEAT_INTERVAL, enable_keepalive
+from compression import available_codecs, make_decompressor
+from delta import DeltaError, apply_delta
+from hash_index import ChunkMismatch, ChunkVerifier
+from swarm import PeerServer, fetch_from_peers
+from protocol import (FramedConnection, FrameHeader, ConnectionClosed, ProtocolError,
+                      MSG_BINARY, PROTOCOL_VERSION)
+
+RECV_BUFFER_SIZE = 256 * 1024
+
 
 class DriverClientAgent:
     def __init__(self, server_host=None, server_port=8888, client_name=None):
@@ -15,6 +29,35 @@ class DriverClientAgent:
         self.client_name = client_name or config.get('client_name') or f"client_{platform.node()}"
         self.system_info = self.collect_system_info()
         self.client_id = None
+        self.drivers_dir = "drivers"
+        # Уже полученные пакеты по хешу: повторная установка без загрузки
+        self.cache = DriverCache(
+            config.get('cache_dir', 'driver_cache'),
+            int(config.get('cache_max_bytes', DEFAULT_CACHE_MAX_BYTES))
+        )
+        # Раздача пакетов из кеша соседним агентам
+        self.peer_server = None
+        if config.get('peer_sharing', True):
+            # Без peer_host слушатель открывается на интерфейсе, через который виден сервер
+            self.peer_server = PeerServer(self.cache, config.get('peer_host'), int(config.get('peer_port', 0)))
+        # Как часто сообщать серверу, что агент жив
+        self.heartbeat_interval = float(config.get('heartbeat_interval', DEFAULT_HEARTBEAT_INTERVAL))
+        # Кодеки, которыми сервер может сжимать пакеты для этого агента
+        self.codecs = available_codecs() if config.get('compression', True) else []
+        # Собирать новую версию пакета из дельты к прежней, лежащей в кеше
+        self.delta_updates = bool(config.get('delta_updates', True))
+        # Установщики запускаются по одному в своем потоке, а загрузки следующих пакетов идут параллельно
+        self.installer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="installer")
+        # Сервер принимает события фаз установки (с регистрации)
+        self.install_events = False
+        # Пакеты, которые сейчас докачиваются в .partial
+        self._active_partials = set()
+        self._partials_lock = threading.Lock()
+        # Когда последний раз приходили данные файла: пока сервер шлет пакет,
+        # ответ на heartbeat стоит за ним в очереди отправки
+        self._last_stream_data = 0.0
+        # Буфер приема файлов переиспользуется между загрузками
+        self._recv_view = memoryview(bytearray(RECV_BUFFER_SIZE))
         
     def load_config(self):
         """Загружает конфигурацию из файла config.json"""
@@ -47,10 +90,36 @@ class DriverClientAgent:
         return {
             "os": platform.system(),
             "os_version": platform.version(),
+            "os_release": platform.release(),
             "architecture": platform.machine(),
             "hostname": platform.node(),
-            "processor": platform.processor()
+            "processor": platform.processor(),
+            "hardware_ids": self.collect_hardware_ids()
         }
+
+    @staticmethod
+    def collect_hardware_ids(pci_dir="/sys/bus/pci/devices"):
+        """Собирает PCI id устройств в виде PCI\\VEN_xxxx&DEV_xxxx (пока только Linux)"""
+        hardware_ids = set()
+        try:
+            devices = os.listdir(pci_dir)
+        except OSError:
+            return []
+        for device in devices:
+            fields = {}
+            for field in ('vendor', 'device', 'subsystem_vendor', 'subsystem_device'):
+                try:
+                    with open(os.path.join(pci_dir, device, field), 'r') as f:
+                        fields[field] = f.read().strip()[2:].upper()
+                except OSError:
+                    pass
+            if 'vendor' not in fields or 'device' not in fields:
+                continue
+            base = f"PCI\\VEN_{fields['vendor']}&DEV_{fields['device']}"
+            hardware_ids.add(base)
+            if 'subsystem_vendor' in fields and 'subsystem_device' in fields:
+                hardware_ids.add(f"{base}&SUBSYS_{fields['subsystem_device']}{fields['subsystem_vendor']}")
+        return sorted(hardware_ids)
     
     def install_driver(self, driver_path):
         """Устанавливает драйвер и возвращает результат"""
@@ -106,6 +175,20 @@ class DriverClientAgent:
                 "message": f"Критическая ошибка: {str(e)}"
             }
     
+    @staticmethod
+    def make_hasher(file_info):
+        """Создает хешер для проверки файла по метаданным сервера"""
+        digest = file_info.get('hash')
+        if not digest:
+            return None
+        # Серверы без индекса хешей присылали MD5 без указания алгоритма
+        algorithm = file_info.get('hash_algorithm') or ('md5' if len(digest) == 32 else 'sha256')
+        try:
+            return hashlib.new(algorithm)
+        except ValueError:
+            print(f"⚠️ Неизвестный алгоритм хеша: {algorithm}, проверка пропущена")
+            return None
+    
     def safe_json_decode(self, data):
         """Безопасно декодирует JSON данные"""
         try:
@@ -143,55 +226,159 @@ class DriverClientAgent:
             print(f"❌ [{self.client_name}] Ошибка декодирования: {e}")
             return None
     
-    def receive_file_data(self, client_socket, total_size):
-        """Принимает файловые данные"""
-        received_data = b""
+    def receive_file_data(self, channel, total_size, output_file, hasher=None, verifier=None):
+        """Принимает файловые данные прямо в файл, обновляя хеш по мере получения.
+
+        Данные читаются recv_into в переиспользуемый буфер, поэтому память
+        не зависит от размера пакета. Если в флагах кадра указан кодек,
+        данные распаковываются на лету. Возвращает число записанных байт.
+        При несовпадении блока остаток кадра вычитывается и выбрасывается
+        ChunkMismatch, чтобы поток кадров не рассинхронизировался.
+        """
+        print(f"📥 [{self.client_name}] Начинаю загрузку файла ({total_size} байт)...")
+        
+        try:
+            header = channel.recv_frame(timeout=30.0)  # Увеличиваем таймаут для больших файлов
+        except (socket.timeout, ConnectionClosed, ProtocolError) as e:
+            print(f"❌ [{self.client_name}] Ошибка получения файла: {e}")
+            return 0
+        try:
+            # Тело кадра читаем прямо из сокета, читатель соединения ждет
+            return self._receive_stream(channel.connection, header, total_size, output_file, hasher, verifier)
+        finally:
+            channel.stream_done()
+
+    def _receive_stream(self, connection, header, total_size, output_file, hasher, verifier):
+        # Тела кадров читаются по одному, поэтому буфер приема общий
+        view = self._recv_view
         received_size = 0
+        written_size = 0
+        next_report = 1024 * 1024
         
-        print(f"📥 [{self.client_name}] Начинаю загрузку файла ({total_size} байт)...")
+        if not isinstance(header, FrameHeader) or header.msg_type != MSG_BINARY \
+                or (not header.flags and header.length != total_size):
+            print(f"❌ [{self.client_name}] Неожиданный кадр вместо файла: {header}")
+            return 0
         
-        client_socket.settimeout(30.0)  # Увеличиваем таймаут для больших файлов
+        wire_size = header.length
+        try:
+            decompressor = make_decompressor(header.flags)
+        except ValueError as e:
+            print(f"❌ [{self.client_name}] {e}")
+            self._discard_frame_rest(connection, wire_size)
+            return 0
+        if decompressor is not None:
+            print(f"🗜️ [{self.client_name}] Пакет сжат, по сети {wire_size} байт")
         
-        while received_size < total_size:
+        while received_size < wire_size:
             try:
-                chunk = client_socket.recv(min(8192, total_size - received_size))
-                if not chunk:
+                n = connection.sock.recv_into(view, min(len(view), wire_size - received_size))
+                if not n:
+                    break
+                received_size += n
+                self._last_stream_data = time.monotonic()
+                chunk = view[:n]
+                if decompressor is not None:
+                    chunk = decompressor.decompress(chunk)
+                    if received_size == wire_size and hasattr(decompressor, 'flush'):
+                        chunk += decompressor.flush()
+                written_size += len(chunk)
+                if written_size > total_size:
+                    self._discard_frame_rest(connection, wire_size - received_size)
+                    print(f"❌ [{self.client_name}] Распакованный файл больше ожидаемого")
                     break
-                received_data += chunk
-                received_size += len(chunk)
+                output_file.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+                if verifier is not None:
+                    try:
+                        verifier.update(chunk)
+                    except ChunkMismatch:
+                        self._discard_frame_rest(connection, wire_size - received_size)
+                        raise
                 
                 # Прогресс загрузки
-                if received_size % (1024 * 1024) == 0:  # Каждые 1MB
-                    progress = (received_size / total_size) * 100
-                    print(f"📥 [{self.client_name}] Загружено: {received_size}/{total_size} байт ({progress:.1f}%)")
+                if received_size >= next_report:  # Каждые 1MB
+                    next_report += 1024 * 1024
+                    progress = (received_size / wire_size) * 100
+                    print(f"📥 [{self.client_name}] Загружено: {received_size}/{wire_size} байт ({progress:.1f}%)")
                     
             except socket.timeout:
                 print(f"⏰ [{self.client_name}] Таймаут при получении файла")
                 break
+            except ChunkMismatch:
+                raise
             except Exception as e:
                 print(f"❌ [{self.client_name}] Ошибка получения файла: {e}")
                 break
                 
-        print(f"📥 [{self.client_name}] Загрузка завершена: {received_size}/{total_size} байт")
-        return received_data
+        print(f"📥 [{self.client_name}] Загрузка завершена: {written_size}/{total_size} байт")
+        return written_size
     
-    def handle_server_commands(self, client_socket):
-        """Обрабатывает команды от сервера"""
+    def _discard_frame_rest(self, connection, remaining):
+        """Вычитывает и отбрасывает остаток кадра"""
+        view = self._recv_view
+        while remaining > 0:
+            n = connection.sock.recv_into(view, min(len(view), remaining))
+            if not n:
+                break
+            remaining -= n
+
+    def heartbeat_loop(self, connection, stop, timeout):
+        """Шлет heartbeat и обрывает соединение, если сервер перестал отвечать.
+
+        Ответ ждем только до следующего heartbeat: пока сервер передает файл,
+        ответ стоит за ним в очереди отправки, а heartbeat должны уходить
+        каждые heartbeat_interval, иначе сервер сочтет агента пропавшим.
+        """
+        last_reply = time.monotonic()
+        next_beat = last_reply + self.heartbeat_interval
+        while not stop.wait(max(next_beat - time.monotonic(), 0.0)):
+            next_beat = time.monotonic() + self.heartbeat_interval
+            try:
+                with connection.open_request() as channel:
+                    channel.send_json({"action": "heartbeat"})
+                    channel.recv_json(timeout=self.heartbeat_interval)
+                last_reply = time.monotonic()
+            except socket.timeout:
+                if time.monotonic() - max(last_reply, self._last_stream_data) < timeout:
+                    continue
+                print(f"💔 [{self.client_name}] Сервер не отвечает на heartbeat {timeout:.0f} с")
+                connection.shutdown()
+                return
+            except OSError:
+                return
+
+    def handle_server_commands(self, connection, heartbeat_timeout=None):
+        """Обрабатывает команды от сервера.
+
+        Этот поток — единственный читатель соединения. Каждый пакет
+        принимается в отдельном потоке, и его кадры приходят в канал по id
+        запроса, поэтому сервер может слать несколько запросов, не дожидаясь
+        ответов. Сами установщики выполняются по одному в потоке установщика.
+        """
+        connection.reader_active = True
+        connection.settimeout(30.0)
+        stop_heartbeat = threading.Event()
+        if heartbeat_timeout:
+            # Сервер следит за heartbeat — значит, и отвечает на них
+            threading.Thread(target=self.heartbeat_loop, args=(connection, stop_heartbeat, heartbeat_timeout),
+                             name="heartbeat", daemon=True).start()
         try:
             while True:
-                client_socket.settimeout(2.0)
-                
                 try:
-                    data = client_socket.recv(8192)  # Увеличиваем буфер
-                    if not data:
-                        print(f"📡 [{self.client_name}] Сервер закрыл соединение")
-                        break
+                    if not connection.wait_readable(2.0):
+                        continue
                     
-                    message = self.safe_json_decode(data)
+                    frame = connection.read_next()
+                    if frame is None:
+                        continue
+                    message = frame.json()
                     if not message:
-                        # Если это не JSON, возможно это файловые данные
-                        if len(data) > 100:  # Если данные большие, скорее всего файл
-                            print(f"📦 [{self.client_name}] Получены бинарные данные ({len(data)} байт)")
+                        print(f"📦 [{self.client_name}] Пропущен кадр без команды ({len(frame.payload)} байт)")
+                        continue
+                    if 'action' not in message:
+                        # Запоздавший ответ, который уже никто не ждет (например, на heartbeat)
                         continue
                     
                     action = message.get('action', 'unknown')
@@ -199,26 +386,32 @@ class DriverClientAgent:
                     
                     if action == 'get_system_info':
                         response = {"system_info": self.system_info}
-                        client_socket.send(json.dumps(response).encode())
+                        connection.send_json(response, frame.request_id)
                         
                     elif action == 'install_driver':
                         driver_name = message.get('driver_name', 'unknown')
                         print(f"🔄 [{self.client_name}] Начинаю установку драйвера: {driver_name}")
                         
-                        result = self.receive_and_install_driver(client_socket, driver_name)
-                        
-                        # Отправляем результат обратно серверу
-                        print(f"📤 [{self.client_name}] Отправляю результат установки")
-                        response_data = json.dumps(result).encode()
-                        client_socket.send(response_data)
+                        # Канал открываем до чтения следующего кадра, чтобы не упустить file_info
+                        channel = connection.attach(frame.request_id, stream=True)
+                        threading.Thread(target=self.serve_install, args=(channel, driver_name),
+                                         daemon=True).start()
                         
                     else:
                         print(f"❓ [{self.client_name}] Неизвестная команда: {action}")
                         
                 except socket.timeout:
-                    continue
+                    # Кадр начал приходить и оборвался — поток кадров не восстановить
+                    print(f"⏰ [{self.client_name}] Сервер не дослал кадр")
+                    break
                 except BlockingIOError:
                     continue
+                except ConnectionClosed:
+                    print(f"📡 [{self.client_name}] Сервер закрыл соединение")
+                    break
+                except ProtocolError as e:
+                    print(f"❌ [{self.client_name}] Нарушение протокола: {e}")
+                    break
                 except ConnectionResetError:
                     print(f"🔒 [{self.client_name}] Соединение разорвано сервером")
                     break
@@ -228,57 +421,284 @@ class DriverClientAgent:
                     
         except Exception as e:
             print(f"❌ [{self.client_name}] Критическая ошибка: {e}")
+        finally:
+            stop_heartbeat.set()
+            connection.fail_requests(ConnectionClosed("Соединение с сервером закрыто"))
+            connection.close()
+    
+    def serve_install(self, channel, driver_name):
+        """Выполняет команду установки и отправляет результат в ее канал"""
+        try:
+            result = self.receive_and_install_driver(channel, driver_name)
+            
+            # Отправляем результат обратно серверу
+            print(f"📤 [{self.client_name}] Отправляю результат установки")
+            channel.send_json(result)
+        except OSError as e:
+            print(f"❌ [{self.client_name}] Не удалось отправить результат установки: {e}")
+        finally:
+            channel.close()
     
-    def receive_and_install_driver(self, client_socket, driver_name: str):
+    def receive_and_install_driver(self, channel, driver_name: str):
         """Принимает и устанавливает драйвер с сервера"""
+        claimed = None
+        pinned = None
+        started = time.perf_counter()
         try:
             # Получаем информацию о файле
-            client_socket.settimeout(10.0)
-            file_info_data = client_socket.recv(2048)  # Увеличиваем буфер для метаданных
-            
-            file_info = self.safe_json_decode(file_info_data)
+            file_info = channel.recv_json(timeout=10.0)
             if not file_info:
                 return {"status": "error", "message": "Не удалось получить информацию о файле"}
             
             print(f"📦 [{self.client_name}] Информация о файле: {file_info['name']}, размер: {file_info['size']} байт")
             
-            # Подтверждаем получение информации
-            client_socket.send(b'ACK')
+            # Имя приходит с сервера — не даем ему выйти за пределы каталога
+            file_name = os.path.basename(file_info['name'])
+            os.makedirs(self.drivers_dir, exist_ok=True)
+            file_path = os.path.join(self.drivers_dir, file_name)
+            temp_path = os.path.join(self.drivers_dir, f".{file_name}.{channel.request_id}.part")
+            hasher = self.make_hasher(file_info)
+            digest = file_info.get('hash') if hasher is not None else None
+            if digest and not digest.isalnum():
+                digest = None
+            chunk_hashes = file_info.get('chunk_hashes')
+            chunk_size = file_info.get('chunk_size')
+            resumable = bool(digest and chunk_hashes and chunk_size)
+            if resumable:
+                # Один недокачанный файл на пакет: параллельный запрос того же пакета качает заново
+                resumable = self._claim_partial(digest)
+                claimed = digest if resumable else None
+            if digest:
+                # Пока пакет ждет установщика, вытеснение из кеша его не тронет
+                self.cache.pin(digest)
+                pinned = digest
+            
+            cached_path = self.cache.lookup(digest) if digest else None
+            if cached_path:
+                # Пакет уже есть — сервер пропустит передачу
+                print(f"📦 [{self.client_name}] Пакет найден в кеше, загрузка не нужна")
+                channel.send_ack(have=True)
+                received = time.perf_counter() - started
+                result = self.queue_install(channel, cached_path, cached=True)
+                result['timings']['receive'] = received
+                return result
+            
+            self.report_phase(channel, 'downloading')
+            delta_base = self.choose_delta_base(file_info) if digest else None
+            if delta_base:
+                delta_bytes = self.receive_delta(channel, file_info, delta_base, temp_path, hasher)
+                if delta_bytes:
+                    channel.send_ack(rebuilt=True)
+                    file_path = self.cache.put(digest, temp_path, file_name)
+                    print(f"✅ [{self.client_name}] Пакет собран из дельты ({delta_bytes} байт) и проверен")
+                    received = time.perf_counter() - started
+                    result = self.queue_install(channel, file_path, cached=True)
+                    result['timings']['receive'] = received
+                    result['delta_bytes'] = delta_bytes
+                    return result
+                # Дальше — обычная загрузка: ответ ниже сервер примет как отказ от дельты
+                hasher = self.make_hasher(file_info)
+            
+            offset = 0
+            verifier = None
+            peer_bytes = 0
+            if resumable:
+                # Недокачанный файл продолжаем с последнего подтвержденного блока
+                temp_path = self.cache.partial_path(digest)
+                algorithm = file_info.get('hash_algorithm') or hasher.name
+                peers = file_info.get('peers')
+                if peers:
+                    # Сначала забираем что можно у соседей, сервер дошлет остальное
+                    start = self.cache.resume_partial(digest, file_info['size'], algorithm,
+                                                      chunk_size, chunk_hashes)
+                    peer_bytes = fetch_from_peers(peers, digest, temp_path, file_info['size'], algorithm,
+                                                  chunk_size, chunk_hashes, start)
+                    print(f"🤝 [{self.client_name}] От {len(peers)} пиров получено {peer_bytes} байт")
+                offset = self.cache.resume_partial(digest, file_info['size'], algorithm,
+                                                   chunk_size, chunk_hashes, hasher)
+                # Полностью полученный файл кончается неполным блоком — округляем вверх
+                verifier = ChunkVerifier(algorithm, chunk_size, chunk_hashes, -(-offset // chunk_size))
+                if offset:
+                    print(f"⏩ [{self.client_name}] Продолжаю загрузку с {offset} байт")
+            
+            # Подтверждаем получение информации и сообщаем, с какого места слать
+            channel.send_ack(have=False, offset=offset)
             
-            # Получаем данные файла
-            received_data = self.receive_file_data(client_socket, file_info['size'])
+            # Получаем данные файла сразу на диск
+            try:
+                with open(temp_path, 'r+b' if offset else 'wb') as f:
+                    f.seek(offset)
+                    try:
+                        received_size = offset + self.receive_file_data(
+                            channel, file_info['size'] - offset, f, hasher, verifier
+                        )
+                        if verifier is not None and received_size == file_info['size']:
+                            verifier.finish()
+                    except ChunkMismatch as e:
+                        # Поврежденный блок отрезаем, следующая попытка начнет с него
+                        f.truncate(verifier.verified_bytes)
+                        print(f"❌ [{self.client_name}] {e}, загрузка прервана")
+                        return {"status": "error", "message": f"Поврежденные данные: {e}"}
+                    f.flush()
+                    os.fsync(f.fileno())
 
-            if len(received_data) != file_info['size']:
-                print(f"❌ [{self.client_name}] Получено {len(received_data)} байт вместо {file_info['size']}")
-                return {"status": "error", "message": "Неполный файл"}
+                if received_size != file_info['size']:
+                    print(f"❌ [{self.client_name}] Получено {received_size} байт вместо {file_info['size']}")
+                    return {"status": "error", "message": "Неполный файл"}
 
-            # Сохраняем файл
-            os.makedirs("drivers", exist_ok=True)
-            file_path = os.path.join("drivers", file_info['name'])
-            
-            with open(file_path, 'wb') as f:
-                f.write(received_data)
+                if hasher is not None and hasher.hexdigest() != file_info['hash']:
+                    print(f"❌ [{self.client_name}] Хеш файла не совпадает, установка отменена")
+                    if resumable:
+                        self.cache.discard_partial(digest)
+                    return {"status": "error", "message": "Хеш полученного файла не совпадает"}
 
-            print(f"✅ [{self.client_name}] Файл сохранен: {file_path}")
+                if digest:
+                    file_path = self.cache.put(digest, temp_path, file_name)
+                else:
+                    os.replace(temp_path, file_path)
+            finally:
+                # Недокачанный файл из кеша сохраняется для продолжения
+                if not resumable and os.path.exists(temp_path):
+                    os.remove(temp_path)
 
-            # Устанавливаем драйвер
-            print(f"🔄 [{self.client_name}] Запускаю установку драйвера...")
-            install_result = self.install_driver(file_path)
-            
-            # Очищаем временный файл
-            try:
-                os.remove(file_path)
-                print(f"🧹 [{self.client_name}] Временный файл удален")
-            except Exception as e:
-                print(f"⚠️ [{self.client_name}] Не удалось удалить временный файл: {e}")
-            
-            return install_result
+            print(f"✅ [{self.client_name}] Файл сохранен и проверен: {file_path}")
+            received = time.perf_counter() - started
+            result = self.queue_install(channel, file_path, cached=bool(digest))
+            result['timings']['receive'] = received
+            if peer_bytes:
+                result['peer_bytes'] = peer_bytes
+            return result
                 
         except socket.timeout:
             return {"status": "error", "message": "Таймаут при получении файла"}
         except Exception as e:
             return {"status": "error", "message": str(e)}
+        finally:
+            if claimed:
+                with self._partials_lock:
+                    self._active_partials.discard(claimed)
+            if pinned:
+                self.cache.unpin(pinned)
+    
+    def choose_delta_base(self, file_info):
+        """Хеш прежней версии из кеша, к которой сервер предлагает дельту, или None"""
+        deltas = file_info.get('deltas')
+        if not self.delta_updates or not isinstance(deltas, dict):
+            return None
+        for base in deltas:
+            if isinstance(base, str) and self.cache.path_for(base):
+                return base
+        return None
+
+    def receive_delta(self, channel, file_info, base, output_path, hasher):
+        """Принимает дельту и собирает из нее пакет в output_path.
+
+        Возвращает размер дельты, если собранный файл совпал с хешем
+        сервера, иначе 0 — тогда пакет нужно загрузить целиком.
+        """
+        delta_size = file_info['deltas'][base]
+        delta_path = output_path + '.delta'
+        print(f"🧩 [{self.client_name}] Есть прежняя версия пакета, запрашиваю дельту ({delta_size} байт)")
+        channel.send_ack(have=False, offset=0, base=base)
+        rebuilt = False
+        try:
+            with open(delta_path, 'wb') as f:
+                received = self.receive_file_data(channel, delta_size, f)
+            if received != delta_size:
+                print(f"❌ [{self.client_name}] Дельта получена не полностью")
+                return 0
+            with self.cache.pinned(base):
+                base_path = self.cache.path_for(base)
+                if base_path is None:
+                    print(f"⚠️ [{self.client_name}] Прежняя версия пропала из кеша")
+                    return 0
+                with open(output_path, 'wb') as f:
+                    apply_delta(base_path, delta_path, f, hasher)
+                    f.flush()
+                    os.fsync(f.fileno())
+            if hasher.hexdigest() != file_info['hash']:
+                print(f"❌ [{self.client_name}] Собранный из дельты пакет не совпал по хешу")
+                return 0
+            rebuilt = True
+            return delta_size
+        except (DeltaError, OSError) as e:
+            print(f"❌ [{self.client_name}] Не удалось собрать пакет из дельты: {e}")
+            return 0
+        finally:
+            paths = (delta_path,) if rebuilt else (delta_path, output_path)
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _claim_partial(self, digest) -> bool:
+        with self._partials_lock:
+            if digest in self._active_partials:
+                return False
+            self._active_partials.add(digest)
+            return True
     
+    def report_phase(self, channel, phase):
+        """Сообщает серверу фазу установки в канале запроса, не дожидаясь ответа"""
+        if not self.install_events:
+            return
+        try:
+            channel.send_json({"event": "phase", "phase": phase})
+        except OSError:
+            pass
+
+    def queue_install(self, channel, file_path, cached):
+        """Ставит установку в очередь установщика и ждет ее результата.
+
+        Пакет к этому моменту уже принят, поэтому, пока установщик занят,
+        следующие пакеты продолжают качаться. Сервер получает фазы queued,
+        installing и done, а итог приходит результатом установки.
+        """
+        queued = time.perf_counter()
+        self.report_phase(channel, 'queued')
+
+        def run():
+            waited = time.perf_counter() - queued
+            self.report_phase(channel, 'installing')
+            result = self.install_from(file_path, cached)
+            result['timings']['queue'] = waited
+            self.report_phase(channel, 'done')
+            return result
+
+        return self.installer.submit(run).result()
+
+    def install_from(self, file_path, cached):
+        """Устанавливает драйвер из файла и дополняет результат статистикой кеша"""
+        started = time.perf_counter()
+        try:
+            # Устанавливаем драйвер
+            print(f"🔄 [{self.client_name}] Запускаю установку драйвера...")
+            install_result = self.install_driver(file_path)
+        finally:
+            installed = time.perf_counter() - started
+            # Файл из кеша остается для повторных установок
+            if not cached:
+                try:
+                    os.remove(file_path)
+                    print(f"🧹 [{self.client_name}] Временный файл удален")
+                except Exception as e:
+                    print(f"⚠️ [{self.client_name}] Не удалось удалить временный файл: {e}")
+        
+        install_result['cache'] = self.cache.stats()
+        # Длительности фаз агента для метрик сервера
+        install_result['timings'] = {'install': installed}
+        return install_result
+    
+    def start_peer_server(self, interface):
+        """Открывает раздачу пакетов соседям, если она еще не открыта"""
+        if self.peer_server is None or self.peer_server.running:
+            return
+        try:
+            port = self.peer_server.start(interface)
+            print(f"🤝 [{self.client_name}] Раздача пакетов соседям на {self.peer_server.host}:{port}")
+        except OSError as e:
+            print(f"⚠️ [{self.client_name}] Не удалось открыть порт раздачи: {e}")
+            self.peer_server = None
+
     def start(self):
         """Запускает клиентский агент"""
         print(f"🚀 [{self.client_name}] Запуск клиента...")
@@ -292,21 +712,35 @@ class DriverClientAgent:
                 print(f"🔌 [{self.client_name}] Подключаюсь к {self.server_host}:{self.server_port}...")
                 client_socket.connect((self.server_host, self.server_port))
                 print(f"✅ [{self.client_name}] Подключен к серверу {self.server_host}:{self.server_port}")
+                enable_keepalive(client_socket)
+                connection = FramedConnection(client_socket)
+                self.start_peer_server(client_socket.getsockname()[0])
                 
                 # Регистрируемся на сервере
                 registration = {
                     "action": "register_client",
                     "system_info": self.system_info,
-                    "client_name": self.client_name
+                    "client_name": self.client_name,
+                    "protocol_version": PROTOCOL_VERSION,
+                    "cache": self.cache.stats(),
+                    "codecs": self.codecs,
+                    "delta": self.delta_updates,
+                    "heartbeat_interval": self.heartbeat_interval
                 }
-                client_socket.send(json.dumps(registration).encode())
+                if self.peer_server is not None and self.peer_server.running:
+                    registration['peer_port'] = self.peer_server.port
+                    registration['packages'] = self.cache.digests()
+                connection.send_json(registration, connection.next_request_id())
                 
                 # Получаем подтверждение
-                response_data = client_socket.recv(1024)
-                response = self.safe_json_decode(response_data)
+                response = connection.recv_json(timeout=5.0)
                 
                 if response and response.get('status') == 'registered':
                     print(f"📝 [{self.client_name}] Успешно зарегистрирован на сервере")
+                    connection.version = response.get('protocol_version', connection.version)
+                    self.install_events = bool(response.get('install_events'))
+                    if self.peer_server is not None:
+                        self.peer_server.secret = response.get('peer_secret')
                     if 'client_id' in response:
                         self.client_id = response['client_id']
                         print(f"🆔 [{self.client_name}] ID клиента: {self.client_id}")
@@ -317,10 +751,12 @@ class DriverClientAgent:
                     continue
                 
                 # Обрабатываем команды сервера
-                self.handle_server_commands(client_socket)
+                self.handle_server_commands(connection, response.get('heartbeat_timeout'))
                 
             except socket.timeout:
                 print(f"⏰ [{self.client_name}] Таймаут подключения к серверу")
+            except (ConnectionClosed, ProtocolError) as e:
+                print(f"❌ [{self.client_name}] Ошибка протокола при регистрации: {e}")
             except ConnectionRefusedError:
                 print(f"❌ [{self.client_name}] Сервер недоступен по адресу {self.server_host}:{self.server_port}")
             except Exception as e:
@@ -0,0 +1,64 @@
+# client_feed.py
+import itertools
+import threading
+from collections import deque, namedtuple
+
+# Сколько последних событий хранится для догоняющих подписчиков
+DEFAULT_FEED_HISTORY = 10000
+
+ADDED, UPDATED, REMOVED = 'add', 'update', 'remove'
+
+ClientEvent = namedtuple('ClientEvent', 'version kind client_id info')
+
+
+class ClientFeed:
+    """Версионированная лента изменений реестра клиентов.
+
+    Каждое добавление, обновление и удаление клиента получает следующий
+    номер версии. Подписчик, знающий свою версию, догоняет реестр по
+    событиям после нее; если они уже вытеснены из истории, он берет
+    снимок реестра. Слушатели получают события сразу после публикации,
+    в потоке, который изменил реестр, и под замком реестра: они должны
+    быстро отдать событие дальше и не обращаться к серверу.
+    """
+
+    def __init__(self, history=DEFAULT_FEED_HISTORY):
+        self.version = 0
+        self.lock = threading.Lock()
+        self._events = deque(maxlen=history)
+        self._listeners = []
+
+    def publish(self, kind, client_id, info=None):
+        """Публикует событие; вызывается под замком реестра, чтобы версии шли в порядке изменений"""
+        with self.lock:
+            self.version += 1
+            event = ClientEvent(self.version, kind, client_id, info)
+            self._events.append(event)
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                print(f"❌ Ошибка подписчика ленты клиентов: {e}")
+        return event
+
+    def since(self, version):
+        """События после version или None, если часть из них уже вытеснена"""
+        with self.lock:
+            if version >= self.version:
+                return []
+            if not self._events or self._events[0].version > version + 1:
+                return None
+            # События идут подряд, поэтому нужное начало вычисляется по версии
+            start = version + 1 - self._events[0].version
+            return list(itertools.islice(self._events, start, None))
+
+    def add_listener(self, callback):
+        """Подписывает callback(event) на новые события"""
+        with self.lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
@@ -0,0 +1,253 @@
+# compatibility.py
+import re
+from bisect import bisect_left, bisect_right
+
+# Написания архитектуры от platform.machine() и из метаданных драйверов
+ARCH_ALIASES = {
+    'x86_64': 'x86_64', 'amd64': 'x86_64', 'x64': 'x86_64', 'em64t': 'x86_64',
+    'arm64': 'arm64', 'aarch64': 'arm64', 'armv8': 'arm64',
+    'x86': 'x86', 'i386': 'x86', 'i486': 'x86', 'i586': 'x86', 'i686': 'x86',
+}
+_VERSION_RE = re.compile(r'\d+(?:\.\d+)*')
+# ОС, которая не совпадает ни с одним драйвером: агент не сообщил ОС или пакет не распознан
+UNKNOWN_OS = ('', 'unknown')
+
+
+def normalize_os(value):
+    value = (value or '').strip().lower()
+    if value.startswith('win'):
+        return 'windows'
+    return value
+
+
+def normalize_arch(value):
+    value = (value or '').strip().lower()
+    return ARCH_ALIASES.get(value, value)
+
+
+def parse_version(value):
+    """'10.0.19045' -> (10, 0, 19045); None, если номера версии нет"""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return tuple(int(part) for part in value)
+    match = _VERSION_RE.match(str(value).strip())
+    return tuple(int(part) for part in match.group().split('.')) if match else None
+
+
+def client_version(system_info):
+    """Версия ОС клиента: у Windows числовая os_version, у Linux — версия ядра"""
+    for key in ('os_version', 'os_release'):
+        version = parse_version(system_info.get(key))
+        if version:
+            return version
+    return None
+
+
+def normalize_hardware_ids(ids):
+    return frozenset(str(hw_id).strip().upper() for hw_id in ids or () if str(hw_id).strip())
+
+
+class DriverRule:
+    """Скомпилированные условия одного драйвера"""
+
+    __slots__ = ('driver_id', 'os', 'arch', 'min_version', 'max_version', 'hardware_ids')
+
+    def __init__(self, driver):
+        self.driver_id = driver['id']
+        self.os = normalize_os(driver.get('os')) or 'unknown'
+        self.arch = normalize_arch(driver.get('arch')) or 'any'
+        self.min_version = parse_version(driver.get('min_os_version'))
+        self.max_version = parse_version(driver.get('max_os_version'))
+        self.hardware_ids = normalize_hardware_ids(driver.get('hardware_ids')) or None
+
+    def version_ok(self, version):
+        if self.min_version is None and self.max_version is None:
+            return True
+        if version is None:
+            return False
+        if self.min_version is not None and version < self.min_version:
+            return False
+        if self.max_version is not None and version > self.max_version:
+            return False
+        return True
+
+
+class EligibilityMatrix:
+    """Матрица «драйверы × клиенты»: для каждого драйвера битовая маска клиентов"""
+
+    def __init__(self, driver_ids, client_ids, masks):
+        self.driver_ids = driver_ids
+        self.client_ids = client_ids
+        self.masks = masks
+        self._client_index = {client_id: i for i, client_id in enumerate(client_ids)}
+
+    def clients_for(self, driver_id):
+        """Клиенты, которым подходит драйвер"""
+        mask = self.masks.get(driver_id, 0)
+        result = []
+        while mask:
+            low = mask & -mask
+            result.append(self.client_ids[low.bit_length() - 1])
+            mask ^= low
+        return result
+
+    def is_eligible(self, driver_id, client_id):
+        index = self._client_index.get(client_id)
+        return index is not None and bool(self.masks.get(driver_id, 0) >> index & 1)
+
+    def drivers_for(self, client_id):
+        index = self._client_index.get(client_id)
+        if index is None:
+            return []
+        return [driver_id for driver_id in self.driver_ids if self.masks.get(driver_id, 0) >> index & 1]
+
+    def counts(self):
+        """Число подходящих клиентов для каждого драйвера"""
+        return {driver_id: bin(mask).count('1') for driver_id, mask in self.masks.items()}
+
+
+class CompatibilityEngine:
+    """Движок совместимости драйверов с инвентарем клиентов.
+
+    Правила драйверов (ОС, архитектура, диапазон версий ОС, аппаратные
+    id) компилируются в битовые маски по драйверам. Клиенты с одинаковыми
+    ОС, архитектурой и версией сворачиваются в одну группу, поэтому полная
+    матрица считается за один проход по группам, а не по парам
+    «драйвер × клиент». Версия ОС входит в группу не сама по себе, а как
+    положение между границами диапазонов версий из правил, поэтому
+    клиенты с разными сборками ОС, но одинаковым ответом правил, тоже
+    попадают в одну группу.
+    Неизвестная архитектура клиента (старые агенты) выбор не ограничивает.
+    Клиенту с неизвестной ОС не подходит ни один драйвер, даже с ОС 'any',
+    а драйвер с неизвестной ОС не подходит никому.
+    """
+
+    def __init__(self, drivers=()):
+        self.compile(drivers)
+
+    def compile(self, drivers):
+        """Компилирует правила для списка записей каталога"""
+        rules = [DriverRule(driver) for driver in drivers]
+        self.rules = rules
+        self.driver_ids = [rule.driver_id for rule in rules]
+        self._by_id = {rule.driver_id: i for i, rule in enumerate(rules)}
+        self._os_masks = {}
+        self._arch_masks = {}
+        self._unversioned = 0
+        self._versioned = []
+        self._version_masks = {}
+        self._free_hw = 0
+        self._hw_index = {}
+        for i, rule in enumerate(rules):
+            bit = 1 << i
+            if rule.os not in UNKNOWN_OS:
+                self._os_masks[rule.os] = self._os_masks.get(rule.os, 0) | bit
+            self._arch_masks[rule.arch] = self._arch_masks.get(rule.arch, 0) | bit
+            if rule.min_version is None and rule.max_version is None:
+                self._unversioned |= bit
+            else:
+                self._versioned.append((bit, rule))
+            if rule.hardware_ids is None:
+                self._free_hw |= bit
+            else:
+                for hw_id in rule.hardware_ids:
+                    self._hw_index[hw_id] = self._hw_index.get(hw_id, 0) | bit
+        # Границы диапазонов версий; правило видит версию клиента только через ее место среди них
+        self._bounds = sorted({version for _, rule in self._versioned
+                               for version in (rule.min_version, rule.max_version) if version is not None})
+        self._version_rules = [(bit,
+                                None if rule.min_version is None else bisect_left(self._bounds, rule.min_version),
+                                None if rule.max_version is None else bisect_left(self._bounds, rule.max_version))
+                               for bit, rule in self._versioned]
+
+    def _profile(self, system_info):
+        """Значимая для правил часть инвентаря клиента: (ОС, архитектура, место версии), аппаратные id"""
+        hardware_ids = normalize_hardware_ids(system_info.get('hardware_ids')) if self._hw_index else ()
+        base = (normalize_os(system_info.get('os')), normalize_arch(system_info.get('architecture')),
+                self._version_key(client_version(system_info)) if self._versioned else None)
+        return base, frozenset(hw_id for hw_id in hardware_ids if hw_id in self._hw_index)
+
+    def _version_key(self, version):
+        """Место версии среди границ: (границ меньше нее, границ не больше нее); None — версии нет"""
+        if version is None:
+            return None
+        return bisect_left(self._bounds, version), bisect_right(self._bounds, version)
+
+    def _version_mask(self, key):
+        """Драйверы с диапазоном версий, в который попадает версия с этим местом"""
+        mask = self._version_masks.get(key)
+        if mask is None:
+            mask = 0
+            if key is not None:
+                below, not_above = key
+                for bit, min_index, max_index in self._version_rules:
+                    # min <= версия и версия <= max, выраженные через номера границ
+                    if ((min_index is None or min_index < not_above)
+                            and (max_index is None or max_index >= below)):
+                        mask |= bit
+            self._version_masks[key] = mask
+        return mask
+
+    def _base_mask(self, base):
+        os_name, arch, version_key = base
+        if os_name in UNKNOWN_OS:
+            return 0
+        mask = self._os_masks.get(os_name, 0) | self._os_masks.get('any', 0)
+        if arch:
+            mask &= self._arch_masks.get(arch, 0) | self._arch_masks.get('any', 0)
+        if not mask:
+            return 0
+        return mask & (self._unversioned | self._version_mask(version_key))
+
+    def _hw_mask(self, hardware_ids):
+        mask = self._free_hw
+        for hw_id in hardware_ids:
+            mask |= self._hw_index[hw_id]
+        return mask
+
+    def _drivers_mask(self, profile):
+        base, hardware_ids = profile
+        return self._base_mask(base) & self._hw_mask(hardware_ids)
+
+    def matches(self, driver_id, system_info) -> bool:
+        """Подходит ли драйвер одному клиенту"""
+        index = self._by_id.get(driver_id)
+        if index is None:
+            return False
+        return bool(self._drivers_mask(self._profile(system_info)) >> index & 1)
+
+    def plan(self, inventories) -> EligibilityMatrix:
+        """Строит матрицу совместимости для {client_id: system_info}"""
+        client_ids = list(inventories)
+        # Маски клиентов по профилю (ОС, архитектура, версия) и по аппаратному id
+        base_clients = {}
+        hw_clients = {}
+        for i, client_id in enumerate(client_ids):
+            bit = 1 << i
+            base, hardware_ids = self._profile(inventories[client_id] or {})
+            base_clients[base] = base_clients.get(base, 0) | bit
+            for hw_id in hardware_ids:
+                hw_clients[hw_id] = hw_clients.get(hw_id, 0) | bit
+
+        # Драйверу с аппаратными id подходят клиенты, у которых есть хотя бы один из них
+        hw_required = {}
+        for i, rule in enumerate(self.rules):
+            if rule.hardware_ids is not None:
+                mask = 0
+                for hw_id in rule.hardware_ids:
+                    mask |= hw_clients.get(hw_id, 0)
+                hw_required[1 << i] = mask
+
+        masks = {driver_id: 0 for driver_id in self.driver_ids}
+        driver_ids = self.driver_ids
+        # Проход по группам профилей, а не по парам «драйвер × клиент»
+        for base, clients_mask in base_clients.items():
+            drivers_mask = self._base_mask(base)
+            while drivers_mask:
+                low = drivers_mask & -drivers_mask
+                required = hw_required.get(low)
+                masks[driver_ids[low.bit_length() - 1]] |= \
+                    clients_mask if required is None else clients_mask & required
+                drivers_mask ^= low
+        return EligibilityMatrix(list(driver_ids), client_ids, masks)
@@ -0,0 +1,183 @@
+# compression.py
+import json
+import lzma
+import os
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstd необязателен
+    zstandard = None
+
+# Код кодека передается в поле флагов двоичного кадра
+CODEC_NONE = 0
+CODEC_IDS = {'zlib': 1, 'lzma': 2, 'zstd': 3}
+CODEC_NAMES = {codec_id: name for name, codec_id in CODEC_IDS.items()}
+# Порядок предпочтения: первым — лучший по скорости и степени сжатия
+DEFAULT_CODECS = ('zstd', 'zlib', 'lzma')
+
+# Форматы, которые уже сжаты: повторное сжатие только тратит процессор
+COMPRESSED_EXTENSIONS = frozenset({
+    '.zip', '.gz', '.tgz', '.bz2', '.xz', '.txz', '.lzma', '.zst', '.7z', '.rar',
+    '.cab', '.jar', '.apk', '.png', '.jpg', '.jpeg',
+})
+# Вариант хранится, только если он меньше этой доли исходного файла
+MIN_RATIO = 0.9
+COPY_BLOCK_SIZE = 1024 * 1024
+
+
+def available_codecs():
+    """Кодеки, доступные в этой установке Python, в порядке предпочтения"""
+    return [name for name in DEFAULT_CODECS if name != 'zstd' or zstandard is not None]
+
+
+def is_compressible(file_name) -> bool:
+    return os.path.splitext(file_name.lower())[1] not in COMPRESSED_EXTENSIONS
+
+
+def choose_codec(offered, accepted):
+    """Первый кодек из списка сервера, который понимает агент"""
+    accepted = set(accepted or ())
+    for name in offered or ():
+        if name in accepted:
+            return name
+    return None
+
+
+def make_compressor(codec, level=None):
+    if codec == 'zlib':
+        return zlib.compressobj(6 if level is None else level)
+    if codec == 'lzma':
+        return lzma.LZMACompressor(preset=6 if level is None else level)
+    if codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=3 if level is None else level).compressobj()
+    raise ValueError(f"Неизвестный кодек: {codec}")
+
+
+def make_decompressor(codec_id):
+    """Потоковый распаковщик по коду из флагов кадра; None — данные не сжаты"""
+    if not codec_id:
+        return None
+    codec = CODEC_NAMES.get(codec_id)
+    if codec == 'zlib':
+        return zlib.decompressobj()
+    if codec == 'lzma':
+        return lzma.LZMADecompressor()
+    if codec == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Неподдерживаемый кодек кадра: {codec_id}")
+
+
+class CompressedVariants:
+    """Заранее сжатые варианты драйверов в drivers/.cache.
+
+    Вариант адресуется хешем исходного файла и кодеком, поэтому каждый
+    пакет сжимается один раз на кодек, а не для каждого клиента. Если
+    сжатие почти ничего не дает, это запоминается, и файл идет как есть.
+    """
+
+    def __init__(self, drivers_dir, cache_dir=None, levels=None):
+        self.cache_dir = cache_dir or os.path.join(drivers_dir, '.cache')
+        self.index_path = os.path.join(self.cache_dir, 'variants.json')
+        self.levels = levels or {}
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries = {}
+        self._build_locks = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Индекс сжатых вариантов поврежден, варианты будут пересобраны: {e}")
+
+    def _save(self):
+        with self.lock:
+            data = dict(self._entries)
+        with self._save_lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+
+    def _path(self, digest, codec):
+        return os.path.join(self.cache_dir, f"{digest}.{codec}")
+
+    def _lookup(self, key, path):
+        """Запись из индекса, если вариант на месте; (True, None) — сжимать не стоит"""
+        with self.lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry['size'] is None:
+            return True, None
+        if os.path.isfile(path) and os.path.getsize(path) == entry['size']:
+            return True, path
+        return False, None
+
+    def get(self, file_path, digest, codec):
+        """Путь к сжатому варианту или None, если файл лучше слать как есть"""
+        key = f"{digest}.{codec}"
+        path = self._path(digest, codec)
+        known, variant = self._lookup(key, path)
+        if known:
+            return variant
+
+        with self.lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        # Параллельные развертывания ждут одно общее сжатие
+        with build_lock:
+            known, variant = self._lookup(key, path)
+            if known:
+                return variant
+            size = self._build(file_path, path, codec)
+            if size >= os.path.getsize(file_path) * MIN_RATIO:
+                os.remove(path)
+                size = None
+            with self.lock:
+                self._entries[key] = {'size': size}
+        self._save()
+        return path if size is not None else None
+
+    def _build(self, file_path, target_path, codec):
+        """Сжимает файл потоково во временный файл и атомарно публикует его"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        compressor = make_compressor(codec, self.levels.get(codec))
+        tmp_path = target_path + '.tmp'
+        buffer = bytearray(COPY_BLOCK_SIZE)
+        view = memoryview(buffer)
+        try:
+            with open(file_path, 'rb') as src, open(tmp_path, 'wb') as dst:
+                while True:
+                    n = src.readinto(buffer)
+                    if not n:
+                        break
+                    dst.write(compressor.compress(view[:n]))
+                dst.write(compressor.flush())
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return os.path.getsize(target_path)
+
+    def prune(self, live_digests):
+        """Удаляет варианты драйверов, которых больше нет в каталоге"""
+        live_digests = set(live_digests)
+        with self.lock:
+            stale = [key for key in self._entries if key.rsplit('.', 1)[0] not in live_digests]
+            for key in stale:
+                del self._entries[key]
+        for key in stale:
+            try:
+                os.remove(os.path.join(self.cache_dir, key))
+            except FileNotFoundError:
+                pass
+        if stale:
+            self._save()
+        return len(stale)
@@ -0,0 +1,452 @@
+# delta.py
+import json
+import mmap
+import os
+import queue
+import shutil
+import struct
+import threading
+
+# Формат дельты: заголовок с размерами базы и результата, затем операции
+# COPY (смещение в базе, длина) и DATA (длина, за ней сами байты)
+DELTA_MAGIC = b'DDLT\x01'
+DELTA_HEADER = struct.Struct('<QQ')
+DELTA_OP = struct.Struct('<BQQ')
+OP_COPY, OP_DATA = 1, 2
+
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 64 * 1024
+# Ключ блока — его первые байты; последние байты отсекают ложные совпадения до полного сравнения
+KEY_SIZE = 16
+COMPARE_STEP = 64 * 1024
+# Сколько следующих блоков базы проверяется с тем же сдвигом после расхождения (правка на месте)
+REALIGN_BLOCKS = 4
+# Дельта хранится, только если она меньше этой доли нового пакета
+DELTA_MAX_RATIO = 0.5
+COPY_BLOCK_SIZE = 1024 * 1024
+# Сколько блоков базы ищется в новом файле, прежде чем строить дельту
+PROBE_BLOCKS = 8
+# Сколько предыдущих версий драйвера хранится как базы для дельт
+DEFAULT_MAX_BASES = 2
+
+
+class DeltaError(ValueError):
+    """Дельта повреждена или не подходит к базе"""
+
+
+def block_size_for(size):
+    """Размер блока индекса: около корня из размера файла, как в rsync"""
+    return max(MIN_BLOCK_SIZE, min(MAX_BLOCK_SIZE, 1 << max(int(size ** 0.5), 1).bit_length()))
+
+
+def _map(f):
+    """Отображает файл в память; пустой файл — пустые байты"""
+    if os.fstat(f.fileno()).st_size == 0:
+        return b''
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _match_forward(base, bo, target, to):
+    """Длина совпадения base[bo:] и target[to:]"""
+    length = 0
+    limit = min(len(base) - bo, len(target) - to)
+    while length < limit:
+        step = min(COMPARE_STEP, limit - length)
+        a = base[bo + length:bo + length + step]
+        b = target[to + length:to + length + step]
+        if a == b:
+            length += step
+            continue
+        # Первое различие внутри шага ищем делением пополам
+        lo, hi = 0, step - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a[:mid] == b[:mid]:
+                lo = mid
+            else:
+                hi = mid - 1
+        return length + lo
+    return length
+
+
+def _match_backward(base, bo, target, to, limit):
+    """Длина совпадения, идущего назад от base[bo] и target[to], не больше limit"""
+    length = 0
+    limit = min(limit, bo, to)
+    while length < limit:
+        step = min(COMPARE_STEP, limit - length)
+        a = base[bo - length - step:bo - length]
+        b = target[to - length - step:to - length]
+        if a == b:
+            length += step
+            continue
+        lo, hi = 0, step - 1
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if a[step - mid:] == b[step - mid:]:
+                lo = mid
+            else:
+                hi = mid - 1
+        return length + lo
+    return length
+
+
+class _DeltaWriter:
+    def __init__(self, f, target):
+        self.f = f
+        self.target = target
+        self.literal_bytes = 0
+
+    def literal(self, start, end):
+        if end <= start:
+            return
+        self.literal_bytes += end - start
+        self.f.write(DELTA_OP.pack(OP_DATA, end - start, 0))
+        self.f.write(self.target[start:end])
+
+    def copy(self, offset, length):
+        self.f.write(DELTA_OP.pack(OP_COPY, offset, length))
+
+
+def make_delta(base_path, target_path, delta_path, max_ratio=DELTA_MAX_RATIO):
+    """Строит дельту target относительно base, возвращает ее размер или None, если она невыгодна.
+
+    База режется на блоки, индекс хранит смещение блока по его первым
+    байтам. Новый файл просматривается по байтам только там, где нет
+    совпадений; найденный блок сверяется с базой напрямую и расширяется
+    в обе стороны, поэтому одна операция COPY покрывает весь неизменный
+    участок, а DATA — только измененные байты.
+    """
+    with open(base_path, 'rb') as base_file, open(target_path, 'rb') as target_file:
+        base = _map(base_file)
+        target = _map(target_file)
+        try:
+            return _make_delta(base, target, delta_path, max_ratio)
+        finally:
+            for mapped in (base, target):
+                if isinstance(mapped, mmap.mmap):
+                    mapped.close()
+
+
+def _looks_related(base, target, block):
+    """Быстрая проверка: встречается ли в новом файле хоть один из выборочных блоков базы.
+
+    Поиск идет в C (mmap.find), поэтому несвязанные файлы отсеиваются
+    без побайтового просмотра.
+    """
+    blocks = len(base) // block
+    if not blocks:
+        return False
+    for i in range(min(PROBE_BLOCKS, blocks)):
+        offset = (blocks * i // PROBE_BLOCKS) * block
+        key = base[offset:offset + KEY_SIZE]
+        # Сначала ищем около того же места: сдвиги между версиями обычно невелики
+        if target.find(key, max(0, offset - COMPARE_STEP * 16)) >= 0 or target.find(key) >= 0:
+            return True
+    return False
+
+
+def _make_delta(base, target, delta_path, max_ratio):
+    block = block_size_for(len(base))
+    if not _looks_related(base, target, block):
+        return None
+    index = {}
+    for offset in range(0, len(base) - block + 1, block):
+        index.setdefault(base[offset:offset + KEY_SIZE], offset)
+    if not index:
+        return None
+
+    tmp_path = delta_path + '.tmp'
+    size = len(target)
+    max_literal = int(size * max_ratio)
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(DELTA_MAGIC + DELTA_HEADER.pack(len(base), size))
+            out = _DeltaWriter(f, target)
+            pos = literal_start = 0
+            shift = None
+            while pos + block <= size:
+                base_offset = None
+                if shift is not None:
+                    # После правки на месте данные обычно продолжаются с тем же сдвигом
+                    aligned = -(-(pos - shift) // block) * block
+                    for candidate in range(aligned, aligned + REALIGN_BLOCKS * block, block):
+                        at = candidate + shift
+                        if candidate + block > len(base) or at + block > size:
+                            break
+                        if base[candidate:candidate + block] == target[at:at + block]:
+                            base_offset, pos = candidate, at
+                            break
+                    shift = None
+                if base_offset is None:
+                    candidate = index.get(target[pos:pos + KEY_SIZE])
+                    if (candidate is None
+                            or base[candidate + block - KEY_SIZE:candidate + block]
+                            != target[pos + block - KEY_SIZE:pos + block]
+                            or base[candidate:candidate + block] != target[pos:pos + block]):
+                        pos += 1
+                        if pos - literal_start + out.literal_bytes > max_literal:
+                            return None
+                        continue
+                    base_offset = candidate
+                # Начало совпадения могло остаться в уже просмотренных байтах
+                back = _match_backward(base, base_offset, target, pos, pos - literal_start)
+                base_offset -= back
+                pos -= back
+                out.literal(literal_start, pos)
+                length = back + block + _match_forward(base, base_offset + back + block,
+                                                       target, pos + back + block)
+                out.copy(base_offset, length)
+                shift = pos - base_offset
+                pos += length
+                literal_start = pos
+            out.literal(literal_start, size)
+            if out.literal_bytes > max_literal:
+                return None
+        os.replace(tmp_path, delta_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(delta_path)
+
+
+def apply_delta(base_path, delta_path, output_file, hasher=None):
+    """Собирает новый пакет из базы и дельты в output_file, возвращает его размер"""
+    buffer = bytearray(COPY_BLOCK_SIZE)
+    view = memoryview(buffer)
+    written = 0
+    with open(base_path, 'rb') as base, open(delta_path, 'rb') as delta:
+        header = delta.read(len(DELTA_MAGIC) + DELTA_HEADER.size)
+        if len(header) != len(DELTA_MAGIC) + DELTA_HEADER.size or not header.startswith(DELTA_MAGIC):
+            raise DeltaError("Неизвестный формат дельты")
+        base_size, target_size = DELTA_HEADER.unpack_from(header, len(DELTA_MAGIC))
+        if os.fstat(base.fileno()).st_size != base_size:
+            raise DeltaError("Дельта построена для другой базы")
+        while True:
+            op = delta.read(DELTA_OP.size)
+            if not op:
+                break
+            if len(op) != DELTA_OP.size:
+                raise DeltaError("Дельта оборвана")
+            kind, first, second = DELTA_OP.unpack(op)
+            if kind == OP_COPY:
+                if first + second > base_size:
+                    raise DeltaError("Участок вне базы")
+                source, remaining = base, second
+                base.seek(first)
+            elif kind == OP_DATA:
+                source, remaining = delta, first
+            else:
+                raise DeltaError(f"Неизвестная операция дельты: {kind}")
+            if written + remaining > target_size:
+                raise DeltaError("Собранный файл больше ожидаемого")
+            while remaining:
+                n = source.readinto(view[:min(len(view), remaining)])
+                if not n:
+                    raise DeltaError("Дельта оборвана")
+                output_file.write(view[:n])
+                if hasher is not None:
+                    hasher.update(view[:n])
+                remaining -= n
+                written += n
+    if written != target_size:
+        raise DeltaError(f"Собрано {written} байт вместо {target_size}")
+    return written
+
+
+class DeltaStore:
+    """Дельты между версиями драйверов в drivers/.cache/deltas.
+
+    Когда драйвер заменяется новой версией, прежний файл остается базой
+    (не больше max_bases на драйвер). Дельта от базы к текущей версии
+    строится в фоновом потоке один раз и отдается агентам, у которых база
+    лежит в кеше. Невыгодная дельта запоминается, и пакет идет целиком.
+    """
+
+    def __init__(self, drivers_dir, cache_dir=None, max_bases=DEFAULT_MAX_BASES):
+        self.cache_dir = cache_dir or os.path.join(drivers_dir, '.cache', 'deltas')
+        self.index_path = os.path.join(self.cache_dir, 'deltas.json')
+        self.max_bases = max_bases
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        # Имя драйвера -> хеши прежних версий, от новых к старым
+        self._families = {}
+        # Хеш базы -> подпись файла (размер, mtime_ns): измененная снаружи база не годится
+        self._bases = {}
+        # "база-цель" -> {'size': размер дельты или None, если она невыгодна}
+        self._deltas = {}
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._thread = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._families = data.get('families', {})
+            self._bases = data.get('bases', {})
+            self._deltas = data.get('deltas', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Индекс дельт поврежден, дельты будут построены заново: {e}")
+
+    def _save(self):
+        with self.lock:
+            data = {'families': dict(self._families), 'bases': dict(self._bases), 'deltas': dict(self._deltas)}
+        with self._save_lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.index_path)
+
+    def _base_path(self, digest):
+        return os.path.join(self.cache_dir, f"{digest}.base")
+
+    def _delta_path(self, base, target):
+        return os.path.join(self.cache_dir, f"{base}-{target}.delta")
+
+    @staticmethod
+    def _signature(path):
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def add_base(self, name, file_path, digest):
+        """Сохраняет версию драйвера, которую сейчас заменят, как базу для дельт.
+
+        Вызывается до замены файла: жесткая ссылка оставляет прежнее
+        содержимое на месте без копирования.
+        """
+        path = self._base_path(digest)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if not os.path.exists(path):
+            tmp_path = path + '.tmp'
+            try:
+                os.link(file_path, tmp_path)
+            except OSError:
+                shutil.copy2(file_path, tmp_path)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self._bases[digest] = self._signature(path)
+            bases = [base for base in self._families.get(name, []) if base != digest]
+            bases.insert(0, digest)
+            self._families[name] = bases[:self.max_bases]
+            # Дельты к заменяемой версии больше никому не понадобятся
+            outdated = [key for key in self._deltas if key.split('-', 1)[1] == digest]
+            for key in outdated:
+                del self._deltas[key]
+        for key in outdated:
+            try:
+                os.remove(os.path.join(self.cache_dir, key + '.delta'))
+            except FileNotFoundError:
+                pass
+        self._remove_unused()
+        self._save()
+
+    def get(self, name, digest, file_path):
+        """Готовые дельты к текущей версии драйвера: {хеш базы: (путь, размер)}.
+
+        Недостающие дельты ставятся на построение в фоне, развертывание
+        их не ждет.
+        """
+        with self.lock:
+            bases = [base for base in self._families.get(name, ()) if base != digest]
+        ready = {}
+        for base in bases:
+            key = f"{base}-{digest}"
+            with self.lock:
+                entry = self._deltas.get(key)
+            if entry is None:
+                self.schedule(base, digest, file_path)
+                continue
+            if entry['size'] is None:
+                continue
+            path = self._delta_path(base, digest)
+            if os.path.isfile(path) and os.path.getsize(path) == entry['size']:
+                ready[base] = (path, entry['size'])
+            else:
+                # Файл дельты удалили снаружи — строим заново
+                with self.lock:
+                    self._deltas.pop(key, None)
+                self.schedule(base, digest, file_path)
+        return ready
+
+    def schedule(self, base, digest, file_path):
+        """Ставит построение дельты в очередь фонового потока"""
+        key = f"{base}-{digest}"
+        with self.lock:
+            if key in self._pending or key in self._deltas:
+                return
+            self._pending.add(key)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="delta-builder", daemon=True)
+                self._thread.start()
+        self._queue.put((base, digest, file_path))
+
+    def _worker(self):
+        while True:
+            base, digest, file_path = self._queue.get()
+            try:
+                self.build(base, digest, file_path)
+            except Exception as e:
+                print(f"❌ Не удалось построить дельту {base[:12]} → {digest[:12]}: {e}")
+            finally:
+                with self.lock:
+                    self._pending.discard(f"{base}-{digest}")
+
+    def build(self, base, digest, file_path):
+        """Строит дельту от базы к файлу с хешем digest, возвращает ее размер или None"""
+        base_path = self._base_path(base)
+        with self.lock:
+            signature = self._bases.get(base)
+        if signature is None or not os.path.isfile(base_path) or self._signature(base_path) != signature:
+            print(f"⚠️ База {base[:12]} для дельты отсутствует или изменена")
+            return None
+        size = make_delta(base_path, file_path, self._delta_path(base, digest))
+        with self.lock:
+            self._deltas[f"{base}-{digest}"] = {'size': size}
+        self._save()
+        if size is None:
+            print(f"📦 Дельта {os.path.basename(file_path)} от версии {base[:12]} невыгодна, пакет пойдет целиком")
+        else:
+            print(f"🧩 Дельта {os.path.basename(file_path)} от версии {base[:12]}: {size} байт")
+        return size
+
+    def _remove_unused(self):
+        """Удаляет базы, на которые больше не ссылается ни один драйвер, и их дельты"""
+        with self.lock:
+            used = {base for bases in self._families.values() for base in bases}
+            stale_bases = [base for base in self._bases if base not in used]
+            for base in stale_bases:
+                del self._bases[base]
+            stale_deltas = [key for key in self._deltas if key.split('-', 1)[0] not in used]
+            for key in stale_deltas:
+                del self._deltas[key]
+        for path in [self._base_path(base) for base in stale_bases] + \
+                [os.path.join(self.cache_dir, key + '.delta') for key in stale_deltas]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return len(stale_bases) + len(stale_deltas)
+
+    def prune(self, live_names, live_digests):
+        """Забывает удаленные из каталога драйверы и дельты к версиям, которых больше нет"""
+        live_names, live_digests = set(live_names), set(live_digests)
+        with self.lock:
+            for name in [name for name in self._families if name not in live_names]:
+                del self._families[name]
+            stale = [key for key in self._deltas if key.split('-', 1)[1] not in live_digests]
+            for key in stale:
+                del self._deltas[key]
+        for key in stale:
+            try:
+                os.remove(os.path.join(self.cache_dir, key + '.delta'))
+            except FileNotFoundError:
+                pass
+        removed = len(stale) + self._remove_unused()
+        if removed:
+            self._save()
+        return removed
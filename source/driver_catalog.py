@@ -0,0 +1,380 @@
+# driver_catalog.py
+import hashlib
+import json
+import os
+import select
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import ctypes
+    import ctypes.util
+except ImportError:
+    ctypes = None
+
+# Расширения пакетов, однозначно указывающие на ОС
+OS_BY_EXTENSION = {
+    '.exe': 'windows', '.msi': 'windows', '.inf': 'windows', '.cab': 'windows',
+    '.deb': 'linux', '.rpm': 'linux', '.run': 'linux', '.ko': 'linux',
+}
+ARCH_MARKERS = (
+    ('arm64', 'arm64'), ('aarch64', 'arm64'),
+    ('x86_64', 'x86_64'), ('amd64', 'x86_64'), ('x64', 'x86_64'),
+    ('i386', 'x86'), ('i686', 'x86'), ('x86', 'x86'),
+)
+
+
+def driver_id_for(name):
+    """Стабильный id драйвера: не меняется между перезапусками и обновлениями файла"""
+    return "drv_" + hashlib.sha1(name.encode('utf-8')).hexdigest()[:12]
+
+
+def driver_label(name, size):
+    """Подпись драйвера в списке консоли"""
+    return f"{name} {size} байт"
+
+
+def infer_tags(name):
+    """Определяет ОС и архитектуру пакета по имени файла"""
+    lowered = name.lower()
+    if 'win' in lowered:
+        os_tag = 'windows'
+    elif 'linux' in lowered:
+        os_tag = 'linux'
+    elif 'network' in lowered:
+        # Сетевые драйверы исторически считаются универсальными
+        os_tag = 'any'
+    else:
+        # Пакет без признаков ОС не подходит никому, пока ОС не задана в метаданных
+        os_tag = OS_BY_EXTENSION.get(os.path.splitext(lowered)[1], 'unknown')
+
+    arch_tag = 'any'
+    for marker, arch in ARCH_MARKERS:
+        if marker in lowered:
+            arch_tag = arch
+            break
+    return {'os': os_tag, 'arch': arch_tag}
+
+
+class _InotifyWatch:
+    """Минимальная обертка над inotify (Linux) через ctypes"""
+
+    IN_MODIFY = 0x002
+    IN_ATTRIB = 0x004
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+    def __init__(self, path):
+        libc_name = ctypes.util.find_library('c') if ctypes else None
+        if not libc_name:
+            raise OSError("libc недоступна")
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError("inotify не поддерживается")
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch")
+
+    def wait(self, timeout) -> bool:
+        """Ждет событий каталога, возвращает True, если они были"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        self.drain()
+        return True
+
+    def drain(self):
+        try:
+            while os.read(self.fd, 65536):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DriverCatalog:
+    """Каталог драйверов в памяти.
+
+    Хранит записи со стабильным id и метаданными (размер, хеш, теги ОС и
+    архитектуры) и ищет их за O(1) по id, имени или подписи из консоли.
+    Изменения каталога на диске отслеживаются через inotify, а где его
+    нет — опросом mtime. Слушатели получают (added, changed, removed).
+    """
+
+    def __init__(self, drivers_dir, hash_index=None, poll_interval=2.0):
+        self.drivers_dir = drivers_dir
+        self.hash_index = hash_index
+        self.poll_interval = poll_interval
+        self.metadata_path = os.path.join(drivers_dir, '.index', 'metadata.json')
+        self.lock = threading.Lock()
+        self.version = 0
+        self._by_id = {}
+        self._by_name = {}
+        self._by_label = {}
+        self._signatures = {}
+        self._metadata = {}
+        self._listeners = []
+        self._watch_thread = None
+        self._stop = threading.Event()
+        self.watch_mode = None
+        self._batch_depth = 0
+        self._load_metadata()
+        self.refresh()
+
+    # --- Метаданные ---
+
+    def _load_metadata(self):
+        try:
+            with open(self.metadata_path, 'r', encoding='utf-8') as f:
+                self._metadata = json.load(f)
+        except FileNotFoundError:
+            self._metadata = {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось прочитать метаданные драйверов: {e}")
+            self._metadata = {}
+
+    def _save_metadata(self):
+        os.makedirs(os.path.dirname(self.metadata_path), exist_ok=True)
+        tmp_path = self.metadata_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._metadata, f, indent=4, ensure_ascii=False)
+        os.replace(tmp_path, self.metadata_path)
+
+    def update_metadata(self, name, **fields):
+        """Сохраняет метаданные драйвера (перекрывают выведенные из имени)"""
+        with self.lock:
+            self._metadata.setdefault(name, {}).update(fields)
+            self._save_metadata()
+            entry = self._by_name.get(name)
+            if entry is not None:
+                entry.update(fields)
+                self.version += 1
+
+    def metadata_for(self, name):
+        """Метаданные драйвера, заданные явно (без выведенных из имени)"""
+        with self.lock:
+            return dict(self._metadata.get(name, {}))
+
+    def update_metadata_many(self, updates):
+        """Сохраняет метаданные нескольких драйверов одной записью файла"""
+        if not updates:
+            return
+        with self.lock:
+            for name, fields in updates.items():
+                self._metadata.setdefault(name, {}).update(fields)
+                entry = self._by_name.get(name)
+                if entry is not None:
+                    entry.update(fields)
+            self._save_metadata()
+            self.version += 1
+
+    @contextmanager
+    def batch(self):
+        """Откладывает обновление каталога до конца пакета: слушатели получат одно уведомление"""
+        with self.lock:
+            self._batch_depth += 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self._batch_depth -= 1
+                pending = self._batch_depth == 0
+            if pending:
+                self.refresh()
+
+    # --- Сканирование ---
+
+    def _scan(self):
+        """Читает каталог: имя -> (размер, mtime_ns, inode)"""
+        found = {}
+        try:
+            with os.scandir(self.drivers_dir) as it:
+                for item in it:
+                    if item.name.startswith('.') or not item.is_file():
+                        continue
+                    st = item.stat()
+                    found[item.name] = (st.st_size, st.st_mtime_ns, st.st_ino)
+        except FileNotFoundError:
+            pass
+        return found
+
+    def _make_entry(self, name, signature):
+        size = signature[0]
+        path = os.path.join(self.drivers_dir, name)
+        entry = {
+            'id': driver_id_for(name),
+            'name': name,
+            'size': size,
+            'mtime_ns': signature[1],
+            'path': path,
+            'label': driver_label(name, size),
+            'hash': None,
+        }
+        entry.update(infer_tags(name))
+        entry.update(self._metadata.get(name, {}))
+        if self.hash_index is not None:
+            try:
+                entry['hash'] = self.hash_index.lookup(path)
+            except OSError:
+                pass
+        return entry
+
+    def refresh(self):
+        """Сверяет каталог с диском, возвращает (added, changed, removed)"""
+        found = self._scan()
+        added, changed, removed = [], [], []
+        with self.lock:
+            for name, signature in found.items():
+                old = self._signatures.get(name)
+                if old == signature:
+                    continue
+                entry = self._make_entry(name, signature)
+                old_entry = self._by_name.get(name)
+                if old_entry is not None:
+                    self._by_label.pop(old_entry['label'], None)
+                    changed.append(entry)
+                else:
+                    added.append(entry)
+                self._by_id[entry['id']] = entry
+                self._by_name[name] = entry
+                self._by_label[entry['label']] = entry
+                self._signatures[name] = signature
+            for name in list(self._signatures):
+                if name not in found:
+                    entry = self._by_name.pop(name)
+                    self._by_id.pop(entry['id'], None)
+                    self._by_label.pop(entry['label'], None)
+                    del self._signatures[name]
+                    removed.append(entry)
+            if added or changed or removed:
+                self.version += 1
+            listeners = list(self._listeners)
+        if added or changed or removed:
+            for listener in listeners:
+                try:
+                    listener(added, changed, removed)
+                except Exception as e:
+                    print(f"❌ Ошибка слушателя каталога: {e}")
+        return added, changed, removed
+
+    # --- Поиск ---
+
+    def list(self):
+        """Возвращает копии записей, отсортированные по имени"""
+        with self.lock:
+            return [dict(self._by_name[name]) for name in sorted(self._by_name)]
+
+    def get(self, driver_id):
+        with self.lock:
+            entry = self._by_id.get(driver_id)
+            return dict(entry) if entry else None
+
+    def get_by_name(self, name):
+        with self.lock:
+            entry = self._by_name.get(name)
+            return dict(entry) if entry else None
+
+    def resolve(self, key):
+        """Находит драйвер по id, имени файла или подписи из консоли"""
+        with self.lock:
+            entry = self._by_id.get(key) or self._by_name.get(key) or self._by_label.get(key)
+            return dict(entry) if entry else None
+
+    def get_hash(self, key):
+        """Возвращает хеш драйвера, при необходимости вычисляя его"""
+        entry = self.resolve(key)
+        if entry is None or self.hash_index is None:
+            return None
+        digest = self.hash_index.get_hash(entry['path'])
+        with self.lock:
+            current = self._by_name.get(entry['name'])
+            if current is not None and current['mtime_ns'] == entry['mtime_ns']:
+                current['hash'] = digest
+        return digest
+
+    def __len__(self):
+        with self.lock:
+            return len(self._by_name)
+
+    # --- Отслеживание изменений ---
+
+    def add_listener(self, callback):
+        """Подписывает callback(added, changed, removed) на изменения каталога"""
+        with self.lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self.lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def start_watching(self):
+        """Запускает фоновое отслеживание каталога"""
+        if self._watch_thread is not None:
+            return
+        self._stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch, name="driver-catalog", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        self._stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join(timeout=5)
+            self._watch_thread = None
+
+    def _watch(self):
+        watch = None
+        try:
+            watch = _InotifyWatch(self.drivers_dir)
+            self.watch_mode = 'inotify'
+        except (OSError, AttributeError):
+            self.watch_mode = 'polling'
+        print(f"👁️ Отслеживание каталога драйверов: {self.watch_mode}")
+
+        self.refresh()
+        self._warm_hashes()
+        try:
+            while not self._stop.is_set():
+                if watch is not None:
+                    if not watch.wait(1.0):
+                        continue
+                    # Копирование большого файла дает пачку событий — ждем тишины
+                    time.sleep(0.2)
+                    watch.drain()
+                else:
+                    if self._stop.wait(self.poll_interval):
+                        break
+                if self._batch_depth:
+                    # Идет пакетная загрузка — каталог обновится один раз в ее конце
+                    continue
+                added, changed, removed = self.refresh()
+                if added or changed:
+                    self._warm_hashes()
+        finally:
+            if watch is not None:
+                watch.close()
+
+    def _warm_hashes(self):
+        """Досчитывает хеши драйверов, которых еще нет в индексе"""
+        if self.hash_index is None:
+            return
+        with self.lock:
+            pending = [entry['name'] for entry in self._by_name.values() if not entry['hash']]
+        for name in pending:
+            if self._stop.is_set():
+                break
+            try:
+                self.get_hash(name)
+            except OSError:
+                pass
@@ -0,0 +1,258 @@
+# hash_index.py
+import hashlib
+import json
+import os
+import threading
+
+HASH_BLOCK_SIZE = 1024 * 1024
+DEFAULT_HASH_ALGORITHM = 'sha256'
+# Размер проверяемого блока передачи: с границы блока возобновляется загрузка
+DEFAULT_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+class ChunkMismatch(Exception):
+    """Блок передачи не совпал с ожидаемым хешем"""
+
+    def __init__(self, index):
+        super().__init__(f"Блок {index} поврежден")
+        self.index = index
+
+
+class ChunkHasher:
+    """Считает хеши последовательных блоков фиксированного размера в потоке"""
+
+    def __init__(self, algorithm, chunk_size):
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self._hasher = hashlib.new(algorithm)
+        self._filled = 0
+
+    def update(self, data):
+        """Добавляет данные, возвращает хеши блоков, завершенных этим куском"""
+        completed = []
+        view = memoryview(data)
+        pos = 0
+        while pos < len(view):
+            take = min(len(view) - pos, self.chunk_size - self._filled)
+            self._hasher.update(view[pos:pos + take])
+            self._filled += take
+            pos += take
+            if self._filled == self.chunk_size:
+                completed.append(self._hasher.hexdigest())
+                self._hasher = hashlib.new(self.algorithm)
+                self._filled = 0
+        return completed
+
+    def flush(self):
+        """Хеш последнего неполного блока или None"""
+        if not self._filled:
+            return None
+        digest = self._hasher.hexdigest()
+        self._hasher = hashlib.new(self.algorithm)
+        self._filled = 0
+        return digest
+
+
+class ChunkVerifier:
+    """Сверяет принимаемый поток с хешами блоков от сервера"""
+
+    def __init__(self, algorithm, chunk_size, chunk_hashes, start_chunk=0):
+        self.chunk_size = chunk_size
+        self.chunk_hashes = chunk_hashes
+        self.next_chunk = start_chunk
+        self._hasher = ChunkHasher(algorithm, chunk_size)
+
+    @property
+    def verified_bytes(self):
+        return self.next_chunk * self.chunk_size
+
+    def _check(self, digest):
+        if self.next_chunk >= len(self.chunk_hashes) or digest != self.chunk_hashes[self.next_chunk]:
+            raise ChunkMismatch(self.next_chunk)
+        self.next_chunk += 1
+
+    def update(self, data):
+        for digest in self._hasher.update(data):
+            self._check(digest)
+
+    def finish(self):
+        """Проверяет последний блок; все блоки должны быть подтверждены"""
+        digest = self._hasher.flush()
+        if digest is not None:
+            self._check(digest)
+        if self.next_chunk != len(self.chunk_hashes):
+            raise ChunkMismatch(self.next_chunk)
+
+
+def hash_file(file_path, algorithm=DEFAULT_HASH_ALGORITHM, block_size=HASH_BLOCK_SIZE):
+    """Вычисляет хеш файла большими блоками в переиспользуемый буфер"""
+    hasher = hashlib.new(algorithm)
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb') as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+
+
+def hash_file_chunks(file_path, algorithm=DEFAULT_HASH_ALGORITHM, chunk_size=DEFAULT_CHUNK_SIZE,
+                     block_size=HASH_BLOCK_SIZE):
+    """За один проход считает хеш файла и хеши его блоков передачи"""
+    hasher = hashlib.new(algorithm)
+    chunk_hasher = ChunkHasher(algorithm, chunk_size)
+    chunk_hashes = []
+    buffer = bytearray(block_size)
+    view = memoryview(buffer)
+    with open(file_path, 'rb') as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            hasher.update(view[:n])
+            chunk_hashes.extend(chunk_hasher.update(view[:n]))
+    last = chunk_hasher.flush()
+    if last is not None:
+        chunk_hashes.append(last)
+    return hasher.hexdigest(), chunk_hashes
+
+
+class DriverHashIndex:
+    """Постоянный индекс хешей драйверов.
+
+    Запись ключуется по имени файла и действительна, пока совпадают размер,
+    mtime и inode. Изменившийся файл пересчитывается при следующем
+    обращении, так что каждый пакет хешируется один раз, а не на каждое
+    развертывание. Вместе с хешем файла в том же проходе считаются хеши
+    блоков передачи. Индекс сохраняется в JSON и переживает перезапуск.
+    """
+
+    def __init__(self, drivers_dir, index_path=None, algorithm=DEFAULT_HASH_ALGORITHM,
+                 chunk_size=DEFAULT_CHUNK_SIZE):
+        self.drivers_dir = drivers_dir
+        self.index_path = index_path or os.path.join(drivers_dir, '.index', 'hashes.json')
+        self.algorithm = algorithm
+        self.chunk_size = chunk_size
+        self.lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._entries = {}
+        self._file_locks = {}
+        self.load()
+
+    def load(self):
+        """Загружает индекс с диска"""
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('algorithm') == self.algorithm and data.get('chunk_size') == self.chunk_size:
+                self._entries = data.get('entries', {})
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Индекс хешей поврежден, будет пересчитан: {e}")
+
+    def save(self):
+        """Атомарно сохраняет индекс на диск"""
+        with self.lock:
+            data = {'algorithm': self.algorithm, 'chunk_size': self.chunk_size, 'entries': dict(self._entries)}
+        with self._save_lock:
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            tmp_path = self.index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.index_path)
+
+    def _key(self, file_path):
+        return os.path.relpath(file_path, self.drivers_dir)
+
+    @staticmethod
+    def _signature(st):
+        return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'inode': st.st_ino}
+
+    def _lookup_entry(self, file_path):
+        st = os.stat(file_path)
+        with self.lock:
+            entry = self._entries.get(self._key(file_path))
+        if entry and all(entry.get(k) == v for k, v in self._signature(st).items()):
+            return entry
+        return None
+
+    def lookup(self, file_path):
+        """Возвращает хеш из индекса, если файл не менялся, иначе None"""
+        entry = self._lookup_entry(file_path)
+        return entry['digest'] if entry else None
+
+    def get_hash(self, file_path):
+        """Возвращает хеш файла, при необходимости вычисляя его"""
+        return self._get_entry(file_path)['digest']
+
+    def get_chunk_hashes(self, file_path):
+        """Возвращает хеши блоков передачи файла"""
+        return self._get_entry(file_path)['chunks']
+
+    def _get_entry(self, file_path):
+        entry = self._lookup_entry(file_path)
+        if entry:
+            return entry
+
+        key = self._key(file_path)
+        with self.lock:
+            file_lock = self._file_locks.setdefault(key, threading.Lock())
+        # Параллельные развертывания одного файла ждут один общий расчет
+        with file_lock:
+            entry = self._lookup_entry(file_path)
+            if entry:
+                return entry
+            st = os.stat(file_path)
+            digest, chunks = hash_file_chunks(file_path, self.algorithm, self.chunk_size)
+            entry = self._signature(st)
+            entry['digest'] = digest
+            entry['chunks'] = chunks
+            if self._signature(os.stat(file_path)) != self._signature(st):
+                # Файл меняется прямо сейчас — не запоминаем промежуточный хеш
+                return entry
+            with self.lock:
+                self._entries[key] = entry
+        self.save()
+        return entry
+
+    def store(self, file_path, digest, chunks):
+        """Запоминает хеши, посчитанные при загрузке файла, без повторного чтения"""
+        entry = self._signature(os.stat(file_path))
+        entry['digest'] = digest
+        entry['chunks'] = chunks
+        with self.lock:
+            self._entries[self._key(file_path)] = entry
+        self.save()
+
+    def find(self, digest):
+        """Путь проиндексированного файла с этим хешем или None"""
+        with self.lock:
+            keys = [key for key, entry in self._entries.items() if entry['digest'] == digest]
+        for key in keys:
+            path = os.path.join(self.drivers_dir, key)
+            try:
+                if self.lookup(path) == digest:
+                    return path
+            except OSError:
+                continue
+        return None
+
+    def digests(self):
+        """Хеши всех проиндексированных файлов"""
+        with self.lock:
+            return [entry['digest'] for entry in self._entries.values()]
+
+    def prune(self):
+        """Удаляет записи о файлах, которых больше нет"""
+        with self.lock:
+            stale = [key for key in self._entries
+                     if not os.path.isfile(os.path.join(self.drivers_dir, key))]
+            for key in stale:
+                del self._entries[key]
+                self._file_locks.pop(key, None)
+        if stale:
+            self.save()
+        return len(stale)
@@ -0,0 +1,152 @@
+# heartbeat.py
+import math
+import socket
+import threading
+import time
+
+DEFAULT_HEARTBEAT_INTERVAL = 10.0
+DEFAULT_HEARTBEAT_TIMEOUT = 30.0
+DEFAULT_TICK = 1.0
+DEFAULT_SLOTS = 512
+
+
+class TimerWheel:
+    """Хешированное колесо таймеров для сроков жизни соединений.
+
+    Срок ключа лежит в ячейке колеса по номеру тика, поэтому постановка,
+    продление и снятие стоят O(1), а тик разбирает только одну ячейку.
+    Продление (touch) лишь сдвигает срок: ключ остается в старой ячейке и
+    при ее срабатывании переносится к новому сроку, если тот еще не наступил.
+    """
+
+    def __init__(self, tick=DEFAULT_TICK, slots=DEFAULT_SLOTS):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.lock = threading.Lock()
+        self._timeouts = {}
+        self._deadlines = {}
+        self._slot_ticks = {}
+        self._current = int(time.monotonic() / tick)
+
+    def __len__(self):
+        with self.lock:
+            return len(self._deadlines)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self._deadlines
+
+    def _insert(self, key, deadline):
+        tick_no = max(math.ceil(deadline / self.tick), self._current + 1)
+        self.slots[tick_no % len(self.slots)].add(key)
+        self._slot_ticks[key] = tick_no
+
+    def _unlink(self, key):
+        tick_no = self._slot_ticks.pop(key, None)
+        if tick_no is not None:
+            self.slots[tick_no % len(self.slots)].discard(key)
+
+    def schedule(self, key, timeout, now=None):
+        """Ставит ключ с таймаутом; каждый touch продлевает срок на timeout"""
+        deadline = (time.monotonic() if now is None else now) + timeout
+        with self.lock:
+            self._timeouts[key] = timeout
+            self._deadlines[key] = deadline
+            self._unlink(key)
+            self._insert(key, deadline)
+
+    def touch(self, key, now=None):
+        """Продлевает срок ключа; незарегистрированные ключи пропускаются"""
+        with self.lock:
+            timeout = self._timeouts.get(key)
+            if timeout is not None:
+                self._deadlines[key] = (time.monotonic() if now is None else now) + timeout
+
+    def cancel(self, key):
+        with self.lock:
+            self._unlink(key)
+            self._timeouts.pop(key, None)
+            self._deadlines.pop(key, None)
+
+    def deadline(self, key):
+        with self.lock:
+            return self._deadlines.get(key)
+
+    def advance(self, now=None):
+        """Прокручивает колесо до текущего тика и возвращает ключи с истекшим сроком"""
+        now = time.monotonic() if now is None else now
+        target = int(now / self.tick)
+        expired = []
+        with self.lock:
+            # После долгой паузы достаточно одного оборота: ячейки повторяются
+            first = max(self._current + 1, target - len(self.slots) + 1)
+            self._current = target
+            for tick_no in range(first, target + 1):
+                slot = self.slots[tick_no % len(self.slots)]
+                due = [key for key in slot if self._slot_ticks.get(key, tick_no) <= tick_no]
+                for key in due:
+                    slot.discard(key)
+                    del self._slot_ticks[key]
+                    deadline = self._deadlines[key]
+                    if deadline <= now:
+                        del self._deadlines[key]
+                        del self._timeouts[key]
+                        expired.append(key)
+                    else:
+                        self._insert(key, deadline)
+        return expired
+
+
+class HeartbeatSweeper:
+    """Фоновый поток, который раз в тик прокручивает колесо и выселяет просроченных"""
+
+    def __init__(self, wheel, on_expired):
+        self.wheel = wheel
+        self.on_expired = on_expired
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="heartbeat-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.wheel.tick):
+            for key in self.wheel.advance():
+                try:
+                    self.on_expired(key)
+                except Exception as e:
+                    print(f"❌ Ошибка выселения {key}: {e}")
+
+
+def set_listen_options(sock):
+    """Настраивает слушающий сокет: быстрый перезапуск без захвата чужого порта.
+
+    На Windows SO_REUSEADDR разрешает второму процессу открыть порт, который уже слушают,
+    поэтому там порт занимается монопольно (SO_EXCLUSIVEADDRUSE)
+    """
+    if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+    else:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+
+def enable_keepalive(sock, idle=60, interval=10, count=3):
+    """Включает TCP keepalive: ядро само обнаружит пропавшего собеседника"""
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, 'TCP_KEEPIDLE'):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+    except OSError:
+        pass
@@ -0,0 +1,176 @@
+# history.py
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+# Статусы хранятся кодами: строка журнала остается короткой, индексы — компактными
+STATUS_CODES = {'success': 0, 'skipped': 1, 'error': 2, 'offline': 3, 'cancelled': 4, 'failed': 5}
+# Неудачей считается и ошибка сервера, и отказ установщика на агенте
+FAILURE_STATUSES = ('error', 'failed')
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+OTHER_STATUS = 9
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS clients (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS drivers (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+CREATE TABLE IF NOT EXISTS deployments (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    client INTEGER NOT NULL,
+    driver INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    version TEXT,
+    hash TEXT,
+    duration REAL,
+    bytes INTEGER,
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS deployments_client ON deployments(client, ts);
+CREATE INDEX IF NOT EXISTS deployments_driver ON deployments(driver, status, ts);
+CREATE INDEX IF NOT EXISTS deployments_status ON deployments(status, client, ts);
+CREATE INDEX IF NOT EXISTS deployments_ts ON deployments(ts);
+-- Последний успех по паре клиент-драйвер обновляется при записи, чтобы не группировать весь журнал
+CREATE TABLE IF NOT EXISTS last_success (
+    client INTEGER NOT NULL,
+    driver INTEGER NOT NULL,
+    deployment INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    PRIMARY KEY (client, driver)
+) WITHOUT ROWID;
+"""
+
+_SELECT = ("SELECT h.id, h.ts, c.name, d.name, h.status, h.version, h.hash, h.duration, h.bytes, h.message "
+           "FROM deployments h JOIN clients c ON c.id = h.client JOIN drivers d ON d.id = h.driver")
+
+HistoryEntry = namedtuple('HistoryEntry', 'id ts client_name driver_name status version hash duration bytes message')
+
+
+class DeploymentHistory:
+    """Журнал итогов развертываний в SQLite (WAL), только дописывается.
+
+    Имена клиентов и драйверов хранятся в справочниках, а строка журнала
+    ссылается на них числовыми id. Индексы по (клиент, время),
+    (драйвер, статус, время), (статус, клиент, время) и времени позволяют
+    отвечать на выборки вроде «кто не смог поставить драйвер за неделю»
+    или «последняя успешная версия на каждом клиенте», не читая журнал
+    целиком.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._client_ids = dict(self._db.execute("SELECT name, id FROM clients").fetchall())
+        self._driver_ids = dict(self._db.execute("SELECT name, id FROM drivers").fetchall())
+
+    def close(self):
+        with self.lock:
+            self._db.close()
+
+    def _intern(self, table, cache, name):
+        """id имени в справочнике, при необходимости добавляя его"""
+        name_id = cache.get(name)
+        if name_id is None:
+            self._db.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+            name_id = self._db.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+            cache[name] = name_id
+        return name_id
+
+    @staticmethod
+    def _lookup(cache, name):
+        return cache.get(name, -1) if name is not None else None
+
+    @staticmethod
+    def _entry(row):
+        return HistoryEntry(*row[:4], STATUS_NAMES.get(row[4], 'other'), *row[5:])
+
+    def record(self, client_name, driver_name, result, started_at=None, version=None, driver_hash=None):
+        """Дописывает итог развертывания (словарь результата deploy_to_client)"""
+        now = time.time()
+        transfer = result.get('transfer') or {}
+        status = STATUS_CODES.get(result.get('status'), OTHER_STATUS)
+        with self.lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                client = self._intern('clients', self._client_ids, client_name)
+                driver = self._intern('drivers', self._driver_ids, driver_name)
+                self._db.execute(
+                    "INSERT INTO deployments (ts, client, driver, status, version, hash, duration, bytes, message) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (now, client, driver, status, version, driver_hash,
+                     now - started_at if started_at else None, transfer.get('bytes'), result.get('message')))
+                if status == STATUS_CODES['success']:
+                    self._db.execute(
+                        "INSERT INTO last_success (client, driver, deployment, ts) VALUES (?, ?, last_insert_rowid(), ?) "
+                        "ON CONFLICT (client, driver) DO UPDATE SET deployment = excluded.deployment, ts = excluded.ts",
+                        (client, driver, now))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                # Строки справочников откатились вместе с транзакцией
+                self._client_ids.pop(client_name, None)
+                self._driver_ids.pop(driver_name, None)
+                raise
+
+    def query(self, client_name=None, driver_name=None, status=None, since=None, until=None, limit=100):
+        """Последние записи, отобранные по клиенту, драйверу, статусу и интервалу времени"""
+        conditions, params = [], []
+        with self.lock:
+            for column, value in (('h.client', self._lookup(self._client_ids, client_name)),
+                                  ('h.driver', self._lookup(self._driver_ids, driver_name))):
+                if value is not None:
+                    conditions.append(f"{column} = ?")
+                    params.append(value)
+            if status is not None:
+                conditions.append("h.status = ?")
+                params.append(STATUS_CODES.get(status, OTHER_STATUS))
+            if since is not None:
+                conditions.append("h.ts >= ?")
+                params.append(since)
+            if until is not None:
+                conditions.append("h.ts < ?")
+                params.append(until)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            rows = self._db.execute(f"{_SELECT}{where} ORDER BY h.ts DESC LIMIT ?", (*params, limit)).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def failed_clients(self, driver_name, since=None):
+        """Клиенты, у которых развертывание драйвера завершилось ошибкой или отказом (с момента since)"""
+        codes = [STATUS_CODES[status] for status in FAILURE_STATUSES]
+        with self.lock:
+            driver = self._lookup(self._driver_ids, driver_name)
+            rows = self._db.execute(
+                "SELECT DISTINCT c.name FROM deployments h JOIN clients c ON c.id = h.client "
+                f"WHERE h.driver = ? AND h.status IN ({', '.join('?' * len(codes))}) AND h.ts >= ? ORDER BY c.name",
+                (driver, *codes, since or 0)).fetchall()
+        return [row[0] for row in rows]
+
+    def last_success(self, client_name=None, driver_name=None):
+        """Последняя успешная установка по каждому клиенту: {имя клиента: HistoryEntry}"""
+        conditions, params = [], []
+        with self.lock:
+            for column, value in (('l.client', self._lookup(self._client_ids, client_name)),
+                                  ('l.driver', self._lookup(self._driver_ids, driver_name))):
+                if value is not None:
+                    conditions.append(f"{column} = ?")
+                    params.append(value)
+            where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+            # В SQLite при MAX() столбец deployment берется из строки с максимумом
+            rows = self._db.execute(
+                f"{_SELECT} JOIN (SELECT l.deployment, MAX(l.ts) FROM last_success l{where} GROUP BY l.client) last "
+                "ON last.deployment = h.id", params).fetchall()
+        return {row[2]: self._entry(row) for row in rows}
+
+    def counts(self, since=None):
+        """Число записей по статусам"""
+        with self.lock:
+            if since is None:
+                rows = self._db.execute("SELECT status, COUNT(*) FROM deployments GROUP BY status").fetchall()
+            else:
+                rows = self._db.execute("SELECT status, COUNT(*) FROM deployments WHERE ts >= ? GROUP BY status",
+                                        (since,)).fetchall()
+        return {STATUS_NAMES.get(status, 'other'): count for status, count in rows}
@@ -0,0 +1,283 @@
+# ingest.py
+import hashlib
+import os
+import queue
+import shutil
+import struct
+import tempfile
+import threading
+
+from hash_index import ChunkHasher, HASH_BLOCK_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# ioctl FICLONE (Linux): копия, разделяющая блоки с исходным файлом (btrfs, xfs)
+FICLONE = 0x40049409
+# Сколько байт начала файла смотрим, чтобы определить ОС и архитектуру
+SNIFF_SIZE = 64 * 1024
+INGEST_DIR = '.ingest'
+
+PE_MACHINES = {0x014c: 'x86', 0x8664: 'x86_64', 0xaa64: 'arm64'}
+ELF_MACHINES = {3: 'x86', 62: 'x86_64', 183: 'arm64'}
+INF_ARCHES = (('ntamd64', 'x86_64'), ('ntarm64', 'arm64'), ('ntx86', 'x86'))
+
+
+def sniff_platform(head, name):
+    """Определяет ОС и архитектуру пакета по первым байтам: {'os', 'arch', 'format'} без неизвестных полей"""
+    if head[:2] == b'MZ' and len(head) >= 0x40:
+        # Архитектура установщика PE не обязательно совпадает с архитектурой драйвера
+        found = {'os': 'windows', 'format': 'pe'}
+        pe_offset = struct.unpack_from('<I', head, 0x3c)[0]
+        if pe_offset + 6 <= len(head) and head[pe_offset:pe_offset + 4] == b'PE\0\0':
+            machine = struct.unpack_from('<H', head, pe_offset + 4)[0]
+            if machine in PE_MACHINES:
+                found['binary_arch'] = PE_MACHINES[machine]
+        return found
+    if head[:4] == b'\x7fELF' and len(head) >= 20:
+        found = {'os': 'linux', 'format': 'elf'}
+        endian = '<' if head[5] == 1 else '>'
+        machine = struct.unpack_from(endian + 'H', head, 18)[0]
+        if machine in ELF_MACHINES:
+            found['arch'] = ELF_MACHINES[machine]
+        return found
+    if head[:8] == b'!<arch>\n' and b'debian-binary' in head[:200]:
+        return {'os': 'linux', 'format': 'deb'}
+    if head[:4] == b'\xed\xab\xee\xdb':
+        return {'os': 'linux', 'format': 'rpm'}
+    if head[:4] == b'MSCF':
+        return {'os': 'windows', 'format': 'cab'}
+    if name.lower().endswith('.inf'):
+        # Секция [Manufacturer] перечисляет платформы: NTamd64, NTx86, NTarm64
+        text = head.decode('utf-16' if head[:2] in (b'\xff\xfe', b'\xfe\xff') else 'latin-1', 'ignore').lower()
+        found = {'os': 'windows', 'format': 'inf'}
+        arches = [arch for marker, arch in INF_ARCHES if marker in text]
+        if len(arches) == 1:
+            found['arch'] = arches[0]
+        return found
+    return {}
+
+
+class _HashingReader:
+    """Считает хеш файла и хеши блоков по мере чтения; сохраняет начало файла"""
+
+    def __init__(self, algorithm, chunk_size):
+        self.hasher = hashlib.new(algorithm)
+        self.chunks = ChunkHasher(algorithm, chunk_size)
+        self.chunk_hashes = []
+        self.head = bytearray()
+        self.size = 0
+
+    def update(self, data):
+        self.hasher.update(data)
+        self.chunk_hashes.extend(self.chunks.update(data))
+        if len(self.head) < SNIFF_SIZE:
+            self.head += data[:SNIFF_SIZE - len(self.head)]
+        self.size += len(data)
+
+    def finish(self):
+        last = self.chunks.flush()
+        if last is not None:
+            self.chunk_hashes.append(last)
+        return self.hasher.hexdigest(), self.chunk_hashes
+
+
+class DriverIngest:
+    """Фоновая загрузка драйверов в хранилище.
+
+    Пакеты файлов обрабатывает один рабочий поток. Каждый файл читается
+    один раз: при копировании хеш и хеши блоков считаются на ходу, а на
+    той же файловой системе файл клонируется (reflink), и чтение нужно
+    только для хеша. Жесткая ссылка включается hardlinks: с ней правка
+    исходного файла меняет и драйвер в хранилище. Пакет с уже
+    имеющимся содержимым не добавляется, а из файлов пакета с одинаковым
+    именем загружается последний. ОС и архитектура определяются
+    по заголовку файла и дописываются в метаданные, если не заданы.
+    Каталог обновляется один раз на пакет. Заменяемая версия драйвера
+    передается в deltas как база, и дельта к новой версии строится в фоне.
+    """
+
+    def __init__(self, catalog, hash_index, hardlinks=False, deltas=None):
+        self.catalog = catalog
+        self.hash_index = hash_index
+        self.deltas = deltas
+        self.drivers_dir = catalog.drivers_dir
+        self.staging_dir = os.path.join(self.drivers_dir, INGEST_DIR)
+        self.hardlinks = hardlinks
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def submit(self, paths, on_done=None):
+        """Ставит пакет файлов в очередь; on_done(results) вызывается в рабочем потоке"""
+        self._queue.put((list(paths), on_done))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="driver-ingest", daemon=True)
+                self._thread.start()
+
+    def ingest(self, paths):
+        """Загружает пакет файлов синхронно, возвращает результаты по каждому файлу"""
+        os.makedirs(self.staging_dir, exist_ok=True)
+        results = []
+        staged = []
+        seen = {}
+        paths = list(paths)
+        # Из файлов пакета с одинаковым именем в хранилище попадает последний
+        last = {os.path.basename(path): index for index, path in enumerate(paths)}
+        with self.catalog.batch():
+            for index, path in enumerate(paths):
+                name = os.path.basename(path)
+                if last[name] != index:
+                    results.append({'source': path, 'name': name, 'status': 'superseded',
+                                    'superseded_by': paths[last[name]]})
+                    continue
+                try:
+                    result, staged_path = self._stage(path, seen)
+                except OSError as e:
+                    result, staged_path = {'source': path, 'status': 'error', 'message': str(e)}, None
+                results.append(result)
+                if staged_path:
+                    staged.append((result, staged_path))
+            metadata = {}
+            replaced = []
+            for result, staged_path in staged:
+                target_path = os.path.join(self.drivers_dir, result['name'])
+                try:
+                    previous = None
+                    if result['status'] == 'replaced' and self.deltas is not None:
+                        # Прежняя версия остается базой для дельты к новой
+                        previous = self.hash_index.get_hash(target_path)
+                        self.deltas.add_base(result['name'], target_path, previous)
+                    os.replace(staged_path, target_path)
+                    self.hash_index.store(target_path, result['hash'], result.pop('chunk_hashes'))
+                    if previous:
+                        replaced.append((previous, result['hash'], target_path))
+                except OSError as e:
+                    result.update(status='error', message=str(e))
+                    continue
+                fields = {key: value for key, value in result.pop('detected').items()
+                          if key not in self.catalog.metadata_for(result['name'])}
+                if fields:
+                    metadata[result['name']] = fields
+            self.catalog.update_metadata_many(metadata)
+        for previous, digest, target_path in replaced:
+            self.deltas.schedule(previous, digest, target_path)
+        for result in results:
+            result.pop('chunk_hashes', None)
+            result.pop('detected', None)
+        return results
+
+    def _worker(self):
+        while True:
+            paths, on_done = self._queue.get()
+            results = self.ingest(paths)
+            for result in results:
+                if result['status'] == 'error':
+                    print(f"❌ Не удалось загрузить {result['source']}: {result.get('message')}")
+                elif result['status'] == 'duplicate':
+                    print(f"♻️ {os.path.basename(result['source'])} совпадает с {result['duplicate_of']}, "
+                          f"не загружается")
+                elif result['status'] == 'superseded':
+                    print(f"⏭️ {result['source']} пропущен: в пакете есть более поздний {result['superseded_by']}")
+                else:
+                    print(f"✅ Драйвер загружен: {result['name']} ({result['method']})")
+            if on_done is not None:
+                try:
+                    on_done(results)
+                except Exception as e:
+                    print(f"❌ Ошибка обработчика загрузки: {e}")
+
+    def _stage(self, path, seen):
+        """Кладет файл в .ingest, возвращает (результат, путь во временном каталоге или None)"""
+        if not os.path.isfile(path):
+            return {'source': path, 'status': 'error', 'message': "Файл не найден"}, None
+        name = os.path.basename(path)
+        result = {'source': path, 'name': name}
+        # Уникальное имя: файлы пакета не затирают друг друга в .ingest
+        fd, staged_path = tempfile.mkstemp(dir=self.staging_dir, suffix='.part')
+        os.close(fd)
+        try:
+            method = None
+            if os.stat(path).st_dev == os.stat(self.drivers_dir).st_dev:
+                method = self._link(path, staged_path)
+            if method is not None:
+                # Связанный файл не копируется — читаем его только ради хеша
+                reader = self._read(staged_path)
+            else:
+                reader = self._copy(path, staged_path)
+                method = 'copy'
+        except OSError:
+            if os.path.exists(staged_path):
+                os.remove(staged_path)
+            raise
+        digest, chunk_hashes = reader.finish()
+        result.update(hash=digest, size=reader.size, method=method)
+
+        duplicate = seen.get(digest) or self.hash_index.find(digest)
+        if duplicate:
+            duplicate_name = os.path.basename(duplicate)
+            os.remove(staged_path)
+            if duplicate_name == name:
+                result.update(status='unchanged')
+            else:
+                result.update(status='duplicate', duplicate_of=duplicate_name)
+            return result, None
+        seen[digest] = name
+        existed = os.path.exists(os.path.join(self.drivers_dir, name))
+        result.update(status='replaced' if existed else 'added', chunk_hashes=chunk_hashes,
+                      detected=sniff_platform(bytes(reader.head), name))
+        return result, staged_path
+
+    def _reader(self):
+        return _HashingReader(self.hash_index.algorithm, self.hash_index.chunk_size)
+
+    def _read(self, path):
+        reader = self._reader()
+        buffer = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        with open(path, 'rb') as f:
+            while True:
+                n = f.readinto(buffer)
+                if not n:
+                    break
+                reader.update(view[:n])
+        return reader
+
+    def _copy(self, path, staged_path):
+        """Копирует файл, считая хеши в том же проходе"""
+        reader = self._reader()
+        buffer = bytearray(HASH_BLOCK_SIZE)
+        view = memoryview(buffer)
+        with open(path, 'rb') as src, open(staged_path, 'wb') as dst:
+            while True:
+                n = src.readinto(buffer)
+                if not n:
+                    break
+                reader.update(view[:n])
+                dst.write(view[:n])
+        shutil.copystat(path, staged_path)
+        return reader
+
+    def _link(self, path, staged_path):
+        """Клонирует или связывает файл без копирования данных; возвращает способ или None"""
+        if fcntl is not None:
+            try:
+                with open(path, 'rb') as src, open(staged_path, 'wb') as dst:
+                    fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+                shutil.copystat(path, staged_path)
+                return 'reflink'
+            except OSError:
+                pass
+        if self.hardlinks:
+            # Место под ссылку занято пустым файлом от mkstemp
+            os.remove(staged_path)
+            try:
+                os.link(path, staged_path)
+                return 'hardlink'
+            except OSError:
+                open(staged_path, 'wb').close()
+        return None
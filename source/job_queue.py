@@ -0,0 +1,337 @@
+# job_queue.py
+import json
+import random
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_RETRY_DELAY = 10.0
+MAX_RETRY_DELAY = 600.0
+# Как часто диспетчер просыпается сам, даже если его не будили
+DISPATCH_INTERVAL = 2.0
+
+QUEUED, RUNNING = 'queued', 'running'
+SUCCEEDED, SKIPPED, FAILED, CANCELLED = 'succeeded', 'skipped', 'failed', 'cancelled'
+FINAL_STATES = (SUCCEEDED, SKIPPED, FAILED, CANCELLED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    client_name TEXT NOT NULL,
+    driver_name TEXT NOT NULL,
+    driver_hash TEXT,
+    priority TEXT NOT NULL DEFAULT 'normal',
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_pending ON jobs(client_name, driver_name)
+    WHERE state IN ('queued', 'running');
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(state, next_attempt_at);
+CREATE INDEX IF NOT EXISTS jobs_client ON jobs(client_name, state, next_attempt_at);
+"""
+_PRIORITY_ORDER = "CASE priority WHEN 'urgent' THEN 0 WHEN 'normal' THEN 1 ELSE 2 END"
+# Имена подключенных клиентов передаются одним параметром-массивом JSON: их число не упирается в лимит параметров
+_ONLINE = "(SELECT value FROM json_each(?))"
+
+Job = namedtuple('Job', 'id client_name driver_name driver_hash priority state attempts max_attempts '
+                        'next_attempt_at created_at updated_at last_error result')
+
+
+class DeploymentQueue:
+    """Постоянная очередь заданий развертывания (клиент, драйвер) в SQLite (WAL).
+
+    Клиент задается именем агента, а не id подключения: имя переживает
+    переподключение и перезапуск сервера. На пару клиент-драйвер в работе
+    бывает одно задание, повторная постановка возвращает уже имеющееся.
+    Задания, которые выполнялись в момент остановки сервера, при запуске
+    возвращаются в очередь: установка идемпотентна, пакет из кеша агента
+    не качается заново, а недокачанный продолжается с последнего блока.
+    """
+
+    def __init__(self, path, max_attempts=DEFAULT_MAX_ATTEMPTS, retry_delay=DEFAULT_RETRY_DELAY):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self._db.close()
+
+    def _transaction(self):
+        return _Transaction(self._db)
+
+    @staticmethod
+    def _job(row):
+        return Job(*row) if row else None
+
+    def recover(self):
+        """Возвращает в очередь задания, прерванные остановкой сервера"""
+        now = time.time()
+        with self.lock, self._transaction():
+            cursor = self._db.execute(
+                "UPDATE jobs SET state = ?, attempts = MAX(attempts - 1, 0), next_attempt_at = ?, updated_at = ? "
+                "WHERE state = ?", (QUEUED, now, now, RUNNING))
+            return cursor.rowcount
+
+    def enqueue(self, client_names, driver_name, driver_hash=None, priority='normal', max_attempts=None):
+        """Ставит задания одной транзакцией, возвращает {имя клиента: id задания}"""
+        now = time.time()
+        max_attempts = max_attempts or self.max_attempts
+        job_ids = {}
+        with self.lock, self._transaction():
+            for client_name in client_names:
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE client_name = ? AND driver_name = ? AND state IN (?, ?)",
+                    (client_name, driver_name, QUEUED, RUNNING)).fetchone()
+                if row:
+                    job_ids[client_name] = row[0]
+                    continue
+                cursor = self._db.execute(
+                    "INSERT INTO jobs (client_name, driver_name, driver_hash, priority, state, max_attempts, "
+                    "next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (client_name, driver_name, driver_hash, priority, QUEUED, max_attempts, now, now, now))
+                job_ids[client_name] = cursor.lastrowid
+        return job_ids
+
+    def claim(self, online, limit, now=None):
+        """Забирает в работу до limit готовых заданий клиентов из online"""
+        if limit <= 0 or not online:
+            return []
+        now = time.time() if now is None else now
+        with self.lock, self._transaction():
+            # Задания отключенных клиентов остаются в очереди до их возвращения и не читаются
+            rows = self._db.execute(
+                f"SELECT * FROM jobs WHERE state = ? AND next_attempt_at <= ? AND client_name IN {_ONLINE} "
+                f"ORDER BY {_PRIORITY_ORDER}, id LIMIT ?", (QUEUED, now, _names(online), limit)).fetchall()
+            claimed = [self._job(row) for row in rows]
+            for job in claimed:
+                self._db.execute("UPDATE jobs SET state = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                                 (RUNNING, now, job.id))
+        return [job._replace(state=RUNNING, attempts=job.attempts + 1) for job in claimed]
+
+    def finish(self, job_id, state, result=None):
+        """Завершает задание с итоговым состоянием"""
+        now = time.time()
+        with self.lock, self._transaction():
+            self._db.execute("UPDATE jobs SET state = ?, result = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                             (state, json.dumps(result, ensure_ascii=False) if result is not None else None,
+                              result.get('message') if state == FAILED and result else None, now, job_id))
+
+    def retry(self, job_id, error, count_attempt=True):
+        """Откладывает задание с растущей задержкой; возвращает задержку или None, если попытки кончились"""
+        now = time.time()
+        with self.lock, self._transaction():
+            row = self._db.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            attempts, max_attempts = row
+            if not count_attempt:
+                attempts -= 1
+            if attempts >= max_attempts:
+                self._db.execute("UPDATE jobs SET state = ?, last_error = ?, updated_at = ? WHERE id = ?",
+                                 (FAILED, error, now, job_id))
+                return None
+            delay = 0.0
+            if count_attempt:
+                delay = min(self.retry_delay * 2 ** max(attempts - 1, 0), MAX_RETRY_DELAY)
+                delay *= random.uniform(0.8, 1.2)
+            self._db.execute("UPDATE jobs SET state = ?, attempts = ?, last_error = ?, next_attempt_at = ?, "
+                             "updated_at = ? WHERE id = ?", (QUEUED, attempts, error, now + delay, now, job_id))
+            return delay
+
+    def cancel(self, job_id) -> bool:
+        with self.lock, self._transaction():
+            cursor = self._db.execute("UPDATE jobs SET state = ?, updated_at = ? WHERE id = ? AND state = ?",
+                                      (CANCELLED, time.time(), job_id, QUEUED))
+            return cursor.rowcount == 1
+
+    def get(self, job_id):
+        with self.lock:
+            return self._job(self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+    def jobs(self, state=None, limit=1000):
+        """Последние задания, при необходимости только в одном состоянии"""
+        with self.lock:
+            if state is None:
+                rows = self._db.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+            else:
+                rows = self._db.execute("SELECT * FROM jobs WHERE state = ? ORDER BY id DESC LIMIT ?",
+                                        (state, limit)).fetchall()
+        return [self._job(row) for row in rows]
+
+    def counts(self):
+        """Число заданий по состояниям"""
+        with self.lock:
+            return dict(self._db.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def next_due(self, online=None):
+        """Когда станет готово ближайшее отложенное задание (time.time()) или None.
+
+        С online учитываются только задания этих клиентов: задания
+        отключенных ждут регистрации клиента, а не срока.
+        """
+        with self.lock:
+            if online is None:
+                row = self._db.execute("SELECT MIN(next_attempt_at) FROM jobs WHERE state = ?", (QUEUED,)).fetchone()
+            elif not online:
+                return None
+            else:
+                row = self._db.execute(
+                    f"SELECT MIN(next_attempt_at) FROM jobs WHERE state = ? AND client_name IN {_ONLINE}",
+                    (QUEUED, _names(online))).fetchone()
+        return row[0] if row else None
+
+
+def _names(online):
+    return json.dumps(list(online), ensure_ascii=False)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK для соединения в режиме autocommit"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, *exc):
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class JobDispatcher:
+    """Рабочие, которые берут задания из очереди и выполняют их.
+
+    run_job(job) возвращает словарь результата развертывания. Статус
+    success и skipped завершает задание, offline возвращает его в очередь
+    без траты попытки, остальные ошибки повторяются с растущей задержкой.
+    Слушатели получают (job, state, result) после каждой попытки.
+    slots — семафор развертываний, общий с другими пулами сервера: задание
+    берется из очереди, только когда для него есть свободное место.
+    """
+
+    def __init__(self, queue, run_job, online_clients, max_workers, slots=None):
+        self.queue = queue
+        self.run_job = run_job
+        self.online_clients = online_clients
+        self.max_workers = max_workers
+        self.slots = slots or threading.BoundedSemaphore(max_workers)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="deploy")
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._listeners = []
+        self._thread = None
+
+    def add_listener(self, callback):
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def wake(self):
+        """Просит диспетчер проверить очередь (новые задания, клиент вернулся)"""
+        self._wake.set()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="job-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                with self._lock:
+                    free = self.max_workers - len(self._running)
+                online = self.online_clients()
+                # Места, занятые массовым развертыванием, диспетчеру не достаются
+                slots = 0
+                while slots < free and self.slots.acquire(blocking=False):
+                    slots += 1
+                claimed = []
+                try:
+                    if slots:
+                        claimed = self.queue.claim(online, slots)
+                finally:
+                    for _ in range(slots - len(claimed)):
+                        self.slots.release()
+                for job in claimed:
+                    with self._lock:
+                        self._running.add(job.id)
+                    self._executor.submit(self._run, job)
+                timeout = DISPATCH_INTERVAL
+                # Пока все места заняты, диспетчер будит их освобождение, а задания
+                # отключенных клиентов — их регистрация, поэтому срок ждем только для остальных
+                due = self.queue.next_due(online) if len(claimed) < slots else None
+                if due is not None:
+                    timeout = min(timeout, max(due - time.time(), 0.05))
+            except sqlite3.Error as e:
+                print(f"❌ Ошибка очереди заданий: {e}")
+                timeout = DISPATCH_INTERVAL
+            self._wake.wait(timeout)
+
+    def _run(self, job):
+        try:
+            result = self.run_job(job)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        status = result.get('status')
+        try:
+            if status == 'success':
+                state = SUCCEEDED
+                self.queue.finish(job.id, state, result)
+            elif status == 'skipped':
+                state = SKIPPED
+                self.queue.finish(job.id, state, result)
+            elif status == 'offline':
+                self.queue.retry(job.id, result.get('message'), count_attempt=False)
+                state = QUEUED
+            else:
+                delay = self.queue.retry(job.id, result.get('message'))
+                if delay is None:
+                    state = FAILED
+                else:
+                    state = QUEUED
+                    result = dict(result, retry_in=round(delay, 1))
+        except sqlite3.Error as e:
+            print(f"❌ Не удалось записать итог задания {job.id}: {e}")
+            state = FAILED
+        finally:
+            self.slots.release()
+            with self._lock:
+                self._running.discard(job.id)
+                listeners = list(self._listeners)
+            self._wake.set()
+        for listener in listeners:
+            try:
+                listener(job, state, result)
+            except Exception as e:
+                print(f"❌ Ошибка слушателя заданий: {e}")
@@ -0,0 +1,246 @@
+# metrics.py
+import bisect
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Границы корзин длительностей, секунды: от хеширования маленького файла до долгой установки
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+# Границы корзин скорости передачи, байт/с: от 64 КБ/с до 4 ГБ/с
+THROUGHPUT_BUCKETS = tuple(float(64 * 1024 * 4 ** i) for i in range(9))
+DEFAULT_METRICS_PORT = 9108
+METRICS_PREFIX = 'driver_'
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами: наблюдение — бинарный поиск и сложение"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q, counts=None, count=None):
+        """Оценка квантиля по корзинам (верхняя граница корзины, куда он попал)"""
+        counts = counts or self.counts
+        count = self.count if count is None else count
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            seen += n
+            if seen >= rank:
+                return bound if bound != float('inf') else self.buckets[-1]
+        return self.buckets[-1]
+
+    def snapshot(self):
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        return {
+            'count': count,
+            'sum': total,
+            'avg': total / count if count else 0.0,
+            'p50': self.quantile(0.5, counts, count),
+            'p90': self.quantile(0.9, counts, count),
+            'p99': self.quantile(0.99, counts, count),
+            'buckets': counts,
+        }
+
+
+class Metrics:
+    """Счетчики, гистограммы и датчики сервера.
+
+    Метрика задается именем и метками; счетчики и гистограммы создаются
+    при первом обращении. Датчики — функции, которые вызываются при
+    чтении и возвращают число или {значение метки: число}.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauges = {}
+        self._help = {}
+        self.started_at = time.time()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def histogram(self, name, buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        key = self._key(name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self.lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        return histogram
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        self.histogram(name, buckets, **labels).observe(value)
+
+    def inc(self, name, value=1, **labels):
+        key = self._key(name, labels)
+        with self.lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def gauge(self, name, callback, label=None):
+        """Регистрирует датчик; label — имя метки, если callback возвращает словарь"""
+        with self.lock:
+            self._gauges[name] = (callback, label)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Измеряет длительность блока в гистограмму name"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def _read_gauges(self):
+        with self.lock:
+            gauges = dict(self._gauges)
+        values = {}
+        for name, (callback, label) in gauges.items():
+            try:
+                value = callback()
+            except Exception as e:
+                print(f"⚠️ Не удалось прочитать метрику {name}: {e}")
+                continue
+            if isinstance(value, dict):
+                values[name] = {((label, str(key)),): number for key, number in value.items()}
+            else:
+                values[name] = {(): value}
+        return values
+
+    def stats(self):
+        """Снимок всех метрик для вызова внутри процесса"""
+        with self.lock:
+            histograms = list(self._histograms.items())
+            counters = dict(self._counters)
+        result = {'uptime': time.time() - self.started_at, 'histograms': {}, 'counters': {}, 'gauges': {}}
+        for (name, labels), histogram in histograms:
+            result['histograms'].setdefault(name, {})[_label_text(labels)] = histogram.snapshot()
+        for (name, labels), value in counters.items():
+            result['counters'].setdefault(name, {})[_label_text(labels)] = value
+        for name, values in self._read_gauges().items():
+            result['gauges'][name] = {_label_text(labels): value for labels, value in values.items()}
+        return result
+
+    def render_prometheus(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self.lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name in described:
+                return
+            described.add(name)
+            if name in self._help:
+                lines.append(f"# HELP {METRICS_PREFIX}{name} {self._help[name]}")
+            lines.append(f"# TYPE {METRICS_PREFIX}{name} {kind}")
+
+        for (name, labels), value in counters:
+            header(name, 'counter')
+            lines.append(f"{METRICS_PREFIX}{name}{_prometheus_labels(labels)} {value}")
+        for name, values in sorted(self._read_gauges().items()):
+            header(name, 'gauge')
+            for labels, value in sorted(values.items()):
+                lines.append(f"{METRICS_PREFIX}{name}{_prometheus_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            header(name, 'histogram')
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.sum, histogram.count
+            cumulative = 0
+            for bound, n in zip(histogram.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f"{METRICS_PREFIX}{name}_bucket{_prometheus_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{METRICS_PREFIX}{name}_sum{_prometheus_labels(labels)} {total}")
+            lines.append(f"{METRICS_PREFIX}{name}_count{_prometheus_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _label_text(labels):
+    return ",".join(f"{key}={value}" for key, value in labels) or "_"
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+class MetricsServer:
+    """HTTP-точка метрик: /metrics — формат Prometheus, /stats — JSON"""
+
+    def __init__(self, metrics, host='127.0.0.1', port=DEFAULT_METRICS_PORT):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        if self._httpd is not None:
+            return
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/stats':
+                    body = json.dumps(metrics.stats(), ensure_ascii=False).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            print(f"⚠️ Не удалось открыть точку метрик {self.host}:{self.port}: {e}")
+            return
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True)
+        self._thread.start()
+        print(f"📈 Метрики: http://{self.host}:{self.port}/metrics")
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+            self._thread = None
@@ -0,0 +1,574 @@
+# protocol.py
+import json
+import os
+import select
+import socket
+import struct
+import threading
+import time
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+try:
+    import ssl
+except ImportError:  # Python без OpenSSL
+    ssl = None
+
+# Заголовок кадра: сигнатура, версия протокола, тип, флаги, id запроса, длина
+PROTOCOL_MAGIC = b'DD'
+PROTOCOL_VERSION = 1
+MIN_PROTOCOL_VERSION = 1
+
+HEADER_FORMAT = "!2sBBHIQ"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+
+MSG_JSON = 1
+MSG_BINARY = 2
+
+# Ограничение на размер JSON-сообщения, чтобы битый заголовок не съел всю память
+MAX_JSON_PAYLOAD = 16 * 1024 * 1024
+LEGACY_RECV_SIZE = 8192
+SEND_BUFFER_SIZE = 256 * 1024
+
+
+class ProtocolError(Exception):
+    """Нарушение формата кадра или несовместимая версия протокола"""
+
+
+class ConnectionClosed(ConnectionError):
+    """Соединение закрыто удаленной стороной"""
+
+
+class TransferStats(namedtuple('TransferStats', 'bytes seconds method offset codec', defaults=(0, None))):
+    """Итог одной передачи: объем по сети, длительность, способ (sendfile/send),
+    смещение начала и кодек сжатия"""
+
+    @property
+    def throughput(self) -> float:
+        """Скорость передачи, байт/с"""
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'bytes': self.bytes,
+            'seconds': round(self.seconds, 4),
+            'throughput_mbps': round(self.throughput / (1024 * 1024), 2),
+            'method': self.method,
+            'offset': self.offset,
+            'codec': self.codec
+        }
+
+
+FrameHeader = namedtuple('FrameHeader', 'version msg_type flags request_id length')
+
+
+class Frame(namedtuple('Frame', 'version msg_type flags request_id payload')):
+    def json(self):
+        """Декодирует JSON-полезную нагрузку кадра"""
+        return decode_json(self.payload)
+
+
+def pack_header(msg_type, length, request_id=0, flags=0, version=PROTOCOL_VERSION):
+    """Упаковывает заголовок кадра"""
+    return struct.pack(HEADER_FORMAT, PROTOCOL_MAGIC, version, msg_type, flags, request_id, length)
+
+
+def unpack_header(data) -> FrameHeader:
+    """Распаковывает и проверяет заголовок кадра"""
+    magic, version, msg_type, flags, request_id, length = struct.unpack(HEADER_FORMAT, data)
+    if magic != PROTOCOL_MAGIC:
+        raise ProtocolError(f"Неверная сигнатура кадра: {bytes(magic)!r}")
+    if not MIN_PROTOCOL_VERSION <= version <= PROTOCOL_VERSION:
+        raise ProtocolError(f"Неподдерживаемая версия протокола: {version}")
+    if msg_type not in (MSG_JSON, MSG_BINARY):
+        raise ProtocolError(f"Неизвестный тип кадра: {msg_type}")
+    if msg_type == MSG_JSON and length > MAX_JSON_PAYLOAD:
+        raise ProtocolError(f"Слишком большое JSON-сообщение: {length} байт")
+    return FrameHeader(version, msg_type, flags, request_id, length)
+
+
+def encode_json(obj) -> bytes:
+    """Кодирует сообщение в JSON"""
+    return json.dumps(obj).encode('utf-8')
+
+
+def decode_json(data):
+    """Декодирует JSON, возвращает None для не-JSON данных"""
+    try:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            text = bytes(data).decode('utf-8').strip()
+        else:
+            text = str(data).strip()
+        if not text.startswith('{') or not text.endswith('}'):
+            return None
+        return json.loads(text)
+    except (UnicodeDecodeError, json.JSONDecodeError):
+        return None
+
+
+def negotiate_version(remote_version) -> int:
+    """Выбирает версию протокола, понятную обеим сторонам"""
+    try:
+        remote_version = int(remote_version)
+    except (TypeError, ValueError):
+        return MIN_PROTOCOL_VERSION
+    version = min(remote_version, PROTOCOL_VERSION)
+    if version < MIN_PROTOCOL_VERSION:
+        raise ProtocolError(f"Версия протокола {remote_version} больше не поддерживается")
+    return version
+
+
+def detect_framed(sock, timeout=10.0) -> bool:
+    """Определяет по первым байтам, говорит ли собеседник кадрированным протоколом.
+
+    Старые агенты сразу шлют JSON без заголовка, поэтому данные только
+    просматриваются (MSG_PEEK) и остаются в сокете.
+    """
+    sock.settimeout(timeout)
+    for _ in range(50):
+        framed = classify_greeting(sock.recv(len(PROTOCOL_MAGIC), socket.MSG_PEEK))
+        if framed is not None:
+            return framed
+        # Пришла только часть сигнатуры — ждем остаток
+        time.sleep(0.02)
+    return False
+
+
+def classify_greeting(peeked):
+    """По первым байтам соединения: True — кадры, False — старый JSON, None — мало данных"""
+    if not peeked:
+        raise ConnectionClosed("Соединение закрыто до первого сообщения")
+    if not PROTOCOL_MAGIC.startswith(peeked):
+        return False
+    if len(peeked) == len(PROTOCOL_MAGIC):
+        return True
+    return None
+
+
+def legacy_frame(data) -> Frame:
+    """Оборачивает данные старого протокола в кадр"""
+    msg_type = MSG_JSON if decode_json(data) is not None else MSG_BINARY
+    return Frame(0, msg_type, 0, 0, data)
+
+
+def frame_json(frame):
+    """JSON из кадра или None для кадров другого типа"""
+    if frame.msg_type != MSG_JSON:
+        return None
+    return frame.json()
+
+
+def frame_ack(frame, legacy=False):
+    """Подтверждение агента из кадра (словарь) или None"""
+    if legacy:
+        return {"action": "ack"} if bytes(frame.payload).strip() == b'ACK' else None
+    message = frame_json(frame)
+    if message and message.get('action') == 'ack':
+        return message
+    return None
+
+
+def wait_readable(sock, timeout) -> bool:
+    """Ждет данных в сокете, не трогая его таймаут"""
+    if hasattr(select, 'poll'):
+        poller = select.poll()
+        poller.register(sock, select.POLLIN)
+        return bool(poller.poll(None if timeout is None else timeout * 1000))
+    readable, _, _ = select.select([sock], [], [], timeout)
+    return bool(readable)
+
+
+class RequestChannel:
+    """Обмен по одному id запроса поверх общего соединения.
+
+    Единственный читатель соединения раскладывает входящие кадры по
+    каналам, а владелец канала ждет их здесь, поэтому несколько запросов
+    идут по одному сокету одновременно. Тело двоичного кадра канала с
+    stream=True читатель не трогает: владелец канала получает FrameHeader,
+    сам читает тело из сокета и затем вызывает stream_done().
+    """
+
+    def __init__(self, connection, request_id, stream=False):
+        self.connection = connection
+        self.request_id = request_id
+        self.stream = stream
+        self._frames = deque()
+        self._cond = threading.Condition()
+        self._error = None
+        self._stream_done = threading.Event()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def deliver(self, frame):
+        with self._cond:
+            self._frames.append(frame)
+            self._cond.notify()
+
+    def fail(self, error):
+        """Будит ожидающих: соединение больше не даст ответов"""
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+        self._stream_done.set()
+
+    def recv_frame(self, timeout=None) -> Frame:
+        """Ждет очередной кадр этого запроса.
+
+        Для потокового двоичного кадра возвращается FrameHeader: тело лежит в сокете.
+        """
+        connection = self.connection
+        if not connection.reader_active:
+            # Читателя нет (разовый обмен) — читаем сами
+            if connection.legacy or not self.stream:
+                return connection.recv_frame(timeout)
+            header = connection.read_header(timeout)
+            if header.msg_type == MSG_BINARY:
+                return header
+            return Frame(header.version, header.msg_type, header.flags,
+                         header.request_id, connection.read_payload(header))
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames or self._error is not None, timeout):
+                raise socket.timeout("Нет ответа на запрос")
+            if self._frames:
+                return self._frames.popleft()
+            raise self._error
+
+    def recv_json(self, timeout=None):
+        return frame_json(self.recv_frame(timeout))
+
+    def recv_ack(self, timeout=None):
+        return frame_ack(self.recv_frame(timeout), self.connection.legacy)
+
+    def stream_done(self):
+        """Тело потокового кадра прочитано — сокет возвращается читателю"""
+        self._stream_done.set()
+
+    def wait_stream(self):
+        self._stream_done.wait()
+        self._stream_done.clear()
+
+    def send_json(self, obj):
+        self.connection.send_json(obj, self.request_id)
+
+    def send_ack(self, **fields):
+        self.connection.send_ack(self.request_id, **fields)
+
+    def send_file(self, file_path, offset=0, count=None, zero_copy=True, flags=0, throttle=None) -> "TransferStats":
+        return self.connection.send_file(file_path, offset, count, self.request_id, zero_copy, flags, throttle)
+
+    def close(self):
+        self.connection.release(self)
+
+
+class FramedConnection:
+    """Соединение с кадрированным протоколом поверх TCP-сокета.
+
+    Каждый кадр — заголовок фиксированной длины (тип, флаги, id запроса,
+    длина) и полезная нагрузка: JSON или двоичные данные. Чтение идет
+    точно по длине в заранее выделенные буферы. В режиме legacy соединение
+    обслуживает старых агентов, которые шлют «голый» JSON.
+
+    Сокет читает один читатель (read_next), ответы расходятся по каналам
+    запросов (open_request) по id. Старый протокол id не несет, поэтому
+    по legacy-соединению одновременно идет только один запрос.
+    """
+
+    def __init__(self, sock, legacy=False, version=PROTOCOL_VERSION):
+        self.sock = sock
+        self.legacy = legacy
+        self.version = version
+        # id клиента в реестре сервера (заполняет сервер)
+        self.client_id = None
+        self.send_lock = threading.Lock()
+        # Готовые кадры, которые ждут, пока другой поток допишет свой (см. post_json)
+        self._pending = deque()
+        # Очередность запросов по legacy-соединению
+        self.io_lock = threading.RLock()
+        # Есть ли у соединения постоянный читатель, раздающий кадры каналам
+        self.reader_active = False
+        self._channels = {}
+        self.header_buffer = bytearray(HEADER_SIZE)
+        self.header_view = memoryview(self.header_buffer)
+        self._request_counter = 0
+        self._counter_lock = threading.Lock()
+        self._poller = None
+        if hasattr(select, 'poll'):
+            self._poller = select.poll()
+            self._poller.register(sock, select.POLLIN)
+
+    def next_request_id(self) -> int:
+        """Выдает новый id запроса"""
+        with self._counter_lock:
+            self._request_counter = (self._request_counter % 0xFFFFFFFF) + 1
+            return self._request_counter
+
+    # --- Каналы запросов ---
+
+    def open_request(self, stream=False) -> RequestChannel:
+        """Открывает канал для нового запроса со свободным id"""
+        if self.legacy:
+            self.io_lock.acquire()
+        return self.attach(self.next_request_id(), stream)
+
+    def attach(self, request_id, stream=False) -> RequestChannel:
+        """Открывает канал для запроса, начатого другой стороной"""
+        channel = RequestChannel(self, request_id, stream)
+        with self._counter_lock:
+            self._channels[request_id] = channel
+        return channel
+
+    def release(self, channel):
+        with self._counter_lock:
+            if self._channels.get(channel.request_id) is not channel:
+                return
+            del self._channels[channel.request_id]
+        channel.stream_done()
+        if self.legacy:
+            self.io_lock.release()
+
+    def _channel_for(self, request_id):
+        with self._counter_lock:
+            if self.legacy:
+                return next(iter(self._channels.values()), None)
+            return self._channels.get(request_id)
+
+    def dispatch(self, frame) -> bool:
+        """Отдает кадр ожидающему каналу; False — кадр ничей"""
+        channel = self._channel_for(frame.request_id)
+        if channel is None:
+            return False
+        channel.deliver(frame)
+        return True
+
+    def read_next(self, timeout=None):
+        """Читает очередной кадр и раздает его каналам.
+
+        Возвращает кадр, который никто не ждет (новый запрос собеседника),
+        иначе None. Пока владелец потокового канала читает тело, читатель ждет.
+        """
+        if self.legacy:
+            frame = self.recv_frame(timeout)
+            return None if self.dispatch(frame) else frame
+        header = self.read_header(timeout)
+        channel = self._channel_for(header.request_id)
+        if channel is not None and channel.stream and header.msg_type == MSG_BINARY:
+            channel.deliver(header)
+            channel.wait_stream()
+            return None
+        frame = Frame(header.version, header.msg_type, header.flags,
+                      header.request_id, self.read_payload(header))
+        if channel is not None:
+            channel.deliver(frame)
+            return None
+        return frame
+
+    def fail_requests(self, error):
+        """Завершает ожидание всех каналов ошибкой (соединение закрыто)"""
+        with self._counter_lock:
+            channels = list(self._channels.values())
+        for channel in channels:
+            channel.fail(error)
+
+    def settimeout(self, timeout):
+        self.sock.settimeout(timeout)
+
+    def wait_readable(self, timeout) -> bool:
+        """Ждет входящих данных, не меняя таймаут сокета"""
+        if self._poller is not None:
+            return bool(self._poller.poll(None if timeout is None else timeout * 1000))
+        return wait_readable(self.sock, timeout)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def shutdown(self):
+        """Обрывает соединение из другого потока: читатель и отправка сразу получают ошибку"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    # --- Отправка ---
+
+    def encode_frame(self, msg_type, payload=b"", request_id=0, flags=0) -> bytes:
+        """Собирает кадр для отправки (в режиме legacy — только полезная нагрузка)"""
+        if self.legacy:
+            return bytes(payload)
+        return pack_header(msg_type, len(payload), request_id, flags, self.version) + bytes(payload)
+
+    def send_frame(self, msg_type, payload=b"", request_id=0, flags=0):
+        """Отправляет кадр целиком"""
+        data = self.encode_frame(msg_type, payload, request_id, flags)
+        with self._sending():
+            self._write(data)
+
+    def post_json(self, obj, request_id=0):
+        """Отправляет JSON-сообщение, не дожидаясь замка отправки.
+
+        Для читателя соединения: пока другой поток пишет длинный кадр
+        (файл под ограничением полосы), сообщение встает в очередь и уходит
+        сразу после этого кадра, а читатель продолжает принимать кадры.
+        """
+        self._pending.append(self.encode_frame(MSG_JSON, encode_json(obj), request_id))
+        self._flush_pending()
+
+    def _flush_pending(self):
+        while self._pending and self.send_lock.acquire(blocking=False):
+            try:
+                self._write_pending()
+            finally:
+                self.send_lock.release()
+
+    def _write_pending(self):
+        while self._pending:
+            self._write(self._pending.popleft())
+
+    @contextmanager
+    def _sending(self):
+        """Захватывает отправку; отложенные за это время кадры уходят следом"""
+        with self.send_lock:
+            try:
+                yield
+            finally:
+                self._write_pending()
+        # Кадр, отложенный между последней проверкой и освобождением замка
+        self._flush_pending()
+
+    def _write(self, data):
+        """Низкоуровневая отправка готовых байт (вызывается под send_lock)"""
+        self.sock.sendall(data)
+
+    def _write_file(self, header, f, offset, count, method, throttle=None):
+        """Отправляет заголовок и участок файла, возвращает число байт тела.
+
+        С throttle тело уходит кусками: throttle(n) ждет разрешения
+        планировщика полосы и возвращает, сколько байт можно отправить.
+        """
+        if header:
+            self.sock.sendall(header)
+        if count <= 0:
+            return 0
+        if throttle is None:
+            return self._write_range(f, offset, count, method)
+        sent = 0
+        while sent < count:
+            allowed = throttle(count - sent)
+            n = self._write_range(f, offset + sent, allowed, method)
+            sent += n
+            if n != allowed:
+                break
+        return sent
+
+    def _write_range(self, f, offset, count, method):
+        if method == 'sendfile':
+            return self.sock.sendfile(f, offset, count)
+        f.seek(offset)
+        return self._send_from_file(f, count)
+
+    def send_json(self, obj, request_id=0):
+        """Отправляет JSON-сообщение"""
+        self.send_frame(MSG_JSON, encode_json(obj), request_id)
+
+    def send_ack(self, request_id=0, **fields):
+        """Подтверждает получение метаданных файла"""
+        if self.legacy:
+            self.send_frame(MSG_BINARY, b'ACK')
+            return
+        message = {"action": "ack"}
+        message.update(fields)
+        self.send_json(message, request_id)
+
+    def can_zero_copy(self) -> bool:
+        """Можно ли отдавать файл ядру напрямую (os.sendfile)"""
+        if not hasattr(os, 'sendfile'):
+            return False
+        # Через TLS данные шифруются в пользовательском пространстве
+        return ssl is None or not isinstance(self.sock, ssl.SSLSocket)
+
+    def send_file(self, file_path, offset=0, count=None, request_id=0, zero_copy=True, flags=0,
+                  throttle=None) -> "TransferStats":
+        """Отправляет участок файла одним двоичным кадром.
+
+        Тело кадра уходит через socket.sendfile без копирования в Python,
+        а там, где это невозможно, — циклом send из переиспользуемого буфера.
+        """
+        with open(file_path, 'rb') as f:
+            if count is None:
+                count = os.fstat(f.fileno()).st_size - offset
+            method = 'sendfile' if zero_copy and self.can_zero_copy() else 'send'
+            header = b"" if self.legacy else pack_header(MSG_BINARY, count, request_id, flags, self.version)
+            with self._sending():
+                started = time.perf_counter()
+                sent = self._write_file(header, f, offset, count, method, throttle)
+                if sent != count:
+                    raise ProtocolError("Файл укоротился во время отправки")
+                elapsed = time.perf_counter() - started
+        return TransferStats(count, elapsed, method, offset)
+
+    def _send_from_file(self, f, count):
+        """Запасной путь: чтение в переиспользуемый буфер и send"""
+        buffer = bytearray(min(SEND_BUFFER_SIZE, count))
+        view = memoryview(buffer)
+        sent = 0
+        while sent < count:
+            n = f.readinto(view[:min(len(buffer), count - sent)])
+            if not n:
+                break
+            self.sock.sendall(view[:n])
+            sent += n
+        return sent
+
+    # --- Прием ---
+
+    def recv_exact_into(self, view):
+        """Заполняет буфер ровно его длиной"""
+        received = 0
+        total = len(view)
+        while received < total:
+            n = self.sock.recv_into(view[received:], total - received)
+            if n == 0:
+                raise ConnectionClosed("Соединение закрыто удаленной стороной")
+            received += n
+        return received
+
+    def read_header(self, timeout=None) -> FrameHeader:
+        """Читает заголовок очередного кадра"""
+        if timeout is not None:
+            self.sock.settimeout(timeout)
+        self.recv_exact_into(self.header_view)
+        return unpack_header(self.header_buffer)
+
+    def read_payload(self, header: FrameHeader) -> bytearray:
+        """Читает полезную нагрузку кадра в заранее выделенный буфер"""
+        payload = bytearray(header.length)
+        if header.length:
+            self.recv_exact_into(memoryview(payload))
+        return payload
+
+    def recv_frame(self, timeout=None) -> Frame:
+        """Читает кадр целиком"""
+        if self.legacy:
+            if timeout is not None:
+                self.sock.settimeout(timeout)
+            data = self.sock.recv(LEGACY_RECV_SIZE)
+            if not data:
+                raise ConnectionClosed("Соединение закрыто удаленной стороной")
+            return legacy_frame(data)
+        header = self.read_header(timeout)
+        return Frame(header.version, header.msg_type, header.flags,
+                     header.request_id, self.read_payload(header))
+
+    def recv_json(self, timeout=None):
+        """Читает JSON-сообщение, возвращает None для кадров другого типа"""
+        return frame_json(self.recv_frame(timeout))
+
+    def recv_ack(self, timeout=None):
+        """Ждет подтверждения от агента, возвращает словарь или None"""
+        return frame_ack(self.recv_frame(timeout), self.legacy)
@@ -1,29 +1,153 @@
 # server_admin.py
 import socket
+import sqlite3
 import threading
 import os
 import json
-import hashlib
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List
+from compression import (CompressedVariants, CODEC_IDS, available_codecs,
+                         choose_codec, is_compressible)
+from bandwidth import BandwidthScheduler, DEFAULT_PRIORITY
+from client_feed import ClientFeed, ADDED, UPDATED, REMOVED
+from compatibility import CompatibilityEngine
+from delta import DeltaStore, DEFAULT_MAX_BASES
+from driver_catalog import DriverCatalog
+from heartbeat import TimerWheel, HeartbeatSweeper, enable_keepalive, set_listen_options, DEFAULT_HEARTBEAT_TIMEOUT
+from swarm import SwarmTracker, DEFAULT_MAX_PEERS
+from hash_index import DriverHashIndex, DEFAULT_HASH_ALGORITHM, DEFAULT_CHUNK_SIZE
+from ingest import DriverIngest
+from history import DeploymentHistory
+from job_queue import DeploymentQueue, JobDispatcher, DEFAULT_MAX_ATTEMPTS, DEFAULT_RETRY_DELAY
+from metrics import Metrics, MetricsServer, THROUGHPUT_BUCKETS, DEFAULT_METRICS_PORT
+from protocol import (FramedConnection, ConnectionClosed, ProtocolError, TransferStats,
+                      PROTOCOL_VERSION, detect_framed, frame_ack, frame_json, negotiate_version)
 
 class DriverDeploymentServer:
-    def __init__(self, host=None, port=8888):
+    def __init__(self, host=None, port=8888, config=None):
         # Читаем конфиг и устанавливаем параметры
-        config = self.load_config()
+        config = config or self.load_config()
         self.host = host or config.get('server_host', '172.20.10.4')
         self.port = port or config.get('server_port', 8888)
+        # Сколько клиентов обслуживается одновременно при массовом развертывании
+        self.max_parallel_deploys = max(1, int(config.get('max_parallel_deploys', 16)))
+        # Сколько ждать результата установки от одного клиента
+        self.deploy_timeout = float(config.get('deploy_timeout', 180.0))
+        self.accept_backlog = int(config.get('accept_backlog', 128))
+        # Отдавать файлы через sendfile без копирования в Python
+        self.zero_copy_transfer = bool(config.get('zero_copy_transfer', True))
+        # Ограничения исходящей полосы (байт/с, 0 — без ограничения): общее, на площадку, на клиента
+        self.bandwidth = BandwidthScheduler(
+            global_rate=float(config.get('bandwidth_limit', 0)),
+            site_rate=float(config.get('bandwidth_site_limit', 0)),
+            client_rate=float(config.get('bandwidth_client_limit', 0)),
+            site_prefix=int(config.get('bandwidth_site_prefix', 24)),
+            site_rates=config.get('bandwidth_site_limits'),
+            client_rates=config.get('bandwidth_client_limits')
+        )
+        # Агент без сообщений дольше этого срока считается пропавшим и выселяется
+        self.heartbeat_timeout = float(config.get('heartbeat_timeout', DEFAULT_HEARTBEAT_TIMEOUT))
+        self.liveness = TimerWheel()
+        self.sweeper = HeartbeatSweeper(self.liveness, self.evict_client)
         self.connected_clients: Dict[str, Dict] = {}
         self.clients_lock = threading.Lock()
+        self.connections: Dict[socket.socket, FramedConnection] = {}
+        # Имя агента -> client_id текущего подключения (задания привязаны к имени)
+        self.client_names: Dict[str, str] = {}
+        # Лента изменений реестра: подписчики применяют дельты вместо полного перечитывания
+        self.client_feed = ClientFeed()
         self.drivers_dir = "drivers"
         self.create_drivers_directory()
+        # Хеши драйверов считаются один раз и хранятся между перезапусками
+        self.hash_index = DriverHashIndex(
+            self.drivers_dir, algorithm=config.get('hash_algorithm', DEFAULT_HASH_ALGORITHM),
+            chunk_size=int(config.get('transfer_chunk_size', DEFAULT_CHUNK_SIZE))
+        )
+        self.hash_index.prune()
+        # Сжатие пакетов при передаче: варианты сжимаются один раз и лежат в drivers/.cache
+        self.compression = bool(config.get('compression', True))
+        self.compression_codecs = [name for name in config.get('compression_codecs', available_codecs())
+                                   if name in available_codecs()]
+        self.variants = CompressedVariants(self.drivers_dir)
+        self.variants.prune(self.hash_index.digests())
+        # Трекер роя: агенты с пакетом в кеше раздают его соседям по подсети
+        self.swarm_enabled = bool(config.get('swarm_enabled', True))
+        self.swarm = SwarmTracker(int(config.get('swarm_max_peers', DEFAULT_MAX_PEERS)),
+                                  int(config.get('swarm_subnet_prefix', 24)))
+        # Каталог в памяти: поиск драйвера без обращения к файловой системе
+        self.catalog = DriverCatalog(
+            self.drivers_dir, self.hash_index, poll_interval=float(config.get('catalog_poll_interval', 2.0))
+        )
+        # Дельты между версиями драйвера: агент с прежней версией получает только изменения
+        self.deltas = None
+        if config.get('delta_updates', True):
+            self.deltas = DeltaStore(self.drivers_dir,
+                                     max_bases=int(config.get('delta_max_bases', DEFAULT_MAX_BASES)))
+            self.deltas.prune([driver['name'] for driver in self.catalog.list()], self.hash_index.digests())
+        # Загрузка новых драйверов в фоне: хеш при копировании, без дублей, каталог обновляется раз на пакет
+        self.ingest = DriverIngest(self.catalog, self.hash_index,
+                                   hardlinks=bool(config.get('ingest_hardlinks', False)), deltas=self.deltas)
+        # Правила совместимости компилируются заново только при изменении каталога
+        self.compatibility = CompatibilityEngine()
+        self._compatibility_version = None
+        self._compatibility_lock = threading.Lock()
+        # Очередь заданий развертывания переживает перезапуск сервера
+        self.jobs = DeploymentQueue(
+            config.get('job_queue_path', 'deploy_jobs.db'),
+            max_attempts=int(config.get('job_max_attempts', DEFAULT_MAX_ATTEMPTS)),
+            retry_delay=float(config.get('job_retry_delay', DEFAULT_RETRY_DELAY))
+        )
+        # Журнал итогов всех развертываний
+        self.history = DeploymentHistory(config.get('history_path', 'deploy_history.db'))
+        # Общий предел развертываний: и массовое развертывание, и задания очереди
+        self.deploy_slots = threading.BoundedSemaphore(self.max_parallel_deploys)
+        self.dispatcher = JobDispatcher(self.jobs, self._run_job, self.get_online_client_names,
+                                        self.max_parallel_deploys, self.deploy_slots)
+        # Метрики по фазам развертывания; HTTP-точка только на локальном адресе (порт 0 — выключена)
+        self.metrics = Metrics()
+        self.register_metrics()
+        metrics_port = int(config.get('metrics_port', DEFAULT_METRICS_PORT))
+        self.metrics_server = MetricsServer(self.metrics, config.get('metrics_host', '127.0.0.1'),
+                                            metrics_port) if metrics_port else None
+        # Итог открытия порта для тех, кто запускает сервер в фоне: ошибка или None
+        self.listen_error = None
+        self._listen_done = threading.Event()
         
-    def load_config(self):
+    @staticmethod
+    def load_config():
         """Загружает конфигурацию из файла config.json"""
         config_path = "config.json"
         default_config = {
             "server_host": "172.20.10.4",
-            "server_port": 8888
+            "server_port": 8888,
+            "max_parallel_deploys": 16,
+            "deploy_timeout": 180.0,
+            "heartbeat_timeout": DEFAULT_HEARTBEAT_TIMEOUT,
+            "accept_backlog": 128,
+            "server_mode": "threaded",
+            "zero_copy_transfer": True,
+            "bandwidth_limit": 0,
+            "bandwidth_site_limit": 0,
+            "bandwidth_site_prefix": 24,
+            "bandwidth_client_limit": 0,
+            "hash_algorithm": DEFAULT_HASH_ALGORITHM,
+            "transfer_chunk_size": DEFAULT_CHUNK_SIZE,
+            "compression": True,
+            "compression_codecs": available_codecs(),
+            "swarm_enabled": True,
+            "swarm_max_peers": DEFAULT_MAX_PEERS,
+            "swarm_subnet_prefix": 24,
+            "catalog_poll_interval": 2.0,
+            "ingest_hardlinks": False,
+            "delta_updates": True,
+            "delta_max_bases": DEFAULT_MAX_BASES,
+            "job_queue_path": "deploy_jobs.db",
+            "history_path": "deploy_history.db",
+            "metrics_host": "127.0.0.1",
+            "metrics_port": DEFAULT_METRICS_PORT,
+            "job_max_attempts": DEFAULT_MAX_ATTEMPTS,
+            "job_retry_delay": DEFAULT_RETRY_DELAY
         }
         
         try:
@@ -42,22 +166,36 @@ class DriverDeploymentServer:
             print(f"❌ Ошибка загрузки конфигурации сервера: {e}")
             return default_config
     
+    def register_metrics(self):
+        """Описывает метрики и подключает датчики реестра, очереди и полосы"""
+        self.metrics.describe('deploy_phase_seconds', 'Длительность фаз развертывания: hash, metadata, transfer, '
+                                                      'result_wait, agent_receive, agent_queue, agent_install, total')
+        self.metrics.describe('install_phases_total', 'События фаз установки от агентов')
+        self.metrics.describe('transfer_throughput_bytes_per_second', 'Скорость передачи одного пакета')
+        self.metrics.describe('transfer_bytes_total', 'Байт драйверов отправлено агентам')
+        self.metrics.describe('deployments_total', 'Итоги развертываний по статусам')
+        self.metrics.describe('delta_fallbacks_total', 'Агент не собрал пакет из дельты и получил его целиком')
+        self.metrics.describe('connected_clients', 'Подключенные агенты')
+        self.metrics.describe('job_queue_depth', 'Задания очереди развертывания по состояниям')
+        self.metrics.describe('bandwidth_waiting_transfers', 'Передачи, ждущие полосы')
+        self.metrics.gauge('connected_clients', self.get_connected_clients_count)
+        self.metrics.gauge('job_queue_depth', lambda: self.jobs.counts(), label='state')
+        self.metrics.gauge('bandwidth_waiting_transfers', lambda: self.bandwidth.stats()['waiting'])
+        self.metrics.describe('client_events_total', 'События ленты реестра клиентов')
+        self.client_feed.add_listener(lambda event: self.metrics.inc('client_events_total', kind=event.kind))
+
+    def get_metrics(self):
+        """Снимок метрик: гистограммы фаз, счетчики и датчики"""
+        return self.metrics.stats()
+
     def create_drivers_directory(self):
         """Создает централизованное хранилище драйверов"""
         if not os.path.exists(self.drivers_dir):
             os.makedirs(self.drivers_dir)
             
     def get_driver_list(self):
-        """Возвращает список драйверов"""
-        drivers = []
-        for file in os.listdir(self.drivers_dir):
-            file_path = os.path.join(self.drivers_dir, file)
-            if os.path.isfile(file_path):
-                drivers.append({
-                    'name': file,
-                    'size': os.path.getsize(file_path)
-                })
-        return drivers
+        """Возвращает список драйверов из каталога"""
+        return self.catalog.list()
     
     def safe_json_decode(self, data):
         """Безопасно декодирует JSON данные"""
@@ -82,135 +220,280 @@ class DriverDeploymentServer:
             print(f"❌ Ошибка декодирования: {e}")
             return None
     
+    def get_connection(self, client_socket) -> FramedConnection:
+        """Возвращает соединение протокола для сокета клиента"""
+        if isinstance(client_socket, FramedConnection):
+            return client_socket
+        with self.clients_lock:
+            connection = self.connections.get(client_socket)
+        if connection is None:
+            if client_socket.fileno() == -1:
+                # Клиент отключился, и его сокет уже закрыт
+                raise ConnectionResetError("Сокет клиента закрыт")
+            # Сокет не зарегистрирован — работаем с ним по-старому
+            connection = FramedConnection(client_socket, legacy=True)
+        return connection
+    
+    def find_client(self, client_socket):
+        """(client_id, имя) зарегистрированного клиента по сокету или соединению, (None, None) если его нет"""
+        if client_socket is None:
+            return None, None
+        with self.clients_lock:
+            if isinstance(client_socket, FramedConnection):
+                client_id = client_socket.client_id
+            else:
+                connection = self.connections.get(client_socket)
+                client_id = connection.client_id if connection is not None else None
+            client_name = self.connected_clients.get(client_id, {}).get('client_name', client_id)
+        return client_id, client_name
+
     def get_system_info(self, client_socket) -> Dict:
         """Получает информацию о системе клиента"""
         try:
+            connection = self.get_connection(client_socket)
             command = {"action": "get_system_info"}
-            client_socket.send(json.dumps(command).encode())
-            
-            client_socket.settimeout(5.0)
-            response = client_socket.recv(4096).decode()
-            return json.loads(response).get('system_info', {})
+            with connection.open_request() as channel:
+                channel.send_json(command)
+                response = channel.recv_json(timeout=5.0)
+            return response.get('system_info', {})
         except Exception as e:
             print(f"Ошибка получения системной информации: {e}")
             return {"os": "unknown", "architecture": "unknown"}
     
     def calculate_file_hash(self, file_path):
-        """Вычисляет хеш файла"""
-        hash_md5 = hashlib.md5()
-        with open(file_path, "rb") as f:
-            for chunk in iter(lambda: f.read(4096), b""):
-                hash_md5.update(chunk)
-        return hash_md5.hexdigest()
+        """Возвращает хеш файла из индекса (пересчитывается, только если файл изменился)"""
+        return self.hash_index.get_hash(file_path)
     
-    def send_file(self, client_socket, file_path):
-        """Отправляет файл клиенту"""
+    def select_codec(self, client_id, driver_name):
+        """Выбирает кодек для передачи драйвера клиенту или None"""
+        if not self.compression or not is_compressible(driver_name):
+            return None
+        with self.clients_lock:
+            client_codecs = self.connected_clients.get(client_id, {}).get('codecs')
+        return choose_codec(self.compression_codecs, client_codecs)
+
+    def prepare_variant(self, driver, codec):
+        """Возвращает (кодек, путь) сжатого варианта драйвера или None"""
+        if codec is None:
+            return None
+        try:
+            digest = self.catalog.get_hash(driver['id'])
+            variant_path = self.variants.get(driver['path'], digest, codec)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Не удалось сжать {driver['name']} ({codec}): {e}")
+            return None
+        return (codec, variant_path) if variant_path else None
+
+    def prepare_deltas(self, driver, client_id):
+        """Готовые дельты к текущей версии драйвера {хеш базы: (путь, размер)} или None"""
+        if self.deltas is None:
+            return None
+        with self.clients_lock:
+            if not self.connected_clients.get(client_id, {}).get('delta'):
+                return None
+        try:
+            digest = self.catalog.get_hash(driver['id'])
+            return self.deltas.get(driver['name'], digest, driver['path']) or None
+        except OSError as e:
+            print(f"⚠️ Не удалось подготовить дельты {driver['name']}: {e}")
+            return None
+
+    def get_client_host(self, client_id):
+        """IP-адрес клиента из реестра"""
+        with self.clients_lock:
+            client_info = self.connected_clients.get(client_id)
+            return client_info['address'][0] if client_info else None
+
+    def get_swarm_peers(self, client_id, digest):
+        """Пиры из подсети клиента, у которых есть пакет с этим хешем"""
+        if not self.swarm_enabled:
+            return []
+        return self.swarm.peers_for(digest, client_id, self.get_client_host(client_id))
+
+    def paced(self, flow, client_id):
+        """Ограничитель передачи: ждет разрешения полосы и продлевает срок жизни агента.
+
+        Очередной кусок файла уходит, только когда агент принял предыдущие,
+        поэтому идущая передача — такой же признак жизни, как heartbeat.
+        """
+        def throttle(n):
+            allowed = flow(n)
+            self.liveness.touch(client_id)
+            return allowed
+        return throttle
+
+    def send_file(self, channel, file_path, variant=None, priority=DEFAULT_PRIORITY, deltas=None):
+        """Отправляет файл клиенту в канале запроса, возвращает TransferStats или False
+
+        variant — (кодек, путь) заранее сжатого файла; он отправляется
+        вместо исходного, если агент качает файл с начала. deltas —
+        {хеш базы: (путь, размер)}: агент, у которого есть одна из баз,
+        получает только дельту, а если не соберет из нее пакет, то файл
+        целиком. Тело идет через планировщик полосы с классом priority.
+        """
         try:
+            started = time.perf_counter()
             file_size = os.path.getsize(file_path)
             file_info = {
                 'name': os.path.basename(file_path),
                 'size': file_size,
-                'hash': self.calculate_file_hash(file_path)
+                'hash': self.calculate_file_hash(file_path),
+                'hash_algorithm': self.hash_index.algorithm,
+                # По хешам блоков агент проверяет поток и продолжает оборванную загрузку
+                'chunk_size': self.hash_index.chunk_size,
+                'chunk_hashes': self.hash_index.get_chunk_hashes(file_path)
             }
+            if variant:
+                file_info['codec'] = variant[0]
+            if deltas:
+                file_info['deltas'] = {base: size for base, (_, size) in deltas.items()}
+            self.metrics.observe('deploy_phase_seconds', time.perf_counter() - started, phase='hash')
+            peers = self.get_swarm_peers(channel.connection.client_id, file_info['hash'])
+            if peers:
+                file_info['peers'] = peers
             
-            # Отправляем информацию о файле
-            file_info_json = json.dumps(file_info)
-            client_socket.send(file_info_json.encode())
+            # Отправляем информацию о файле; фаза metadata — до подтверждения агента
+            started = time.perf_counter()
+            channel.send_json(file_info)
             
             # Ждем подтверждения
-            client_socket.settimeout(5.0)
-            ack = client_socket.recv(1024)
-            if ack != b'ACK':
+            # С пирами агент подтверждает после того, как заберет у них что сможет
+            ack = self._recv_ack(channel, file_info['name'], self.deploy_timeout if peers else 5.0)
+            self.metrics.observe('deploy_phase_seconds', time.perf_counter() - started, phase='metadata')
+            if not ack:
                 print("Клиент не подтвердил получение информации о файле")
                 return False
             
-            # Отправляем файл
-            with open(file_path, 'rb') as f:
-                total_sent = 0
-                while total_sent < file_size:
-                    chunk = f.read(8192)  # Увеличиваем размер чанка
-                    if not chunk:
-                        break
-                    sent = client_socket.send(chunk)
-                    if sent == 0:
-                        print("Соединение разорвано при отправке файла")
-                        return False
-                    total_sent += sent
+            if ack.get('have'):
+                # Пакет с этим хешем уже лежит в кеше агента
+                print(f"📦 Файл {file_path} уже есть у клиента, передача пропущена")
+                return TransferStats(0, 0.0, 'cached')
+            
+            client_id = channel.connection.client_id
+            stats = None
+            base = ack.get('base')
+            if deltas and base in deltas:
+                # У агента есть прежняя версия: шлем только дельту, пакет он соберет и проверит сам
+                with self.bandwidth.flow(client_id, self.get_client_host(client_id), priority) as flow:
+                    stats = channel.send_file(deltas[base][0], 0, None, self.zero_copy_transfer,
+                                              throttle=self.paced(flow, client_id))
+                stats = stats._replace(codec='delta')
+                ack = self._recv_ack(channel, file_info['name'], self.deploy_timeout)
+                if not ack:
+                    print("Клиент не сообщил, собран ли пакет из дельты")
+                    return False
+                if not ack.get('rebuilt'):
+                    # Ответ агента — обычное подтверждение для передачи целиком
+                    print(f"⚠️ Клиент не собрал {file_path} из дельты, отправляю целиком")
+                    self.metrics.inc('delta_fallbacks_total')
+                    self.metrics.inc('transfer_bytes_total', stats.bytes, method=stats.method)
+                    stats = None
+            
+            if stats is None:
+                # Агент с недокачанным файлом просит продолжить с границы блока
+                offset = ack.get('offset') or 0
+                if not isinstance(offset, int) or not 0 <= offset <= file_size:
+                    offset = 0
+                if offset:
+                    print(f"⏩ Продолжаю передачу {file_path} с {offset} из {file_size} байт")
+                
+                # Отправляем файл; продолжение докачки идет без сжатия
+                with self.bandwidth.flow(client_id, self.get_client_host(client_id), priority) as flow:
+                    throttle = self.paced(flow, client_id)
+                    if variant and not offset:
+                        codec, variant_path = variant
+                        stats = channel.send_file(variant_path, 0, None, self.zero_copy_transfer,
+                                                  flags=CODEC_IDS[codec], throttle=throttle)
+                        stats = stats._replace(codec=codec)
+                    else:
+                        stats = channel.send_file(file_path, offset, file_size - offset, self.zero_copy_transfer,
+                                                  throttle=throttle)
+            self.metrics.observe('deploy_phase_seconds', stats.seconds, phase='transfer')
+            if stats.bytes:
+                self.metrics.observe('transfer_throughput_bytes_per_second', stats.throughput, THROUGHPUT_BUCKETS)
+            self.metrics.inc('transfer_bytes_total', stats.bytes, method=stats.method)
                     
-            print(f"✅ Файл {file_path} отправлен успешно")
-            return True
+            print(f"✅ Файл {file_path} отправлен успешно: {stats.bytes} байт за {stats.seconds:.2f} с "
+                  f"({stats.throughput / (1024 * 1024):.1f} МБ/с, {stats.method}"
+                  f"{', ' + stats.codec if stats.codec else ''})")
+            return stats
             
         except socket.timeout:
             print(f"⏰ Таймаут при отправке файла")
             return False
+        except (ConnectionClosed, BrokenPipeError):
+            print("Соединение разорвано при отправке файла")
+            return False
         except Exception as e:
             print(f"❌ Ошибка отправки файла: {e}")
             return False
     
+    def compatibility_engine(self) -> CompatibilityEngine:
+        """Возвращает движок совместимости, собранный по текущему каталогу"""
+        with self._compatibility_lock:
+            version = self.catalog.version
+            if version != self._compatibility_version:
+                self.compatibility.compile(self.catalog.list())
+                self._compatibility_version = version
+            return self.compatibility
+
     def is_driver_compatible(self, driver_name: str, system_info: Dict) -> bool:
-        """Проверяет совместимость драйвера с системой"""
-        os_name = system_info.get('os', '').lower()
-        
-        if 'windows' in os_name and 'win' in driver_name.lower():
-            return True
-        elif 'linux' in os_name and 'linux' in driver_name.lower():
-            return True
-        elif 'network' in driver_name.lower():
-            return True
-            
-        return False
+        """Проверяет совместимость драйвера с системой по метаданным каталога"""
+        driver = self.catalog.resolve(driver_name)
+        if not driver:
+            return False
+        return self.compatibility_engine().matches(driver['id'], system_info)
+
+    def compatibility_plan(self, client_ids=None):
+        """Матрица «драйверы × клиенты» по инвентарю, присланному при регистрации"""
+        with self.clients_lock:
+            if client_ids is None:
+                client_ids = list(self.connected_clients)
+            inventories = {client_id: self.connected_clients[client_id]['system_info']
+                           for client_id in client_ids
+                           if self.connected_clients.get(client_id, {}).get('system_info')}
+        return self.compatibility_engine().plan(inventories)
     
-    def deploy_to_client(self, pSocket, pDriverName):
-        driver_selected = None
+    def deploy_to_client(self, pSocket, pDriverName, timeout=None, priority=None):
+        started_at = time.time()
+        # Клиента определяем до развертывания: после отключения его сокет уже не найти в реестре
+        client_id, client_name = self.find_client(pSocket)
+        result = self._deploy_to_client(pSocket, pDriverName, timeout, priority)
+        self.metrics.observe('deploy_phase_seconds', time.time() - started_at, phase='total')
+        self.metrics.inc('deployments_total', status=result.get('status', 'unknown'))
+        if client_id:
+            self.record_history(client_id, pDriverName, result, started_at, client_name)
+        return result
+
+    def _deploy_to_client(self, pSocket, pDriverName, timeout=None, priority=None):
         if pSocket is None:
             return {"status": "error", "message": "Сокет клиента не найден или не подключён"}
         
         try:
-            drivers = self.get_driver_list()
-       
-            for driver in drivers:
-                cmp_driver = f"{driver['name']} {driver['size']} байт"
-                if cmp_driver == pDriverName:
-                    driver_selected = driver['name']
-                    break
-
-            if not driver_selected:
+            # pDriverName — id драйвера, имя файла или подпись из списка консоли
+            driver = self.catalog.resolve(pDriverName)
+            if not driver:
                 return {"status": "error", "message": "Драйвер не найден"}
+            driver_selected = driver['name']
+            connection = self.get_connection(pSocket)
+            # Сжатие готовим до захвата соединения: первое сжатие файла может быть долгим
+            variant = self.prepare_variant(driver, self.select_codec(connection.client_id, driver_selected))
+            deltas = self.prepare_deltas(driver, connection.client_id)
 
             command = {
                 "action": "install_driver",
                 "driver_name": driver_selected
             }
 
-            print(f"🔄 Отправка команды установки драйвера: {driver_selected}")
-            pSocket.send(json.dumps(command).encode())
+            driver_path = driver['path']
 
-            driver_path = os.path.join(self.drivers_dir, driver_selected)
-            
-            if self.send_file(pSocket, driver_path):
-                print(f"✅ Файл отправлен, ожидаю результат установки...")
-                
-                pSocket.settimeout(180.0)  # 3 минуты на установку
-                
-                try:
-                    response = pSocket.recv(8192).decode()  # Увеличиваем буфер
-                    result = self.safe_json_decode(response)
-                    if result:
-                        print(f"📨 Получен результат от клиента: {result.get('status', 'unknown')}")
-                        return result
-                    else:
-                        print(f"❌ Неверный формат ответа от клиента")
-                        return {"status": "error", "message": "Неверный формат ответа от клиента"}
-                    
-                except socket.timeout:
-                    print(f"⏰ Таймаут при ожидании результата установки")
-                    return {"status": "error", "message": "Таймаут при ожидании результата установки"}
-                except ConnectionResetError:
-                    print(f"🔒 Соединение с клиентом разорвано во время установки")
-                    return {"status": "error", "message": "Соединение разорвано во время установки"}
-                    
-            else:
-                return {"status": "error", "message": "Ошибка отправки файла"}
+            # Ответы агента по этой установке приходят в свой канал по id запроса,
+            # поэтому параллельно с ней по соединению идут и другие запросы
+            # Класс полосы: явно заданный или из метаданных драйвера (срочные обновления безопасности)
+            priority = priority or driver.get('priority', DEFAULT_PRIORITY)
+            with connection.open_request() as channel:
+                return self._run_install(channel, driver_selected, driver_path, command,
+                                         timeout or self.deploy_timeout, variant, priority, deltas)
 
         except socket.timeout:
             return {"status": "error", "message": "Таймаут при установке драйвера"}
@@ -220,82 +503,444 @@ class DriverDeploymentServer:
         except Exception as e:
             print(f"❌ Ошибка в deploy_to_client: {e}")
             return {"status": "error", "message": str(e)}
+
+    def _run_install(self, channel, driver_selected, driver_path, command, timeout, variant=None,
+                     priority=DEFAULT_PRIORITY, deltas=None):
+        """Проводит обмен командой установки, файлом и результатом"""
+        connection = channel.connection
+        print(f"🔄 Отправка команды установки драйвера: {driver_selected}")
+        channel.send_json(command)
+
+        self.set_install_phase(connection.client_id, driver_selected, 'downloading')
+        try:
+            return self._finish_install(channel, driver_selected, driver_path, timeout, variant, priority, deltas)
+        finally:
+            self.set_install_phase(connection.client_id, driver_selected, None)
+
+    def _finish_install(self, channel, driver_selected, driver_path, timeout, variant, priority, deltas):
+        """Передает файл и ждет результат установки"""
+        connection = channel.connection
+        transfer = self.send_file(channel, driver_path, variant, priority, deltas)
+        if transfer:
+            print(f"✅ Файл отправлен, ожидаю результат установки...")
+            
+            try:
+                started = time.perf_counter()
+                result = self._wait_install_result(channel, driver_selected, timeout)
+                self.metrics.observe('deploy_phase_seconds', time.perf_counter() - started, phase='result_wait')
+                if result:
+                    print(f"📨 Получен результат от клиента: {result.get('status', 'unknown')}")
+                    result['transfer'] = transfer.as_dict()
+                    timings = result.get('timings')
+                    if isinstance(timings, dict):
+                        # Фазы агента: прием пакета, очередь установщика и сама установка
+                        for phase in ('receive', 'queue', 'install'):
+                            if isinstance(timings.get(phase), (int, float)):
+                                self.metrics.observe('deploy_phase_seconds', timings[phase], phase='agent_' + phase)
+                    if isinstance(result.get('cache'), dict):
+                        self.update_client_info(connection.client_id, cache_stats=result['cache'])
+                    if result.get('status') == 'success':
+                        # Теперь пакет лежит в кеше агента, и он может раздавать его соседям
+                        self.swarm.add_package(connection.client_id, self.hash_index.get_hash(driver_path))
+                    return result
+                else:
+                    print(f"❌ Неверный формат ответа от клиента")
+                    return {"status": "error", "message": "Неверный формат ответа от клиента"}
+                
+            except socket.timeout:
+                print(f"⏰ Таймаут при ожидании результата установки")
+                return {"status": "error", "message": "Таймаут при ожидании результата установки"}
+            except (ConnectionResetError, ConnectionClosed):
+                print(f"🔒 Соединение с клиентом разорвано во время установки")
+                return {"status": "error", "message": "Соединение разорвано во время установки"}
+                
+        else:
+            return {"status": "error", "message": "Ошибка отправки файла"}
     
-    def mass_deploy(self, driver_name: str):
-        """Массовое развертывание драйвера на всех подключенных клиентах"""
-        results = {}
-        
+    def _wait_install_result(self, channel, driver_name, timeout):
+        """Ждет результат установки, принимая фазы от агента.
+
+        Пока установка стоит в очереди установщика агента (queued),
+        ожидание не ограничено: за живостью агента следит heartbeat, а при
+        обрыве соединения канал завершится ошибкой. С фазы installing
+        timeout снова ограничивает ожидание.
+        """
+        wait = timeout
+        while True:
+            message = channel.recv_json(timeout=wait)
+            if not message or message.get('event') != 'phase':
+                return message
+            phase = self._note_phase(channel, driver_name, message)
+            if phase is not None:
+                wait = None if phase == 'queued' else timeout
+
+    def _recv_ack(self, channel, driver_name, timeout):
+        """Подтверждение агента; фазы, пришедшие раньше него (downloading), запоминаются"""
+        legacy = channel.connection.legacy
+        while True:
+            frame = channel.recv_frame(timeout=timeout)
+            message = None if legacy else frame_json(frame)
+            if not message or message.get('event') != 'phase':
+                return frame_ack(frame, legacy)
+            self._note_phase(channel, driver_name, message)
+
+    def _note_phase(self, channel, driver_name, message):
+        """Запоминает фазу из события агента, возвращает ее или None"""
+        phase = message.get('phase')
+        if not isinstance(phase, str):
+            return None
+        client_id = channel.connection.client_id
+        print(f"⏳ Клиент {client_id}: {driver_name} — {phase}")
+        self.set_install_phase(client_id, driver_name, phase)
+        return phase
+
+    def set_install_phase(self, client_id, driver_name, phase):
+        """Запоминает фазу текущей установки драйвера на клиенте; None — установка закончилась"""
         with self.clients_lock:
-            client_ids = list(self.connected_clients.keys())
-        
-        for client_id in client_ids:
-            try:
-                with self.clients_lock:
-                    if client_id not in self.connected_clients:
-                        results[client_id] = {"status": "error", "message": "Клиент отключен"}
-                        continue
-                    
-                    client_info = self.connected_clients[client_id]
-                    client_socket = client_info['socket']
+            client_info = self.connected_clients.get(client_id)
+            if client_info is None:
+                return
+            installs = client_info.setdefault('installs', {})
+            if phase is None:
+                installs.pop(driver_name, None)
+            else:
+                installs[driver_name] = phase
+        if phase is not None:
+            self.metrics.inc('install_phases_total', phase=phase)
+
+    def get_install_phases(self):
+        """Текущие установки: {client_id: {драйвер: фаза}}"""
+        with self.clients_lock:
+            return {client_id: dict(client_info['installs'])
+                    for client_id, client_info in self.connected_clients.items() if client_info.get('installs')}
+
+    def get_client_name(self, client_id):
+        """Имя агента, под которым он зарегистрировался (или client_id)"""
+        with self.clients_lock:
+            return self.connected_clients.get(client_id, {}).get('client_name', client_id)
+
+    def record_history(self, client_id, driver_name, result, started_at=None, client_name=None):
+        """Записывает итог развертывания в журнал (client_name — если клиент мог уже отключиться)"""
+        driver = self.catalog.resolve(driver_name)
+        try:
+            self.history.record(client_name or self.get_client_name(client_id),
+                                driver['name'] if driver else driver_name, result,
+                                started_at, driver.get('version') if driver else None,
+                                driver.get('hash') if driver else None)
+        except sqlite3.Error as e:
+            print(f"❌ Не удалось записать историю развертывания: {e}")
+
+    def get_history(self, client_id=None, driver_name=None, status=None, since=None, until=None, limit=100):
+        """Записи журнала развертываний, последние сначала"""
+        return self.history.query(self.get_client_name(client_id) if client_id else None,
+                                  driver_name, status, since, until, limit)
+
+    def _deploy_one(self, client_id, driver_name, timeout, checked=False, priority=None):
+        """Развертывает драйвер на одном клиенте (задача пула массового развертывания)"""
+        try:
+            with self.clients_lock:
+                if client_id not in self.connected_clients:
+                    return {"status": "error", "message": "Клиент отключен"}
                 
+                client_info = self.connected_clients[client_id]
+                client_socket = client_info['socket']
+            
+            if not checked:
+                # Клиент не прислал инвентарь при регистрации — спрашиваем отдельно
                 system_info = self.get_system_info(client_socket)
+                if not self.is_driver_compatible(driver_name, system_info):
+                    result = {"status": "skipped", "message": "Несовместимый драйвер"}
+                    self.record_history(client_id, driver_name, result)
+                    return result
+            return self.deploy_to_client(client_socket, driver_name, timeout, priority)
                 
-                if self.is_driver_compatible(driver_name, system_info):
-                    result = self.deploy_to_client(client_socket, driver_name)
-                    results[client_id] = result
-                else:
-                    results[client_id] = {"status": "skipped", "message": "Несовместимый драйвер"}
-                    
-            except Exception as e:
-                results[client_id] = {"status": "error", "message": str(e)}
-                
-        return results
+        except Exception as e:
+            return {"status": "error", "message": str(e)}
 
-    def handle_client(self, client_socket, address, client_id):
-        """Обрабатывает подключение клиента"""
-        print(f"🔗 Клиент {client_id} подключен: {address}")
+    def _deploy_in_slot(self, *args):
+        """_deploy_one на одном из max_parallel_deploys мест, общих с очередью заданий"""
+        with self.deploy_slots:
+            try:
+                return self._deploy_one(*args)
+            finally:
+                # Освободившееся место может взять задание из очереди
+                self.dispatcher.wake()
+    
+    def iter_mass_deploy(self, driver_name: str, client_ids=None, max_workers=None, timeout=None, priority=None):
+        """Развертывает драйвер параллельно и отдает пары (client_id, результат) по мере готовности"""
+        if client_ids is None:
+            with self.clients_lock:
+                client_ids = list(self.connected_clients.keys())
+        if not client_ids:
+            return
+        
+        driver = self.catalog.resolve(driver_name)
+        if not driver:
+            for client_id in client_ids:
+                yield client_id, {"status": "error", "message": "Драйвер не найден"}
+            return
+        # Совместимость всех клиентов считается одним проходом по сохраненному инвентарю
+        plan = self.compatibility_plan(client_ids)
+        eligible = set(plan.clients_for(driver['id']))
+        targets = []
+        for client_id in client_ids:
+            if client_id in eligible:
+                targets.append((client_id, True))
+            elif client_id in plan.client_ids:
+                result = {"status": "skipped", "message": "Несовместимый драйвер"}
+                self.record_history(client_id, driver['id'], result)
+                yield client_id, result
+            else:
+                targets.append((client_id, False))
+        if not targets:
+            return
         
+        workers = min(max_workers or self.max_parallel_deploys, len(targets))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="deploy") as executor:
+            futures = {
+                executor.submit(self._deploy_in_slot, client_id, driver['id'], timeout, checked, priority): client_id
+                for client_id, checked in targets
+            }
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+    
+    def mass_deploy(self, driver_name: str, max_workers=None, timeout=None, on_result=None, priority=None):
+        """Массовое развертывание драйвера на всех подключенных клиентах"""
+        results = {}
+        for client_id, result in self.iter_mass_deploy(driver_name, max_workers=max_workers, timeout=timeout,
+                                                       priority=priority):
+            results[client_id] = result
+            if on_result:
+                on_result(client_id, result)
+        return results
+
+    def enqueue_deployment(self, driver_name: str, client_ids=None, priority=None):
+        """Ставит развертывание в постоянную очередь, возвращает {client_id: id задания}
+
+        Задания выполняют рабочие диспетчера; задания отключенных клиентов
+        ждут их переподключения.
+        """
+        driver = self.catalog.resolve(driver_name)
+        if not driver:
+            raise ValueError(f"Драйвер не найден: {driver_name}")
+        with self.clients_lock:
+            if client_ids is None:
+                client_ids = list(self.connected_clients)
+            names = {client_id: self.connected_clients[client_id].get('client_name', client_id)
+                     for client_id in client_ids if client_id in self.connected_clients}
+        by_name = self.jobs.enqueue(names.values(), driver['name'], self.catalog.get_hash(driver['id']),
+                                    priority or driver.get('priority', DEFAULT_PRIORITY))
+        self.dispatcher.wake()
+        return {client_id: by_name[name] for client_id, name in names.items()}
+
+    def get_online_client_names(self):
+        """Имена подключенных агентов"""
+        with self.clients_lock:
+            return set(self.client_names)
+
+    def _run_job(self, job):
+        """Выполняет задание очереди на текущем подключении агента"""
+        with self.clients_lock:
+            client_id = self.client_names.get(job.client_name)
+            system_info = self.connected_clients.get(client_id, {}).get('system_info') if client_id else None
+        if client_id is None:
+            return {"status": "offline", "message": "Клиент отключен"}
+        checked = False
+        if system_info:
+            driver = self.catalog.resolve(job.driver_name)
+            if not driver:
+                return {"status": "error", "message": "Драйвер не найден"}
+            if not self.compatibility_engine().matches(driver['id'], system_info):
+                result = {"status": "skipped", "message": "Несовместимый драйвер"}
+                self.record_history(client_id, driver['id'], result)
+                return result
+            checked = True
+        result = self._deploy_one(client_id, job.driver_name, None, checked, job.priority)
+        if result.get('status') not in ('success', 'skipped') and job.client_name not in self.get_online_client_names():
+            # Агент пропал посреди установки: задание ждет его возвращения, попытка не тратится
+            return dict(result, status="offline")
+        return result
+
+    def get_jobs(self, state=None, limit=1000):
+        """Задания очереди развертывания (последние сначала)"""
+        return self.jobs.jobs(state, limit)
+
+    def start_background_services(self):
+        """Запускает слежение за каталогом, проверку heartbeat и диспетчер заданий"""
+        self.catalog.start_watching()
+        self.sweeper.start()
+        recovered = self.jobs.recover()
+        if recovered:
+            print(f"♻️ Возвращено в очередь прерванных заданий: {recovered}")
+        self.dispatcher.start()
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+
+    def add_client(self, client_id, client_socket, address, connection):
+        """Добавляет клиента в реестр подключенных"""
+        print(f"📡 Клиент {client_id}: {'старый JSON-протокол' if connection.legacy else 'протокол v' + str(PROTOCOL_VERSION)}")
         with self.clients_lock:
             self.connected_clients[client_id] = {
                 'socket': client_socket,
+                'connection': connection,
                 'address': address,
                 'connected_at': time.time(),
                 'last_activity': time.time()
             }
+            self.connections[client_socket] = connection
+            # До регистрации (и у старых агентов без имени) именем служит client_id
+            self.client_names[client_id] = client_id
+            self.client_feed.publish(ADDED, client_id, self._public_client_info(self.connected_clients[client_id]))
+        connection.client_id = client_id
+    
+    def update_client_info(self, client_id, **fields):
+        """Обновляет сведения о клиенте в реестре"""
+        with self.clients_lock:
+            if client_id in self.connected_clients:
+                self.connected_clients[client_id].update(fields)
+                self.client_feed.publish(UPDATED, client_id,
+                                         self._public_client_info(self.connected_clients[client_id]))
+    
+    def remove_client(self, client_id, client_socket):
+        """Закрывает сокет и убирает клиента из реестра"""
+        try:
+            client_socket.close()
+        except:
+            pass
+        with self.clients_lock:
+            if client_id in self.connected_clients:
+                del self.connected_clients[client_id]
+                self.client_feed.publish(REMOVED, client_id)
+            self.connections.pop(client_socket, None)
+            for name, owner in list(self.client_names.items()):
+                if owner == client_id:
+                    del self.client_names[name]
+        self.liveness.cancel(client_id)
+        self.swarm.remove_peer(client_id)
+        print(f"🔒 Клиент {client_id} отключен")
+    
+    def process_message(self, client_id, connection, message):
+        """Обрабатывает сообщение клиента, возвращает ответ или None"""
+        print(f"📨 От клиента {client_id}: {message.get('action', 'unknown')}")
+        
+        with self.clients_lock:
+            if client_id in self.connected_clients:
+                self.connected_clients[client_id]['last_activity'] = time.time()
+        
+        if message['action'] == 'register_client':
+            response = {"status": "registered", "client_id": client_id}
+            if not connection.legacy:
+                connection.version = negotiate_version(message.get('protocol_version'))
+                response['protocol_version'] = connection.version
+                # Агент может слать фазы установки в канале запроса до ее результата
+                response['install_events'] = True
+            with self.clients_lock:
+                if client_id in self.connected_clients:
+                    self.connected_clients[client_id]['system_info'] = message['system_info']
+                    self.connected_clients[client_id]['protocol_version'] = 0 if connection.legacy else connection.version
+                    if isinstance(message.get('cache'), dict):
+                        self.connected_clients[client_id]['cache_stats'] = message['cache']
+                    if isinstance(message.get('codecs'), list):
+                        self.connected_clients[client_id]['codecs'] = message['codecs']
+                    # Агент умеет собирать пакет из дельты к версии в своем кеше
+                    self.connected_clients[client_id]['delta'] = message.get('delta') is True
+                    interval = message.get('heartbeat_interval')
+                    if isinstance(interval, (int, float)) and interval > 0:
+                        # Агент шлет heartbeat — следим за ним по колесу таймеров
+                        timeout = max(self.heartbeat_timeout, 3 * interval)
+                        self.liveness.schedule(client_id, timeout)
+                        response['heartbeat_timeout'] = timeout
+                    peer_port = message.get('peer_port')
+                    if isinstance(peer_port, int) and 0 < peer_port < 65536:
+                        self.connected_clients[client_id]['peer_port'] = peer_port
+                        # Секретом агент проверяет пропуски, которые сервер выдает его соседям
+                        response['peer_secret'] = self.swarm.register_peer(
+                            client_id, self.connected_clients[client_id]['address'][0],
+                            peer_port, message.get('packages') or ())
+                    client_name = message.get('client_name')
+                    if isinstance(client_name, str) and client_name:
+                        self.connected_clients[client_id]['client_name'] = client_name
+                        self.client_names.pop(client_id, None)
+                        self.client_names[client_name] = client_id
+                    self.client_feed.publish(UPDATED, client_id,
+                                             self._public_client_info(self.connected_clients[client_id]))
+            # Клиент мог вернуться: его отложенные задания снова можно выполнять
+            self.dispatcher.wake()
+            return response
+            
+        elif message['action'] == 'get_system_info':
+            return {"system_info": {"os": "Server", "status": "active"}}
+        
+        elif message['action'] == 'heartbeat':
+            # Срок жизни уже продлен при чтении кадра; ответ нужен агенту, чтобы заметить пропажу сервера
+            return {"status": "alive"}
+        
+        return None
+
+    def evict_client(self, client_id):
+        """Выселяет агента, пропустившего heartbeat: обрывает соединение и текущие запросы"""
+        connection = self.get_client_connection(client_id)
+        if connection is None:
+            return
+        print(f"💀 Клиент {client_id} не отвечает, соединение закрыто")
+        connection.fail_requests(ConnectionClosed(f"Клиент {client_id} не отвечает"))
+        # Читатель соединения проснется с ошибкой и сам уберет клиента из реестра
+        connection.shutdown()
+
+    def handle_client(self, client_socket, address, client_id):
+        """Обрабатывает подключение клиента"""
+        print(f"🔗 Клиент {client_id} подключен: {address}")
+        
+        try:
+            # Новые агенты начинают с заголовка кадра, старые — сразу с JSON
+            framed = detect_framed(client_socket, timeout=10.0)
+        except (OSError, ConnectionClosed) as e:
+            print(f"🔒 Клиент {client_id} отключился до регистрации: {e}")
+            try:
+                client_socket.close()
+            except:
+                pass
+            return
+        connection = FramedConnection(client_socket, legacy=not framed)
+        # Этот поток — единственный читатель сокета: ответы на запросы сервера
+        # он раздает каналам по id, а новые сообщения агента обрабатывает сам
+        connection.reader_active = True
+        connection.settimeout(self.deploy_timeout)
+        enable_keepalive(client_socket)
+        self.add_client(client_id, client_socket, address, connection)
         
         try:
             while True:
-                client_socket.settimeout(10.0)
-                
                 try:
-                    data = client_socket.recv(8192).decode()  # Увеличиваем буфер
-                    if not data:
-                        print(f"🔒 Клиент {client_id} отключился")
-                        break
-                        
-                    message = self.safe_json_decode(data)
-                    if not message:
-                        # Пропускаем не-JSON данные (скорее всего файловые)
+                    if not connection.wait_readable(10.0):
                         continue
                     
-                    print(f"📨 От клиента {client_id}: {message.get('action', 'unknown')}")
+                    frame = connection.read_next()
+                    self.liveness.touch(client_id)
+                    if frame is None:
+                        continue
                     
-                    with self.clients_lock:
-                        if client_id in self.connected_clients:
-                            self.connected_clients[client_id]['last_activity'] = time.time()
+                    message = frame.json()
+                    if not message or 'action' not in message:
+                        # Пропускаем сообщения без команды (запоздавшие ответы)
+                        continue
                     
-                    if message['action'] == 'register_client':
-                        with self.clients_lock:
-                            self.connected_clients[client_id]['system_info'] = message['system_info']
-                        response = {"status": "registered", "client_id": client_id}
-                        client_socket.send(json.dumps(response).encode())
-                        
-                    elif message['action'] == 'get_system_info':
-                        response = {"system_info": {"os": "Server", "status": "active"}}
-                        client_socket.send(json.dumps(response).encode())
+                    response = self.process_message(client_id, connection, message)
+                    if response is not None:
+                        # Читатель не ждет, пока рабочий поток допишет файл: иначе heartbeat
+                        # агента остаются непрочитанными, и его выселяют посреди передачи
+                        connection.post_json(response, frame.request_id)
                         
                 except socket.timeout:
-                    continue
+                    # Данные были, но кадр не дочитан — поток кадров уже не восстановить
+                    print(f"⏰ Клиент {client_id} не дослал кадр")
+                    break
+                except ConnectionClosed:
+                    print(f"🔒 Клиент {client_id} отключился")
+                    break
+                except ProtocolError as e:
+                    print(f"❌ Нарушение протокола клиентом {client_id}: {e}")
+                    break
                 except ConnectionResetError:
                     print(f"🔒 Соединение с клиентом {client_id} разорвано")
                     break
@@ -309,14 +954,8 @@ class DriverDeploymentServer:
         except Exception as e:
             print(f"❌ Критическая ошибка с клиентом {client_id}: {e}")
         finally:
-            try:
-                client_socket.close()
-            except:
-                pass
-            with self.clients_lock:
-                if client_id in self.connected_clients:
-                    del self.connected_clients[client_id]
-            print(f"🔒 Клиент {client_id} отключен")
+            connection.fail_requests(ConnectionClosed(f"Клиент {client_id} отключился"))
+            self.remove_client(client_id, client_socket)
 
     def get_connected_clients_count(self):
         """Возвращает количество подключенных клиентов"""
@@ -325,16 +964,54 @@ class DriverDeploymentServer:
     
     def get_connected_clients_info(self):
         """Возвращает информацию о подключенных клиентах (без socket объектов)"""
-        clients_info = {}
         with self.clients_lock:
-            for client_id, client_info in self.connected_clients.items():
-                clients_info[client_id] = {
-                    'address': client_info['address'],
-                    'connected_at': client_info['connected_at'],
-                    'last_activity': client_info.get('last_activity', 0),
-                    'system_info': client_info.get('system_info', {})
-                }
-        return clients_info
+            return {client_id: self._public_client_info(client_info)
+                    for client_id, client_info in self.connected_clients.items()}
+    
+    @staticmethod
+    def _public_client_info(client_info):
+        """Сведения о клиенте без сокета и соединения"""
+        return {
+            'address': client_info['address'],
+            'connected_at': client_info['connected_at'],
+            'last_activity': client_info.get('last_activity', 0),
+            'system_info': client_info.get('system_info', {}),
+            'protocol_version': client_info.get('protocol_version', 0),
+            'cache_stats': client_info.get('cache_stats', {}),
+            'codecs': client_info.get('codecs', []),
+            'delta': client_info.get('delta', False),
+            'peer_port': client_info.get('peer_port'),
+            'client_name': client_info.get('client_name')
+        }
+    
+    def get_client_changes(self, since_version=0):
+        """Изменения реестра после since_version.
+
+        Возвращает {'version', 'events'} со списком ClientEvent или, если
+        подписчик отстал дальше хранимой истории, {'version', 'snapshot'}
+        со всеми подключенными клиентами.
+        """
+        with self.clients_lock:
+            events = self.client_feed.since(since_version)
+            if events is None:
+                return {'version': self.client_feed.version,
+                        'snapshot': {client_id: self._public_client_info(client_info)
+                                     for client_id, client_info in self.connected_clients.items()}}
+            return {'version': self.client_feed.version, 'events': events}
+    
+    def get_bandwidth_stats(self):
+        """Текущая загрузка полосы: общая, по площадкам, клиентам и передачам"""
+        return self.bandwidth.stats()
+    
+    def get_cache_stats(self):
+        """Суммарные попадания и промахи кешей агентов"""
+        totals = {'hits': 0, 'misses': 0, 'entries': 0, 'bytes': 0}
+        with self.clients_lock:
+            for client_info in self.connected_clients.values():
+                stats = client_info.get('cache_stats', {})
+                for key in totals:
+                    totals[key] += stats.get(key, 0)
+        return totals
     
     def get_client_socket(self, client_id):
         """Безопасно получает socket клиента"""
@@ -342,15 +1019,35 @@ class DriverDeploymentServer:
             if client_id in self.connected_clients:
                 return self.connected_clients[client_id]['socket']
         return None
+    
+    def get_client_connection(self, client_id):
+        """Возвращает соединение протокола клиента"""
+        with self.clients_lock:
+            if client_id in self.connected_clients:
+                return self.connected_clients[client_id]['connection']
+        return None
+
+    def wait_listening(self, timeout=None):
+        """Ждет, пока сервер откроет порт; возвращает ошибку, из-за которой он не открылся, или None"""
+        if not self._listen_done.wait(timeout):
+            return TimeoutError(f"Сервер не открыл порт {self.port} за {timeout} с")
+        return self.listen_error
+
+    def _listen_failed(self, error):
+        if not self._listen_done.is_set():
+            self.listen_error = error
+            self._listen_done.set()
 
     def start_server(self):
         """Запускает сервер"""
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        set_listen_options(server_socket)
         
         try:
             server_socket.bind((self.host, self.port))
-            server_socket.listen(5)
+            server_socket.listen(self.accept_backlog)
+            self.start_background_services()
+            self._listen_done.set()
             print(f"✅ Сервер запущен на {self.host}:{self.port}")
             print("⏳ Ожидание подключения клиентов...")
             
@@ -368,9 +1065,18 @@ class DriverDeploymentServer:
                 client_counter += 1
                 
         except Exception as e:
+            self._listen_failed(e)
             print(f"❌ Ошибка сервера: {e}")
         finally:
             try:
                 server_socket.close()
             except:
-                pass
\ No newline at end of file
+                pass
+
+def create_server(host=None, port=None):
+    """Создает сервер в режиме из конфигурации: threaded или asyncio (адрес и порт — тоже из нее, если не заданы)"""
+    config = DriverDeploymentServer.load_config()
+    if config.get('server_mode', 'threaded') == 'asyncio':
+        from async_server import AsyncDriverDeploymentServer
+        return AsyncDriverDeploymentServer(host, port, config)
+    return DriverDeploymentServer(host, port, config)
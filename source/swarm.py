@@ -0,0 +1,288 @@
+# swarm.py
+import hashlib
+import hmac
+import ipaddress
+import os
+import random
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+
+from heartbeat import set_listen_options
+from protocol import (FramedConnection, ConnectionClosed, ProtocolError, MSG_BINARY, MSG_JSON)
+
+DEFAULT_MAX_PEERS = 4
+DEFAULT_MAX_UPLOADS = 4
+PEER_CONNECT_TIMEOUT = 3.0
+PEER_CHUNK_TIMEOUT = 30.0
+# Сколько секунд действует пропуск к пиру, выданный сервером вместе со сведениями о файле
+PEER_TOKEN_TTL = 600
+
+
+def peer_token(secret, digest, host, expires):
+    """Пропуск получателя host к пакету digest у пира с секретом secret: '<срок>:<HMAC>'"""
+    message = f"{digest}|{host}|{expires}".encode()
+    return f"{expires}:{hmac.new(bytes.fromhex(secret), message, hashlib.sha256).hexdigest()}"
+
+
+def check_peer_token(secret, token, digest, host, now=None):
+    """Проверяет пропуск: подпись секретом пира, пакет, адрес получателя и срок"""
+    if not secret or not isinstance(token, str):
+        return False
+    expires, _, _ = token.partition(':')
+    if not expires.isdigit() or int(expires) < (time.time() if now is None else now):
+        return False
+    return hmac.compare_digest(peer_token(secret, digest, host, int(expires)), token)
+
+
+class SwarmTracker:
+    """Трекер роя на сервере: какие агенты держат какие пакеты.
+
+    Агент сообщает порт своего слушателя и хеши пакетов из кеша при
+    регистрации, а после каждой успешной установки сервер добавляет ему
+    установленный пакет. Получателю выдаются пиры из его подсети. Каждому
+    пиру при регистрации выдается секрет, и вместе с адресом пира
+    получатель получает подписанный этим секретом пропуск к пакету.
+    """
+
+    def __init__(self, max_peers=DEFAULT_MAX_PEERS, subnet_prefix=24):
+        self.max_peers = max_peers
+        self.subnet_prefix = subnet_prefix
+        self.lock = threading.Lock()
+        self._peers = {}
+        self._holders = {}
+
+    def _subnet(self, host):
+        if not self.subnet_prefix:
+            return None
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return None
+        prefix = min(self.subnet_prefix, address.max_prefixlen)
+        return ipaddress.ip_network(f"{host}/{prefix}", strict=False)
+
+    def register_peer(self, client_id, host, port, digests=()):
+        """Запоминает слушатель агента и пакеты, которые он может раздавать; возвращает секрет пира"""
+        secret = secrets.token_hex(32)
+        with self.lock:
+            self._drop(client_id)
+            self._peers[client_id] = (host, port, set(), secret)
+            for digest in digests:
+                self._add(client_id, digest)
+        return secret
+
+    def add_package(self, client_id, digest):
+        with self.lock:
+            if client_id in self._peers:
+                self._add(client_id, digest)
+
+    def remove_peer(self, client_id):
+        with self.lock:
+            self._drop(client_id)
+
+    def _add(self, client_id, digest):
+        self._peers[client_id][2].add(digest)
+        self._holders.setdefault(digest, set()).add(client_id)
+
+    def _drop(self, client_id):
+        peer = self._peers.pop(client_id, None)
+        if peer is None:
+            return
+        for digest in peer[2]:
+            holders = self._holders.get(digest)
+            if holders is not None:
+                holders.discard(client_id)
+                if not holders:
+                    del self._holders[digest]
+
+    def peers_for(self, digest, client_id, host):
+        """Случайные пиры с пакетом из подсети получателя: [[host, port, пропуск], ...]"""
+        subnet = self._subnet(host)
+        with self.lock:
+            candidates = [self._peers[holder] for holder in self._holders.get(digest, ())
+                          if holder != client_id]
+        if subnet is not None:
+            candidates = [peer for peer in candidates if self._in_subnet(peer[0], subnet)]
+        random.shuffle(candidates)
+        expires = int(time.time()) + PEER_TOKEN_TTL
+        return [[peer_host, port, peer_token(secret, digest, host, expires)]
+                for peer_host, port, _, secret in candidates[:self.max_peers]]
+
+    @staticmethod
+    def _in_subnet(host, subnet):
+        try:
+            return ipaddress.ip_address(host) in subnet
+        except (ValueError, TypeError):
+            return False
+
+    def stats(self):
+        with self.lock:
+            return {'peers': len(self._peers), 'packages': len(self._holders)}
+
+
+class PeerServer:
+    """Слушатель агента, раздающий блоки пакетов из его кеша соседям.
+
+    Запрос — JSON {"action": "get_chunk", "digest", "offset", "length", "token"},
+    ответ — двоичный кадр с блоком (через sendfile) или JSON с ошибкой.
+    Блоки получает только агент с пропуском от сервера к этому пакету
+    (см. peer_token); пока сервер не выдал секрет, раздача закрыта.
+    Одновременных раздач не больше max_uploads, остальным отвечаем busy.
+    """
+
+    def __init__(self, cache, host=None, port=0, max_uploads=DEFAULT_MAX_UPLOADS):
+        self.cache = cache
+        self.host = host
+        self.port = port
+        # Секрет от сервера, которым подписаны пропуски получателей
+        self.secret = None
+        self.uploads = threading.BoundedSemaphore(max_uploads)
+        self.bytes_served = 0
+        self._lock = threading.Lock()
+        self._socket = None
+
+    @property
+    def running(self) -> bool:
+        return self._socket is not None
+
+    def start(self, interface=None):
+        """Открывает слушатель на host (без него — на interface) и возвращает фактический порт"""
+        self.host = self.host or interface
+        if not self.host:
+            raise OSError("Не задан интерфейс раздачи")
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        set_listen_options(self._socket)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(64)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept_loop, name="peer-server", daemon=True).start()
+        return self.port
+
+    def stop(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _accept_loop(self):
+        while self._socket is not None:
+            try:
+                peer_socket, _ = self._socket.accept()
+            except OSError:
+                break
+            threading.Thread(target=self._serve, args=(peer_socket,), daemon=True).start()
+
+    def _serve(self, peer_socket):
+        connection = FramedConnection(peer_socket)
+        try:
+            host = peer_socket.getpeername()[0]
+            while True:
+                frame = connection.recv_frame(timeout=60.0)
+                request = frame.json()
+                if not request or request.get('action') != 'get_chunk':
+                    connection.send_json({"status": "error", "message": "Неизвестный запрос"}, frame.request_id)
+                    continue
+                if not check_peer_token(self.secret, request.get('token'), str(request.get('digest', '')), host):
+                    connection.send_json({"status": "denied"}, frame.request_id)
+                    break
+                self._send_chunk(connection, request, frame.request_id)
+        except (ConnectionClosed, ProtocolError, socket.timeout, OSError):
+            pass
+        finally:
+            connection.close()
+
+    def _send_chunk(self, connection, request, request_id):
+        digest = str(request.get('digest', ''))
+        # Пакет не вытесняется из кеша, пока блок уходит соседу
+        with self.cache.pinned(digest):
+            self._send_cached(connection, digest, request, request_id)
+
+    def _send_cached(self, connection, digest, request, request_id):
+        path = self.cache.path_for(digest)
+        offset = request.get('offset')
+        length = request.get('length')
+        if path is None or not isinstance(offset, int) or not isinstance(length, int) \
+                or offset < 0 or length <= 0 or offset + length > os.path.getsize(path):
+            connection.send_json({"status": "missing"}, request_id)
+            return
+        if not self.uploads.acquire(blocking=False):
+            connection.send_json({"status": "busy"}, request_id)
+            return
+        try:
+            stats = connection.send_file(path, offset, length, request_id)
+            with self._lock:
+                self.bytes_served += stats.bytes
+        finally:
+            self.uploads.release()
+
+
+def fetch_from_peers(peers, digest, file_path, size, algorithm, chunk_size, chunk_hashes, start=0):
+    """Скачивает у пиров блоки файла начиная со start, возвращает число полученных байт.
+
+    На каждого пира — свой поток и свое соединение; блоки разбираются из
+    общей очереди. Каждый блок сверяется с хешем от сервера перед записью.
+    Блок, который пир не отдал, возвращается в очередь для остальных.
+    """
+    pending = deque(range(start // chunk_size, len(chunk_hashes)))
+    if not pending or not peers:
+        return 0
+    lock = threading.Lock()
+    fetched = [0]
+    # Файл должен существовать, чтобы потоки писали блоки по своим смещениям
+    with open(file_path, 'ab'):
+        pass
+
+    def worker(host, port, token=None):
+        failures = 0
+        try:
+            sock = socket.create_connection((host, port), timeout=PEER_CONNECT_TIMEOUT)
+        except OSError:
+            return
+        connection = FramedConnection(sock)
+        buffer = bytearray(chunk_size)
+        try:
+            with open(file_path, 'r+b') as f:
+                while failures < 3:
+                    with lock:
+                        if not pending:
+                            return
+                        index = pending.popleft()
+                    offset = index * chunk_size
+                    length = min(chunk_size, size - offset)
+                    view = memoryview(buffer)[:length]
+                    ok = False
+                    try:
+                        connection.send_json({"action": "get_chunk", "digest": digest,
+                                              "offset": offset, "length": length, "token": token})
+                        header = connection.read_header(timeout=PEER_CHUNK_TIMEOUT)
+                        if header.msg_type == MSG_BINARY and header.length == length:
+                            connection.recv_exact_into(view)
+                            ok = hashlib.new(algorithm, view).hexdigest() == chunk_hashes[index]
+                        elif header.msg_type == MSG_JSON:
+                            connection.read_payload(header)
+                        else:
+                            return
+                    finally:
+                        if not ok:
+                            failures += 1
+                            with lock:
+                                pending.append(index)
+                    if not ok:
+                        continue
+                    f.seek(offset)
+                    f.write(view)
+                    with lock:
+                        fetched[0] += length
+        except (ConnectionClosed, ProtocolError, socket.timeout, OSError):
+            pass
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=tuple(peer[:3]), daemon=True) for peer in peers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return fetched[0]
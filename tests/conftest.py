@@ -0,0 +1,89 @@
+# conftest.py
+import os
+import socket
+import sys
+import threading
+import time
+
+import pytest
+
+# Модули сервера и агента лежат плоско в source/ и импортируются по имени
+SOURCE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'source')
+sys.path.insert(0, SOURCE_DIR)
+
+from protocol import FramedConnection  # noqa: E402
+from server_admin import DriverDeploymentServer  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(predicate, timeout=5.0, interval=0.02):
+    """Ждет, пока predicate() не станет истинным; возвращает его последнее значение"""
+    deadline = time.monotonic() + timeout
+    while True:
+        value = predicate()
+        if value or time.monotonic() > deadline:
+            return value
+        time.sleep(interval)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Временный рабочий каталог: сервер держит drivers/ и базы в текущем каталоге"""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def start_server(workdir):
+    """Запускает сервер на loopback с переопределенной конфигурацией"""
+
+    def start(mode='threaded', **overrides):
+        port = free_port()
+        config = {"server_host": "127.0.0.1", "server_port": port, "metrics_port": 0, "swarm_enabled": False,
+                  "delta_updates": False, "catalog_poll_interval": 0.2}
+        config.update(overrides)
+        if mode == 'asyncio':
+            from async_server import AsyncDriverDeploymentServer
+            server = AsyncDriverDeploymentServer("127.0.0.1", port, config)
+        else:
+            server = DriverDeploymentServer("127.0.0.1", port, config)
+        threading.Thread(target=server.start_server, daemon=True).start()
+        assert server.wait_listening(timeout=5.0) is None, "сервер не открыл порт"
+        return server
+
+    return start
+
+
+class FakeAgent:
+    """Минимальный агент протокола v1 для тестов: регистрируется и отдает кадры тесту"""
+
+    def __init__(self, port, name, **registration):
+        self.sock = socket.create_connection(('127.0.0.1', port), timeout=5.0)
+        self.connection = FramedConnection(self.sock)
+        message = {"action": "register_client", "client_name": name,
+                   "system_info": {"os": "Linux", "architecture": "x86_64", "hostname": name}}
+        message.update(registration)
+        self.connection.send_json(message, self.connection.next_request_id())
+        self.registration = self.connection.recv_json(timeout=5.0)
+
+    def close(self):
+        self.connection.close()
+
+
+@pytest.fixture
+def fake_agent():
+    agents = []
+
+    def connect(port, name, **registration):
+        agent = FakeAgent(port, name, **registration)
+        agents.append(agent)
+        return agent
+
+    yield connect
+    for agent in agents:
+        agent.close()
@@ -0,0 +1,94 @@
+# test_admin_console.py
+import pytest
+
+from admin_console import AdminConsole
+from client_feed import ADDED, REMOVED, UPDATED, ClientEvent
+
+
+class FakeList:
+    """Список клиентов консоли без Tk: id строки -> подпись"""
+
+    def __init__(self):
+        self.rows = {}
+
+    def insert(self, index, label, update=True):
+        self.rows[index] = label
+
+    def delete(self, index):
+        if index == "all":
+            self.rows.clear()
+        else:
+            del self.rows[index]
+
+    def update_idletasks(self):
+        pass
+
+
+def _info(ip, **fields):
+    return dict(fields, address=(ip, 50000))
+
+
+@pytest.fixture
+def console(workdir):
+    return AdminConsole()
+
+
+def test_newest_connection_wins_for_an_ip(console):
+    rows = FakeList()
+    console.apply_client_changes(rows, {'version': 3, 'snapshot': {
+        'client_9': _info('10.0.0.5'),
+        'client_10': _info('10.0.0.5'),
+        'client_2': _info('10.0.0.6'),
+    }})
+    # client_10 зарегистрирован позже client_9, хотя строкой меньше
+    assert console.get_client_id_by_ip('10.0.0.5') == 'client_10'
+    assert console.get_client_id_by_ip('10.0.0.6') == 'client_2'
+    assert console.get_client_id_by_ip('10.0.0.7') is None
+
+    console.apply_client_changes(rows, {'events': [
+        ClientEvent(4, ADDED, 'client_11', _info('10.0.0.5')),
+        # Обновление сведений старого подключения не делает его новым
+        ClientEvent(5, UPDATED, 'client_9', _info('10.0.0.5', client_name='pc-9')),
+    ]})
+    assert console.get_client_id_by_ip('10.0.0.5') == 'client_11'
+    assert rows.rows == {'client_9': 'client_9: 10.0.0.5', 'client_10': 'client_10: 10.0.0.5',
+                         'client_2': 'client_2: 10.0.0.6', 'client_11': 'client_11: 10.0.0.5'}
+
+
+def test_index_follows_disconnects_and_address_changes(console):
+    rows = FakeList()
+    console.apply_client_changes(rows, {'version': 2, 'snapshot': {
+        'client_1': _info('10.0.0.5'),
+        'client_2': _info('10.0.0.5'),
+    }})
+    console.apply_client_changes(rows, {'events': [ClientEvent(3, REMOVED, 'client_2', None)]})
+    assert console.get_client_id_by_ip('10.0.0.5') == 'client_1'
+    assert 'client_2' not in rows.rows
+
+    console.apply_client_changes(rows, {'events': [
+        ClientEvent(4, ADDED, 'client_3', _info('10.0.0.5')),
+        ClientEvent(5, UPDATED, 'client_3', _info('10.0.0.8')),
+    ]})
+    assert console.get_client_id_by_ip('10.0.0.5') == 'client_1'
+    assert console.get_client_id_by_ip('10.0.0.8') == 'client_3'
+    assert rows.rows['client_3'] == 'client_3: 10.0.0.8'
+    assert console.client_ids_by_label == {'client_1: 10.0.0.5': 'client_1', 'client_3: 10.0.0.8': 'client_3'}
+
+    console.apply_client_changes(rows, {'events': [
+        ClientEvent(6, REMOVED, 'client_1', None),
+        ClientEvent(7, REMOVED, 'client_3', None),
+        # Старое событие уже применено снимком или раньше — пропускается
+        ClientEvent(7, ADDED, 'client_9', _info('10.0.0.9')),
+    ]})
+    assert console.client_ids_by_ip == {}
+    assert console.client_version == 7
+    assert rows.rows == {}
+
+
+def test_snapshot_replaces_the_index(console):
+    rows = FakeList()
+    console.apply_client_changes(rows, {'version': 1, 'snapshot': {'client_1': _info('10.0.0.5')}})
+    console.apply_client_changes(rows, {'version': 9, 'snapshot': {'client_7': _info('10.0.0.6')}})
+    assert console.get_client_id_by_ip('10.0.0.5') is None
+    assert console.get_client_id_by_ip('10.0.0.6') == 'client_7'
+    assert rows.rows == {'client_7': 'client_7: 10.0.0.6'}
@@ -0,0 +1,30 @@
+# test_agent_cache.py
+import os
+
+from agent_cache import DriverCache
+
+
+def put(cache, tmp_path, digest, size):
+    source = tmp_path / f'{digest}.bin'
+    source.write_bytes(b'x' * size)
+    return cache.put(digest, str(source), f'{digest}.run')
+
+
+def test_pinned_packages_survive_eviction(tmp_path):
+    cache = DriverCache(str(tmp_path / 'cache'), max_bytes=250)
+    first = put(cache, tmp_path, 'aaa', 100)
+    put(cache, tmp_path, 'bbb', 100)
+
+    with cache.pinned('aaa'):
+        put(cache, tmp_path, 'ccc', 100)
+        # Вытеснен самый давний незакрепленный пакет
+        assert sorted(cache.digests()) == ['aaa', 'ccc']
+
+    with cache.pinned('ccc'), cache.pinned('aaa'):
+        put(cache, tmp_path, 'ddd', 100)
+        assert os.path.isfile(first)
+        assert cache.stats()['bytes'] == 300
+
+    # Отложенное вытеснение выполняется, когда пакеты отпустили
+    assert sorted(cache.digests()) == ['ccc', 'ddd']
+    assert not os.path.exists(first)
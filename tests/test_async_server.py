@@ -0,0 +1,119 @@
+# test_async_server.py
+import asyncio
+import os
+import socket
+import threading
+import time
+
+from async_server import AsyncFramedConnection
+from benchmark import SimulatedAgent
+from conftest import wait_for
+from protocol import ConnectionClosed
+
+
+def test_full_deploy_through_asyncio_server(start_server, workdir):
+    server = start_server('asyncio', compression=False)
+    payload = os.urandom(3 * 1024 * 1024 + 17)
+    with open(os.path.join('drivers', 'storage_linux.run'), 'wb') as f:
+        f.write(payload)
+    server.catalog.refresh()
+    agents = [SimulatedAgent(f'pc-{i}', '127.0.0.1', server.port, str(workdir / f'agent{i}')) for i in range(3)]
+    for agent in agents:
+        threading.Thread(target=agent.start, daemon=True).start()
+    assert wait_for(lambda: len(server.get_connected_clients_info()) == 3)
+    assert wait_for(lambda: all(info.get('client_name') for info in server.get_connected_clients_info().values()))
+
+    results = server.mass_deploy('storage_linux.run')
+
+    assert sorted(results) == sorted(server.get_connected_clients_info())
+    for result in results.values():
+        assert result['status'] == 'success', result
+        assert result['transfer']['bytes'] == len(payload)
+    assert {entry.client_name for entry in wait_for(lambda: server.get_history(driver_name='storage_linux.run'))} \
+        == {'pc-0', 'pc-1', 'pc-2'}
+    # Повторная установка берет пакет из кеша агента
+    client_id = next(iter(results))
+    again = server.deploy_to_client(server.get_client_socket(client_id), 'storage_linux.run')
+    assert again['status'] == 'success'
+    assert again['transfer']['method'] == 'cached'
+
+
+def test_stalled_send_fails_the_deploy(start_server, fake_agent):
+    server = start_server('asyncio', deploy_timeout=1.0, compression=False)
+    with open(os.path.join('drivers', 'huge_linux.run'), 'wb') as f:
+        f.write(os.urandom(64 * 1024 * 1024))
+    server.catalog.refresh()
+    agent = fake_agent(server.port, 'pc-stuck')
+    client_socket = server.get_client_socket(agent.registration['client_id'])
+
+    # Агент подтверждает метаданные и перестает читать сокет
+    def ack_and_hang():
+        command = agent.connection.recv_frame(timeout=5.0)
+        agent.connection.recv_frame(timeout=5.0)
+        agent.connection.send_ack(command.request_id)
+
+    threading.Thread(target=ack_and_hang, daemon=True).start()
+    started = time.monotonic()
+    result = server.deploy_to_client(client_socket, 'huge_linux.run')
+
+    assert result['status'] == 'error'
+    assert time.monotonic() - started < 10
+
+
+def test_send_fails_when_the_loop_is_stopped():
+    loop = asyncio.new_event_loop()
+    left, right = socket.socketpair()
+    try:
+        connection = AsyncFramedConnection(left, loop)
+        errors = []
+
+        def send():
+            try:
+                connection.send_json({'action': 'heartbeat'})
+            except ConnectionError as e:
+                errors.append(e)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        sender.join(5)
+        assert not sender.is_alive()
+        assert len(errors) == 1 and isinstance(errors[0], ConnectionClosed)
+    finally:
+        loop.close()
+        left.close()
+        right.close()
+
+
+def test_send_fails_when_the_loop_stops_mid_send():
+    loop = asyncio.new_event_loop()
+    runner = threading.Thread(target=loop.run_forever, daemon=True)
+    runner.start()
+    left, right = socket.socketpair()
+    left.setblocking(False)
+    try:
+        connection = AsyncFramedConnection(left, loop)
+        errors = []
+
+        def send():
+            try:
+                # Собеседник не читает: отправка встает, пока цикл не остановят
+                connection.send_frame(2, b'x' * (32 * 1024 * 1024))
+            except ConnectionError as e:
+                errors.append(e)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        time.sleep(0.3)
+        loop.call_soon_threadsafe(loop.stop)
+        sender.join(10)
+        assert not sender.is_alive()
+        assert len(errors) == 1 and isinstance(errors[0], ConnectionClosed)
+    finally:
+        runner.join(5)
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.close()
+        left.close()
+        right.close()
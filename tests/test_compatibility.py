@@ -0,0 +1,121 @@
+# test_compatibility.py
+import random
+
+import pytest
+
+from compatibility import CompatibilityEngine
+from driver_catalog import infer_tags
+
+# Инвентарь, который сервер подставляет, когда get_system_info не удался
+UNREADABLE = {"os": "unknown", "architecture": "unknown"}
+
+
+def _driver(driver_id, **fields):
+    fields['id'] = driver_id
+    return fields
+
+
+def test_unrecognized_package_goes_nowhere():
+    engine = CompatibilityEngine([_driver('zip', **infer_tags('foo.zip'))])
+    assert infer_tags('foo.zip')['os'] == 'unknown'
+    for system_info in (UNREADABLE, {}, {'os': 'Windows', 'architecture': 'AMD64'},
+                        {'os': 'Linux', 'architecture': 'x86_64'}):
+        assert not engine.matches('zip', system_info)
+
+
+def test_client_with_unknown_os_gets_nothing():
+    engine = CompatibilityEngine([
+        _driver('any', os='any'),
+        _driver('network', **infer_tags('network_driver.bin')),
+        _driver('win', os='windows'),
+        _driver('unknown', os='unknown'),
+    ])
+    clients = {'unreadable': UNREADABLE, 'empty': {}, 'win': {'os': 'Windows 10'}}
+    plan = engine.plan(clients)
+    assert plan.drivers_for('unreadable') == []
+    assert plan.drivers_for('empty') == []
+    assert plan.drivers_for('win') == ['any', 'network', 'win']
+    assert not any(engine.matches(driver_id, UNREADABLE) for driver_id in engine.driver_ids)
+
+
+DRIVERS = [
+    _driver('win-any', os='windows'),
+    _driver('win-x64', os='windows', arch='amd64'),
+    _driver('win-arm', os='windows', arch='arm64'),
+    _driver('linux-x64', os='linux', arch='x86_64'),
+    _driver('any-x86', os='any', arch='i686'),
+    _driver('win-gpu', os='windows', hardware_ids=['pci\\ven_10de&dev_2204', 'PCI\\VEN_10DE&DEV_2206']),
+    _driver('win11', os='windows', min_os_version='10.0.22000'),
+    _driver('win10', os='windows', min_os_version='10.0', max_os_version='10.0.19045'),
+    _driver('kernel6', os='linux', min_os_version='6.1'),
+]
+
+
+@pytest.mark.parametrize('system_info, expected', [
+    ({'os': 'Windows', 'architecture': 'AMD64', 'os_version': '10.0.19045'},
+     ['win-any', 'win-x64', 'win10']),
+    ({'os': 'Windows', 'architecture': 'AMD64', 'os_version': '10.0.22631',
+      'hardware_ids': ['PCI\\VEN_10DE&DEV_2206']},
+     ['win-any', 'win-x64', 'win-gpu', 'win11']),
+    ({'os': 'Windows', 'architecture': 'ARM64', 'os_version': '10.0.22000'},
+     ['win-any', 'win-arm', 'win11']),
+    ({'os': 'Windows', 'architecture': 'x86'},
+     ['win-any', 'any-x86']),
+    ({'os': 'Windows'},
+     ['win-any', 'win-x64', 'win-arm', 'any-x86']),
+    ({'os': 'Linux', 'architecture': 'x86_64', 'os_release': '6.5.0-14-generic'},
+     ['linux-x64', 'kernel6']),
+    ({'os': 'Linux', 'architecture': 'aarch64', 'os_release': '5.15.0'},
+     []),
+    (UNREADABLE, []),
+])
+def test_os_arch_and_hardware_matrix(system_info, expected):
+    engine = CompatibilityEngine(DRIVERS)
+    assert [driver_id for driver_id in engine.driver_ids if engine.matches(driver_id, system_info)] == expected
+    assert engine.plan({'pc': system_info}).drivers_for('pc') == expected
+
+
+def test_plan_agrees_with_rules_for_every_client():
+    rng = random.Random(13)
+    drivers = []
+    for i in range(60):
+        driver = _driver(f'd{i}', os=rng.choice(['windows', 'linux', 'any', 'unknown']),
+                         arch=rng.choice(['x86_64', 'arm64', 'any']))
+        if rng.random() < 0.5:
+            driver['min_os_version'] = f'10.0.{rng.randint(0, 30)}'
+        if rng.random() < 0.5:
+            driver['max_os_version'] = f'10.0.{rng.randint(10, 40)}'
+        if rng.random() < 0.3:
+            driver['hardware_ids'] = [f'PCI\\VEN_{rng.randint(0, 5)}']
+        drivers.append(driver)
+    inventories = {f'c{i}': {'os': rng.choice(['Windows', 'Linux', 'unknown', '']),
+                             'architecture': rng.choice(['AMD64', 'aarch64', '']),
+                             'os_version': rng.choice([None, '10', f'10.0.{rng.randint(0, 45)}']),
+                             'hardware_ids': [f'pci\\ven_{rng.randint(0, 8)}']}
+                   for i in range(300)}
+    engine = CompatibilityEngine(drivers)
+    plan = engine.plan(inventories)
+
+    for client_id, system_info in inventories.items():
+        expected = []
+        for driver in drivers:
+            rule_os = driver['os']
+            client_os = system_info['os'].lower()
+            arch = {'AMD64': 'x86_64', 'aarch64': 'arm64', '': None}[system_info['architecture']]
+            version = system_info['os_version']
+            version = tuple(int(part) for part in version.split('.')) if version else None
+            if client_os in ('', 'unknown') or rule_os == 'unknown' or rule_os not in ('any', client_os):
+                continue
+            if arch and driver['arch'] not in ('any', arch):
+                continue
+            low = tuple(int(part) for part in driver['min_os_version'].split('.')) \
+                if 'min_os_version' in driver else None
+            high = tuple(int(part) for part in driver['max_os_version'].split('.')) \
+                if 'max_os_version' in driver else None
+            if (low or high) and (version is None or (low and version < low) or (high and version > high)):
+                continue
+            if 'hardware_ids' in driver and \
+                    driver['hardware_ids'][0].upper() not in [hw.upper() for hw in system_info['hardware_ids']]:
+                continue
+            expected.append(driver['id'])
+        assert plan.drivers_for(client_id) == expected, client_id
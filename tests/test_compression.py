@@ -0,0 +1,108 @@
+# test_compression.py
+import hashlib
+import os
+import threading
+import zlib
+
+import pytest
+
+from compression import CODEC_IDS, CODEC_NONE, CompressedVariants, make_decompressor, zstandard
+
+CODECS = ['zlib', 'lzma', pytest.param('zstd', marks=pytest.mark.skipif(zstandard is None,
+                                                                      reason="модуль zstandard не установлен"))]
+
+
+def _compressible(size):
+    line = b'[Strings]\r\nDeviceDesc = "Storage controller %d"\r\n'
+    return b''.join(line.replace(b'%d', str(i).encode()) for i in range(size // len(line) + 1))[:size]
+
+
+def _unpack(codec, path, piece=4096):
+    decompressor = make_decompressor(CODEC_IDS[codec])
+    out = bytearray()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(piece)
+            if not data:
+                break
+            out += decompressor.decompress(data)
+    if hasattr(decompressor, 'flush'):
+        out += decompressor.flush()
+    return bytes(out)
+
+
+@pytest.mark.parametrize('codec', CODECS)
+def test_variant_round_trip(tmp_path, codec):
+    data = _compressible(3 * 1024 * 1024 + 5)
+    source = tmp_path / 'storage.inf'
+    source.write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    variants = CompressedVariants(str(tmp_path))
+
+    path = variants.get(str(source), digest, codec)
+    assert path is not None
+    assert os.path.getsize(path) < len(data) // 2
+    assert _unpack(codec, path) == data
+    # Вариант переживает перезапуск и не пересобирается
+    mtime = os.stat(path).st_mtime_ns
+    assert CompressedVariants(str(tmp_path)).get(str(source), digest, codec) == path
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_incompressible_file_is_sent_as_is(tmp_path):
+    data = os.urandom(512 * 1024)
+    source = tmp_path / 'firmware.bin'
+    source.write_bytes(data)
+    digest = hashlib.sha256(data).hexdigest()
+    variants = CompressedVariants(str(tmp_path))
+    assert variants.get(str(source), digest, 'zlib') is None
+    assert not os.path.exists(os.path.join(variants.cache_dir, f"{digest}.zlib"))
+    # Решение запомнено: повторный вызов не сжимает файл снова
+    source.write_bytes(_compressible(len(data)))
+    assert CompressedVariants(str(tmp_path)).get(str(source), digest, 'zlib') is None
+
+
+def test_uncompressed_frames_need_no_decompressor():
+    assert make_decompressor(CODEC_NONE) is None
+    with pytest.raises(ValueError):
+        make_decompressor(99)
+
+
+def _deploy_to_fake_agent(server, agent, driver_name):
+    """Отвечает за агента на установку; возвращает (file_info, кадр с файлом, результат сервера)"""
+    seen = {}
+
+    def answer():
+        command = agent.connection.recv_frame(timeout=5.0)
+        seen['file_info'] = agent.connection.recv_json(timeout=5.0)
+        agent.connection.send_ack(command.request_id, have=False, offset=0)
+        seen['frame'] = agent.connection.recv_frame(timeout=5.0)
+        agent.connection.send_json({'status': 'success'}, command.request_id)
+
+    responder = threading.Thread(target=answer)
+    responder.start()
+    result = server.deploy_to_client(server.get_client_socket(agent.registration['client_id']), driver_name)
+    responder.join(10)
+    return seen['file_info'], seen['frame'], result
+
+
+def test_server_sends_raw_file_without_agent_codecs(start_server, fake_agent):
+    server = start_server(compression=True, compression_codecs=['zlib'])
+    data = _compressible(256 * 1024)
+    with open(os.path.join('drivers', 'storage_linux.run'), 'wb') as f:
+        f.write(data)
+    server.catalog.refresh()
+
+    old = fake_agent(server.port, 'pc-old')
+    file_info, frame, result = _deploy_to_fake_agent(server, old, 'storage_linux.run')
+    assert result['status'] == 'success'
+    assert 'codec' not in file_info
+    assert frame.flags == CODEC_NONE
+    assert bytes(frame.payload) == data
+
+    new = fake_agent(server.port, 'pc-new', codecs=['zlib'])
+    file_info, frame, result = _deploy_to_fake_agent(server, new, 'storage_linux.run')
+    assert result['status'] == 'success'
+    assert file_info['codec'] == 'zlib'
+    assert frame.flags == CODEC_IDS['zlib']
+    assert zlib.decompress(bytes(frame.payload)) == data
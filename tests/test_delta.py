@@ -0,0 +1,60 @@
+# test_delta.py
+import hashlib
+import io
+import random
+
+import pytest
+
+from delta import DELTA_MAGIC, DeltaError, apply_delta, make_delta
+
+
+def _versions():
+    rng = random.Random(24)
+    base = rng.randbytes(512 * 1024)
+    return [
+        pytest.param(base, base, id='same'),
+        pytest.param(base, base[:100000] + b'new bytes' * 50 + base[100100:], id='patched'),
+        pytest.param(base, base[:4096] + rng.randbytes(3000) + base[4096:], id='inserted'),
+        pytest.param(base, base[:300000], id='truncated'),
+        pytest.param(base, base + rng.randbytes(20000), id='appended'),
+        pytest.param(base, base[256 * 1024:] + base[:256 * 1024], id='shuffled'),
+    ]
+
+
+@pytest.mark.parametrize('base, target', _versions())
+def test_apply_restores_target(tmp_path, base, target):
+    base_path, target_path, delta_path = tmp_path / 'base', tmp_path / 'target', tmp_path / 'delta'
+    base_path.write_bytes(base)
+    target_path.write_bytes(target)
+
+    size = make_delta(str(base_path), str(target_path), str(delta_path))
+    assert size is not None and size < len(target) // 2
+
+    output = io.BytesIO()
+    hasher = hashlib.sha256()
+    assert apply_delta(str(base_path), str(delta_path), output, hasher) == len(target)
+    assert output.getvalue() == target
+    assert hasher.hexdigest() == hashlib.sha256(target).hexdigest()
+
+
+def test_unrelated_files_get_no_delta(tmp_path):
+    rng = random.Random(1)
+    (tmp_path / 'base').write_bytes(rng.randbytes(256 * 1024))
+    (tmp_path / 'target').write_bytes(rng.randbytes(256 * 1024))
+    assert make_delta(str(tmp_path / 'base'), str(tmp_path / 'target'), str(tmp_path / 'delta')) is None
+    assert not (tmp_path / 'delta').exists()
+    assert not (tmp_path / 'delta.tmp').exists()
+
+
+def test_delta_for_another_base_is_rejected(tmp_path):
+    base = random.Random(2).randbytes(128 * 1024)
+    (tmp_path / 'base').write_bytes(base)
+    (tmp_path / 'target').write_bytes(base + b'tail')
+    make_delta(str(tmp_path / 'base'), str(tmp_path / 'target'), str(tmp_path / 'delta'))
+    (tmp_path / 'other').write_bytes(base[:-1])
+    with pytest.raises(DeltaError):
+        apply_delta(str(tmp_path / 'other'), str(tmp_path / 'delta'), io.BytesIO())
+
+    (tmp_path / 'broken').write_bytes(DELTA_MAGIC[:3])
+    with pytest.raises(DeltaError):
+        apply_delta(str(tmp_path / 'base'), str(tmp_path / 'broken'), io.BytesIO())
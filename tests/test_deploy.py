@@ -0,0 +1,33 @@
+# test_deploy.py
+import os
+import threading
+
+from conftest import wait_for
+
+
+def test_history_recorded_when_client_drops_during_deploy(start_server, fake_agent):
+    server = start_server(deploy_timeout=5.0)
+    with open(os.path.join('drivers', 'net_linux.run'), 'wb') as f:
+        f.write(os.urandom(64 * 1024))
+    server.catalog.refresh()
+    agent = fake_agent(server.port, 'pc-gone')
+    assert agent.registration['status'] == 'registered'
+    client_socket = server.get_client_socket(agent.registration['client_id'])
+
+    # Агент пропадает, едва получив команду установки
+    def drop():
+        frame = agent.connection.recv_frame(timeout=5.0)
+        assert frame.json()['action'] == 'install_driver'
+        agent.sock.close()
+
+    dropper = threading.Thread(target=drop)
+    dropper.start()
+    result = server.deploy_to_client(client_socket, 'net_linux.run')
+    dropper.join()
+
+    assert result['status'] == 'error'
+    entries = wait_for(lambda: server.get_history(driver_name='net_linux.run'))
+    assert [(entry.client_name, entry.status) for entry in entries] == [('pc-gone', 'error')]
+    # Повторная попытка по закрытому сокету тоже не роняет вызывающего
+    assert wait_for(lambda: server.get_connected_clients_count() == 0)
+    assert server.deploy_to_client(client_socket, 'net_linux.run')['status'] == 'error'
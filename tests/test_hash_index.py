@@ -0,0 +1,117 @@
+# test_hash_index.py
+import hashlib
+import os
+
+import pytest
+
+import hash_index
+from hash_index import ChunkMismatch, ChunkVerifier, DriverHashIndex
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture
+def hashed(monkeypatch):
+    """Пути файлов, которые индекс прочитал целиком"""
+    calls = []
+    real = hash_index.hash_file_chunks
+
+    def counting(file_path, *args, **kwargs):
+        calls.append(os.path.basename(file_path))
+        return real(file_path, *args, **kwargs)
+
+    monkeypatch.setattr(hash_index, 'hash_file_chunks', counting)
+    return calls
+
+
+def _write(path, data, mtime_ns=None):
+    with open(path, 'wb') as f:
+        f.write(data)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+    return str(path)
+
+
+def test_chunk_hashes_match_sha256(tmp_path):
+    data = os.urandom(3 * CHUNK + 123)
+    path = _write(tmp_path / 'net.inf', data)
+    index = DriverHashIndex(str(tmp_path), chunk_size=CHUNK)
+
+    assert index.get_hash(path) == hashlib.sha256(data).hexdigest()
+    assert index.get_chunk_hashes(path) == [hashlib.sha256(data[i:i + CHUNK]).hexdigest()
+                                            for i in range(0, len(data), CHUNK)]
+
+
+def test_unchanged_file_is_hashed_once(tmp_path, hashed):
+    path = _write(tmp_path / 'net.inf', os.urandom(CHUNK))
+    index = DriverHashIndex(str(tmp_path), chunk_size=CHUNK)
+    digest = index.get_hash(path)
+    assert index.get_hash(path) == digest
+    assert index.get_chunk_hashes(path)
+    assert hashed == ['net.inf']
+
+
+def test_changed_size_mtime_or_inode_triggers_rehash(tmp_path, hashed):
+    first = os.urandom(CHUNK)
+    path = _write(tmp_path / 'net.inf', first, mtime_ns=1_600_000_000_000_000_000)
+    index = DriverHashIndex(str(tmp_path), chunk_size=CHUNK)
+    index.get_hash(path)
+
+    # Размер
+    grown = first + b'tail'
+    _write(path, grown, mtime_ns=1_600_000_000_000_000_000)
+    assert index.lookup(path) is None
+    assert index.get_hash(path) == hashlib.sha256(grown).hexdigest()
+
+    # Только mtime: тот же размер, другое содержимое
+    edited = os.urandom(len(grown))
+    _write(path, edited, mtime_ns=1_700_000_000_000_000_000)
+    assert index.lookup(path) is None
+    assert index.get_hash(path) == hashlib.sha256(edited).hexdigest()
+
+    # Только inode: файл заменен другим с тем же размером и mtime
+    replaced = os.urandom(len(grown))
+    _write(tmp_path / 'new.tmp', replaced, mtime_ns=1_700_000_000_000_000_000)
+    os.replace(tmp_path / 'new.tmp', path)
+    assert index.lookup(path) is None
+    assert index.get_hash(path) == hashlib.sha256(replaced).hexdigest()
+
+    assert hashed == ['net.inf'] * 4
+
+
+def test_index_survives_restart(tmp_path, hashed):
+    data = os.urandom(2 * CHUNK)
+    path = _write(tmp_path / 'net.inf', data)
+    digest = DriverHashIndex(str(tmp_path), chunk_size=CHUNK).get_hash(path)
+
+    reopened = DriverHashIndex(str(tmp_path), chunk_size=CHUNK)
+    assert reopened.lookup(path) == digest
+    assert reopened.find(digest) == path
+    assert reopened.get_chunk_hashes(path) == [hashlib.sha256(data[:CHUNK]).hexdigest(),
+                                               hashlib.sha256(data[CHUNK:]).hexdigest()]
+    assert hashed == ['net.inf']
+
+    # Другой размер блока — старые хеши блоков не годятся
+    assert DriverHashIndex(str(tmp_path), chunk_size=CHUNK * 2).lookup(path) is None
+
+
+def test_prune_forgets_deleted_files(tmp_path):
+    path = _write(tmp_path / 'net.inf', b'driver')
+    index = DriverHashIndex(str(tmp_path), chunk_size=CHUNK)
+    digest = index.get_hash(path)
+    os.remove(path)
+    assert index.prune() == 1
+    assert index.find(digest) is None
+    assert DriverHashIndex(str(tmp_path), chunk_size=CHUNK).digests() == []
+
+
+def test_verifier_rejects_a_corrupted_chunk():
+    data = os.urandom(2 * CHUNK + 10)
+    hashes = [hashlib.sha256(data[i:i + CHUNK]).hexdigest() for i in range(0, len(data), CHUNK)]
+    verifier = ChunkVerifier('sha256', CHUNK, hashes)
+    verifier.update(data[:CHUNK])
+    assert verifier.verified_bytes == CHUNK
+    with pytest.raises(ChunkMismatch) as error:
+        verifier.update(b'\0' + data[CHUNK + 1:2 * CHUNK])
+    assert error.value.index == 1
+    assert verifier.verified_bytes == CHUNK
@@ -0,0 +1,47 @@
+# test_heartbeat.py
+import os
+import threading
+import time
+
+import pytest
+
+from benchmark import SimulatedAgent
+from conftest import wait_for
+
+RATE = 256 * 1024
+
+
+class HeartbeatAgent(SimulatedAgent):
+    """Агент стенда с частым heartbeat"""
+
+    def load_config(self):
+        config = super().load_config()
+        config.update(heartbeat_interval=0.5, delta_updates=False, compression=False)
+        return config
+
+
+@pytest.mark.parametrize('mode', ['threaded', 'asyncio'])
+def test_throttled_transfer_outlives_heartbeat_timeout(start_server, workdir, mode):
+    server = start_server(mode, heartbeat_timeout=1.5, bandwidth_client_limit=RATE, compression=False)
+    size = 4 * RATE
+    with open(os.path.join('drivers', 'big_linux.run'), 'wb') as f:
+        f.write(os.urandom(size))
+    server.catalog.refresh()
+    agent = HeartbeatAgent('slow-link', '127.0.0.1', server.port, str(workdir / 'agent'))
+    threading.Thread(target=agent.start, daemon=True).start()
+    assert wait_for(lambda: server.get_connected_clients_info().get('client_1', {}).get('client_name'))
+
+    client_id = 'client_1'
+    evicted = []
+    evict = server.sweeper.on_expired
+    server.sweeper.on_expired = lambda key: evicted.append(key) or evict(key)
+    started = time.monotonic()
+    result = server.deploy_to_client(server.get_client_socket(client_id), 'big_linux.run')
+    elapsed = time.monotonic() - started
+
+    # Передача заметно дольше срока heartbeat (1.5 с), а агента не выселили
+    assert result['status'] == 'success', result
+    assert result['transfer']['bytes'] == size
+    assert elapsed > 2 * 1.5
+    assert evicted == []
+    assert server.get_connected_clients_count() == 1
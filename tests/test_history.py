@@ -0,0 +1,17 @@
+# test_history.py
+from history import DeploymentHistory, OTHER_STATUS, STATUS_CODES
+
+
+def test_agent_statuses_are_mapped(tmp_path):
+    history = DeploymentHistory(str(tmp_path / 'history.db'))
+    history.record('pc-1', 'net.inf', {'status': 'failed', 'message': 'Установщик вернул 1'})
+    history.record('pc-2', 'net.inf', {'status': 'error', 'message': 'Таймаут'})
+    history.record('pc-3', 'net.inf', {'status': 'success'})
+    history.record('pc-4', 'net.inf', {'status': 'weird'})
+
+    assert STATUS_CODES['failed'] != OTHER_STATUS
+    assert [entry.client_name for entry in history.query(status='failed')] == ['pc-1']
+    assert history.failed_clients('net.inf') == ['pc-1', 'pc-2']
+    assert history.counts() == {'failed': 1, 'error': 1, 'success': 1, 'other': 1}
+    assert set(history.last_success()) == {'pc-3'}
+    history.close()
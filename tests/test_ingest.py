@@ -0,0 +1,68 @@
+# test_ingest.py
+import os
+
+import pytest
+
+from driver_catalog import DriverCatalog
+from hash_index import DriverHashIndex
+from ingest import DriverIngest
+
+
+@pytest.fixture
+def store(tmp_path):
+    drivers_dir = tmp_path / 'drivers'
+    drivers_dir.mkdir()
+    hash_index = DriverHashIndex(str(drivers_dir))
+    catalog = DriverCatalog(str(drivers_dir), hash_index)
+    catalog.refresh()
+    return catalog, hash_index
+
+
+def write(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return str(path)
+
+
+@pytest.mark.parametrize('hardlinks', [False, True])
+def test_same_name_in_batch_keeps_last(tmp_path, store, hardlinks):
+    catalog, hash_index = store
+    first = write(tmp_path / 'a' / 'x.sys', b'A' * 100000)
+    second = write(tmp_path / 'b' / 'x.sys', b'B' * 100000)
+
+    results = DriverIngest(catalog, hash_index, hardlinks=hardlinks).ingest([first, second])
+
+    assert [result['status'] for result in results] == ['superseded', 'added']
+    assert results[0]['superseded_by'] == second
+    target = os.path.join(catalog.drivers_dir, 'x.sys')
+    with open(target, 'rb') as f:
+        assert f.read() == b'B' * 100000
+    assert hash_index.get_hash(target) == results[1]['hash']
+    assert catalog.get_by_name('x.sys') is not None
+    assert os.listdir(os.path.join(catalog.drivers_dir, '.ingest')) == []
+
+
+def test_duplicates_are_not_stored(tmp_path, store):
+    catalog, hash_index = store
+    ingest = DriverIngest(catalog, hash_index)
+    data = os.urandom(50000)
+    paths = [write(tmp_path / 'net.inf', data), write(tmp_path / 'net_copy.inf', data)]
+
+    results = ingest.ingest(paths)
+    assert [result['status'] for result in results] == ['added', 'duplicate']
+    assert results[1]['duplicate_of'] == 'net.inf'
+    # Повторная загрузка того же файла ничего не меняет
+    assert ingest.ingest(paths[:1])[0]['status'] == 'unchanged'
+    assert sorted(driver['name'] for driver in catalog.list()) == ['net.inf']
+
+
+def test_source_edits_do_not_reach_the_store(tmp_path, store):
+    catalog, hash_index = store
+    source = write(tmp_path / 'gpu.run', b'v1' * 1000)
+    [result] = DriverIngest(catalog, hash_index).ingest([source])
+    assert result['method'] in ('copy', 'reflink')
+
+    with open(source, 'r+b') as f:
+        f.write(b'v2')
+    with open(os.path.join(catalog.drivers_dir, 'gpu.run'), 'rb') as f:
+        assert f.read(2) == b'v1'
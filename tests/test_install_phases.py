@@ -0,0 +1,41 @@
+# test_install_phases.py
+import os
+import threading
+from itertools import groupby
+
+import pytest
+
+from benchmark import SimulatedAgent
+from conftest import wait_for
+
+
+@pytest.mark.parametrize('mode', ['threaded', 'asyncio'])
+def test_server_receives_the_full_phase_timeline(start_server, workdir, mode):
+    server = start_server(mode, compression=False)
+    with open(os.path.join('drivers', 'audio_linux.run'), 'wb') as f:
+        f.write(os.urandom(512 * 1024))
+    server.catalog.refresh()
+    agent = SimulatedAgent('pc-phases', '127.0.0.1', server.port, str(workdir / 'agent'))
+    threading.Thread(target=agent.start, daemon=True).start()
+    assert wait_for(lambda: server.get_connected_clients_info().get('client_1', {}).get('client_name'))
+
+    phases = []
+    set_phase = server.set_install_phase
+
+    def record(client_id, driver_name, phase):
+        phases.append(phase)
+        set_phase(client_id, driver_name, phase)
+
+    server.set_install_phase = record
+    client_socket = server.get_client_socket('client_1')
+
+    assert server.deploy_to_client(client_socket, 'audio_linux.run')['status'] == 'success'
+    # Сервер сам отмечает downloading при отправке команды, агент подтверждает ее перед загрузкой
+    assert [phase for phase, _ in groupby(phases)] == ['downloading', 'queued', 'installing', 'done', None]
+    assert phases.count('downloading') == 2
+
+    # Пакет из кеша агента не загружается
+    phases.clear()
+    assert server.deploy_to_client(client_socket, 'audio_linux.run')['transfer']['method'] == 'cached'
+    assert phases == ['downloading', 'queued', 'installing', 'done', None]
+    assert server.get_install_phases() == {}
@@ -0,0 +1,105 @@
+# test_job_queue.py
+import os
+import threading
+import time
+
+from conftest import wait_for
+from job_queue import (DeploymentQueue, JobDispatcher, FAILED, QUEUED, RUNNING, SUCCEEDED)
+
+
+def test_claim_retry_cycle(tmp_path):
+    queue = DeploymentQueue(str(tmp_path / 'jobs.db'), max_attempts=2, retry_delay=0.0)
+    ids = queue.enqueue(['pc-1', 'pc-2'], 'net.inf')
+    # Повторная постановка возвращает задание, которое уже ждет
+    assert queue.enqueue(['pc-1'], 'net.inf') == {'pc-1': ids['pc-1']}
+
+    jobs = queue.claim({'pc-1'}, 10)
+    assert [(job.client_name, job.state, job.attempts) for job in jobs] == [('pc-1', RUNNING, 1)]
+    assert queue.claim({'pc-1'}, 10) == []
+
+    assert queue.retry(ids['pc-1'], 'Таймаут') is not None
+    assert queue.get(ids['pc-1']).state == QUEUED
+    [job] = queue.claim({'pc-1'}, 10)
+    assert job.attempts == 2
+    # Попытки кончились — задание завершается ошибкой
+    assert queue.retry(job.id, 'Таймаут') is None
+    assert queue.get(job.id).state == FAILED
+
+    # Отключение клиента не тратит попытку
+    [job] = queue.claim({'pc-2'}, 10)
+    queue.retry(job.id, 'Клиент отключен', count_attempt=False)
+    assert queue.get(job.id).attempts == 0
+    [job] = queue.claim({'pc-2'}, 10)
+    queue.finish(job.id, SUCCEEDED, {'status': 'success'})
+    assert queue.counts() == {FAILED: 1, SUCCEEDED: 1}
+    queue.close()
+
+
+def test_offline_jobs_are_not_claimed_or_due(tmp_path):
+    queue = DeploymentQueue(str(tmp_path / 'jobs.db'))
+    queue.enqueue([f'offline-{i}' for i in range(500)], 'net.inf')
+    queue.enqueue(['pc-1'], 'net.inf', priority='low')
+    queue.enqueue(['pc-1'], 'gpu.inf', priority='urgent')
+
+    assert [job.driver_name for job in queue.claim({'pc-1', 'pc-9'}, 10)] == ['gpu.inf', 'net.inf']
+    assert queue.next_due({'pc-1'}) is None
+    assert queue.next_due(set()) is None
+    assert queue.next_due() is not None
+    queue.close()
+
+
+def test_dispatcher_idles_with_offline_jobs(tmp_path):
+    queue = DeploymentQueue(str(tmp_path / 'jobs.db'))
+    queue.enqueue([f'offline-{i}' for i in range(2000)], 'net.inf')
+    online = set()
+    done = threading.Event()
+
+    def run_job(job):
+        done.set()
+        return {'status': 'success'}
+
+    dispatcher = JobDispatcher(queue, run_job, lambda: set(online), max_workers=4)
+    claims = []
+    claim = queue.claim
+    queue.claim = lambda *args, **kwargs: claims.append(1) or claim(*args, **kwargs)
+    dispatcher.start()
+    try:
+        time.sleep(0.5)
+        # Просроченные задания отключенных клиентов не будят диспетчер
+        assert len(claims) <= 2
+        online.add('offline-7')
+        dispatcher.wake()
+        assert done.wait(5.0)
+    finally:
+        dispatcher.stop()
+    queue.close()
+
+
+def test_queue_and_mass_deploy_share_the_parallel_limit(start_server, fake_agent):
+    server = start_server(max_parallel_deploys=2)
+    with open(os.path.join('drivers', 'net_linux.run'), 'wb') as f:
+        f.write(b'driver')
+    server.catalog.refresh()
+    for i in range(4):
+        fake_agent(server.port, f'pc-{i}')
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_deploy(*args):
+        with lock:
+            running.append(1)
+            peak.append(len(running))
+        time.sleep(0.2)
+        with lock:
+            running.pop()
+        return {'status': 'success'}
+
+    server._deploy_one = slow_deploy
+    server.enqueue_deployment('net_linux.run')
+    results = server.mass_deploy('net_linux.run')
+
+    assert [result['status'] for result in results.values()] == ['success'] * 4
+    assert wait_for(lambda: len(server.get_jobs(SUCCEEDED)) == 4)
+    assert len(peak) == 8
+    assert max(peak) == 2
@@ -0,0 +1,107 @@
+# test_protocol.py
+import socket
+
+import pytest
+
+from protocol import (FramedConnection, HEADER_SIZE, MAX_JSON_PAYLOAD, MSG_BINARY, MSG_JSON,
+                      ProtocolError, classify_greeting, detect_framed, frame_ack, pack_header,
+                      unpack_header)
+
+
+@pytest.fixture
+def pair():
+    left, right = socket.socketpair()
+    yield FramedConnection(left), FramedConnection(right)
+    left.close()
+    right.close()
+
+
+def test_header_round_trip():
+    header = unpack_header(pack_header(MSG_BINARY, 1234, request_id=7, flags=3))
+    assert (header.msg_type, header.length, header.request_id, header.flags) == (MSG_BINARY, 1234, 7, 3)
+
+
+@pytest.mark.parametrize('data', [
+    b'XX' + pack_header(MSG_JSON, 0)[2:],
+    pack_header(MSG_JSON, 0, version=99),
+    pack_header(9, 0),
+    pack_header(MSG_JSON, MAX_JSON_PAYLOAD + 1),
+])
+def test_bad_headers_are_rejected(data):
+    assert len(data) == HEADER_SIZE
+    with pytest.raises(ProtocolError):
+        unpack_header(data)
+
+
+def test_frames_keep_boundaries_and_request_ids(pair, tmp_path):
+    sender, receiver = pair
+    body = tmp_path / 'driver.bin'
+    body.write_bytes(b'{"not": "json"}' * 100)
+    sender.send_json({'action': 'heartbeat'}, request_id=5)
+    sender.send_file(str(body), request_id=6)
+    sender.send_ack(request_id=5, status='ok')
+
+    first = receiver.recv_frame(timeout=5)
+    assert (first.msg_type, first.request_id, first.json()) == (MSG_JSON, 5, {'action': 'heartbeat'})
+    second = receiver.recv_frame(timeout=5)
+    assert (second.msg_type, second.request_id) == (MSG_BINARY, 6)
+    assert bytes(second.payload) == body.read_bytes()
+    assert frame_ack(receiver.recv_frame(timeout=5)) == {'action': 'ack', 'status': 'ok'}
+
+
+def test_reader_gets_frames_nobody_waits_for(pair):
+    sender, receiver = pair
+    receiver.reader_active = True
+    with receiver.open_request() as channel:
+        sender.send_json({'status': 'ok'}, request_id=channel.request_id)
+        sender.send_json({'action': 'heartbeat'}, request_id=channel.request_id + 1)
+        assert receiver.read_next(timeout=5) is None
+        assert channel.recv_json(timeout=5) == {'status': 'ok'}
+        assert receiver.read_next(timeout=5).json() == {'action': 'heartbeat'}
+
+
+def test_posted_reply_waits_for_the_frame_being_written(pair):
+    sender, receiver = pair
+    with sender._sending():
+        sender.post_json({'action': 'heartbeat_ack'}, request_id=2)
+        assert not receiver.wait_readable(0.1)
+    assert receiver.recv_json(timeout=5) == {'action': 'heartbeat_ack'}
+
+
+@pytest.mark.parametrize('peeked, expected', [
+    (b'DD', True),
+    (b'D', None),
+    (b'{"', False),
+    (b'AC', False),
+])
+def test_classify_greeting(peeked, expected):
+    assert classify_greeting(peeked) is expected
+
+
+def test_legacy_greeting_stays_in_the_socket():
+    left, right = socket.socketpair()
+    try:
+        left.sendall(b'{"action": "register", "client_name": "pc-1"}')
+        assert detect_framed(right, timeout=5) is False
+        legacy = FramedConnection(right, legacy=True)
+        assert legacy.recv_json(timeout=5) == {'action': 'register', 'client_name': 'pc-1'}
+    finally:
+        left.close()
+        right.close()
+
+
+def test_framed_greeting_is_detected(pair):
+    sender, receiver = pair
+    sender.send_json({'action': 'register'})
+    assert detect_framed(receiver.sock, timeout=5) is True
+    assert receiver.recv_json(timeout=5) == {'action': 'register'}
+
+
+def test_closed_before_greeting():
+    left, right = socket.socketpair()
+    left.close()
+    try:
+        with pytest.raises(ConnectionError):
+            detect_framed(right, timeout=5)
+    finally:
+        right.close()
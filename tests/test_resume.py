@@ -0,0 +1,107 @@
+# test_resume.py
+import os
+import socket
+import threading
+
+import pytest
+
+from benchmark import SimulatedAgent
+from hash_index import hash_file_chunks
+from protocol import FramedConnection, MSG_BINARY, pack_header
+
+CHUNK = 64 * 1024
+SIZE = 5 * CHUNK + 1000
+REQUEST_ID = 7
+
+
+@pytest.fixture
+def package(tmp_path):
+    payload = os.urandom(SIZE)
+    path = tmp_path / 'storage_linux.run'
+    path.write_bytes(payload)
+    digest, chunk_hashes = hash_file_chunks(str(path), 'sha256', CHUNK)
+    file_info = {'name': path.name, 'size': SIZE, 'hash': digest, 'hash_algorithm': 'sha256',
+                 'chunk_size': CHUNK, 'chunk_hashes': chunk_hashes}
+    return payload, file_info
+
+
+@pytest.fixture
+def agent(tmp_path):
+    agent = SimulatedAgent('pc-resume', '127.0.0.1', 1, str(tmp_path / 'agent'))
+    yield agent
+    agent.installer.shutdown(wait=False)
+
+
+def deploy(agent, file_info, body, cut_at=None):
+    """Проводит одну установку от имени сервера: body(offset) — байты тела, cut_at — оборвать после"""
+    server_sock, agent_sock = socket.socketpair()
+    server = FramedConnection(server_sock)
+    channel = FramedConnection(agent_sock).attach(REQUEST_ID, stream=True)
+    result = {}
+    receiver = threading.Thread(target=lambda: result.update(
+        agent.receive_and_install_driver(channel, file_info['name'])))
+    receiver.start()
+    try:
+        server.send_json(file_info, REQUEST_ID)
+        offset = server.recv_ack(timeout=5.0)['offset']
+        data = body(offset)
+        server_sock.sendall(pack_header(MSG_BINARY, SIZE - offset, REQUEST_ID))
+        server_sock.sendall(data[:cut_at] if cut_at is not None else data)
+        if cut_at is not None:
+            server_sock.shutdown(socket.SHUT_RDWR)
+        receiver.join(10)
+        assert not receiver.is_alive()
+        return offset, result
+    finally:
+        server_sock.close()
+        agent_sock.close()
+
+
+def test_cut_transfer_resumes_from_last_verified_chunk(agent, package):
+    payload, file_info = package
+    offset, result = deploy(agent, file_info, lambda offset: payload[offset:], cut_at=2 * CHUNK + CHUNK // 2)
+    assert offset == 0
+    assert result['status'] == 'error'
+    partial = agent.cache.partial_path(file_info['hash'])
+    assert os.path.getsize(partial) == 2 * CHUNK + CHUNK // 2
+
+    offset, result = deploy(agent, file_info, lambda offset: payload[offset:])
+    assert offset == 2 * CHUNK
+    assert result['status'] == 'success', result
+    with open(agent.cache.path_for(file_info['hash']), 'rb') as f:
+        assert f.read() == payload
+    assert not os.path.exists(partial)
+
+
+def test_corrupted_chunk_is_fetched_again(agent, package):
+    payload, file_info = package
+    corrupted = bytearray(payload)
+    corrupted[2 * CHUNK + 100] ^= 0xFF
+
+    offset, result = deploy(agent, file_info, lambda offset: bytes(corrupted[offset:]))
+    assert offset == 0
+    assert result['status'] == 'error'
+    assert agent.cache.path_for(file_info['hash']) is None
+    # Поврежденный блок отрезан, подтвержденные остались
+    assert os.path.getsize(agent.cache.partial_path(file_info['hash'])) == 2 * CHUNK
+
+    offset, result = deploy(agent, file_info, lambda offset: payload[offset:])
+    assert offset == 2 * CHUNK
+    assert result['status'] == 'success', result
+    with open(agent.cache.path_for(file_info['hash']), 'rb') as f:
+        assert f.read() == payload
+
+
+def test_corrupted_partial_on_disk_is_not_trusted(agent, package):
+    payload, file_info = package
+    deploy(agent, file_info, lambda offset: payload[offset:], cut_at=4 * CHUNK)
+    partial = agent.cache.partial_path(file_info['hash'])
+    with open(partial, 'r+b') as f:
+        f.seek(CHUNK + 5)
+        f.write(b'\0\0\0')
+
+    offset, result = deploy(agent, file_info, lambda offset: payload[offset:])
+    assert offset == CHUNK
+    assert result['status'] == 'success', result
+    with open(agent.cache.path_for(file_info['hash']), 'rb') as f:
+        assert f.read() == payload
@@ -0,0 +1,58 @@
+# test_swarm.py
+import hashlib
+import os
+import time
+
+from agent_cache import DriverCache
+from swarm import PeerServer, SwarmTracker, check_peer_token, fetch_from_peers, peer_token
+
+CHUNK = 4096
+
+
+def test_peer_token_is_bound_to_package_host_and_time():
+    secret = os.urandom(32).hex()
+    expires = int(time.time()) + 60
+    token = peer_token(secret, 'abc', '10.0.0.5', expires)
+
+    assert check_peer_token(secret, token, 'abc', '10.0.0.5')
+    assert not check_peer_token(secret, token, 'abd', '10.0.0.5')
+    assert not check_peer_token(secret, token, 'abc', '10.0.0.6')
+    assert not check_peer_token(os.urandom(32).hex(), token, 'abc', '10.0.0.5')
+    assert not check_peer_token(secret, token, 'abc', '10.0.0.5', now=expires + 1)
+    assert not check_peer_token(None, token, 'abc', '10.0.0.5')
+    assert not check_peer_token(secret, None, 'abc', '10.0.0.5')
+
+
+def test_peer_serves_only_agents_sent_by_the_server(tmp_path):
+    data = os.urandom(5 * CHUNK + 100)
+    digest = hashlib.sha256(data).hexdigest()
+    chunk_hashes = [hashlib.sha256(data[i:i + CHUNK]).hexdigest() for i in range(0, len(data), CHUNK)]
+    source = tmp_path / 'package.bin'
+    source.write_bytes(data)
+    cache = DriverCache(str(tmp_path / 'seed'))
+    cache.put(digest, str(source), 'package.run')
+
+    peer = PeerServer(cache)
+    port = peer.start('127.0.0.1')
+    tracker = SwarmTracker(subnet_prefix=0)
+    try:
+        peer.secret = tracker.register_peer('seed', '127.0.0.1', port, [digest])
+
+        def fetch(peers, name):
+            path = str(tmp_path / name)
+            return fetch_from_peers(peers, digest, path, len(data), 'sha256', CHUNK, chunk_hashes), path
+
+        received, _ = fetch([['127.0.0.1', port]], 'no_token.part')
+        assert received == 0
+        received, _ = fetch([['127.0.0.1', port, peer_token(os.urandom(32).hex(), digest, '127.0.0.1',
+                                                             int(time.time()) + 60)]], 'forged.part')
+        assert received == 0
+
+        peers = tracker.peers_for(digest, 'receiver', '127.0.0.1')
+        assert [peer[:2] for peer in peers] == [['127.0.0.1', port]]
+        received, path = fetch(peers, 'granted.part')
+        assert received == len(data)
+        with open(path, 'rb') as f:
+            assert f.read() == data
+    finally:
+        peer.stop()